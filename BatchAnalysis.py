@@ -0,0 +1,239 @@
+'''
+Batch analysis: search every position of a file on all the cores and write one JSON line per position, in the
+order of the file, with the best move, its SAN, the score (in pawns, for the side to move), the depth reached,
+the principal variation and the nodes searched.
+The input is a FEN or EPD file, one position per line (the EPD operations, e.g. id and bm, are copied to the
+result), or a PGN file, whose games give every position of their main line with the game number, the ply and the
+move played there. It is read as the analysis goes, and no more than TASKS_PER_PROCESS positions per process are
+waiting at any time, so memory stays the same however big the file is.
+Every line is flushed as it is written, so the output file is the checkpoint: with --resume the positions it
+already has are skipped and the analysis goes on from there.
+    python BatchAnalysis.py positions.epd --depth 5 --output analysis.jsonl
+    python BatchAnalysis.py games.pgn --time 500 --output analysis.jsonl --resume
+'''
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+import ChessEngine
+import Pgn
+import SmartMoveFinder
+import Tablebase
+from SmartMoveFinder import CHECKMATE, MAX_DEPTH
+
+TASKS_PER_PROCESS = 4  # positions handed out ahead to every process, so none of them waits for work
+PROGRESS_INTERVAL = 100  # positions between two progress lines on stderr
+
+workerSearcher = None  # the SmartMoveFinder.Searcher of a worker process
+workerBackend = "mailbox"
+
+'''
+The position of a FEN or EPD line and its EPD operations as a dict (opcode: operand, the operands of bm and am
+being lists of moves). Lines with 6 fields and the move clocks are taken as FEN.
+'''
+
+
+def parseEpd(line):
+    fields = line.split()
+    if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+        return " ".join(fields[:6]), {}
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("position needs at least 4 fields: " + line)
+    operations = {}
+    if len(fields) == 5:
+        for operation in fields[4].split(";"):
+            opcode, separator, operand = operation.strip().partition(" ")
+            if not opcode:
+                continue
+            operand = operand.strip()
+            if opcode in ("bm", "am"):
+                operations[opcode] = operand.split()
+            else:
+                operations[opcode] = operand.strip('"')
+    return " ".join(fields[:4]) + " 0 1", operations
+
+
+'''
+The positions of an open input file, "fen" or "pgn", as dicts of the fields of their result line: "fen" and, from
+EPD, "epd" (the operations); from PGN, "game", "ply" and "played" (the SAN of the move played, None after the
+last one). A PGN game is followed until its first move that can't be played.
+'''
+
+
+def readPositions(inputFile, inputFormat):
+    if inputFormat == "pgn":
+        for gameNumber, (headers, sanMoves, result) in enumerate(Pgn.readGames(inputFile), 1):
+            try:
+                gs = ChessEngine.GameState.fromFen(headers.get("FEN", ChessEngine.START_FEN))
+            except ValueError:
+                continue
+            for ply in range(len(sanMoves) + 1):
+                move = None
+                if ply < len(sanMoves):
+                    try:
+                        move = Pgn.sanToMove(gs, sanMoves[ply])
+                    except ValueError:
+                        pass
+                yield {"fen": gs.toFen(), "game": gameNumber, "ply": ply, "played": sanMoves[ply] if move else None}
+                if move is None:
+                    break
+                gs.makeMove(move)
+        return
+    for line in inputFile:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            fen, operations = parseEpd(line)
+        except ValueError:
+            fen, operations = line, {}  # the worker reports the error with the position's line
+        position = {"fen": fen}
+        if operations:
+            position["epd"] = operations
+        yield position
+
+
+'''
+Run in every worker process: a searcher kept for all the positions the process analyses
+'''
+
+
+def startWorker(backend):
+    global workerSearcher, workerBackend
+    workerSearcher = SmartMoveFinder.Searcher(tablebases=Tablebase.loadTablebases())
+    workerBackend = backend
+
+
+'''
+Run in a worker: search one position. Returns its result line as a dict, with "error" instead of a move if the
+position is not valid or its search failed, so one bad position doesn't stop the analysis of the others.
+Every position is searched with empty tables, so its result doesn't depend on which process searched it nor on
+the positions searched before.
+'''
+
+
+def analysePosition(task):
+    index, position, timeLimit, nodeLimit, maxDepth = task
+    result = {"index": index}
+    result.update(position)
+    try:
+        gs = ChessEngine.newGameState(workerBackend, position["fen"])
+        startTime = time.perf_counter()
+        validMoves = gs.getValidMoves()
+        if not validMoves:
+            result.update({"move": None, "san": None, "score": -CHECKMATE if gs.checkMate else 0, "depth": 0,
+                           "pv": [], "nodes": 0, "seconds": 0.0})
+            return result
+        workerSearcher.newGame()
+        workerSearcher.iterativeDeepening(gs, validMoves, timeLimit, nodeLimit, maxDepth)
+        move = workerSearcher.bestMove
+        result.update({"move": move.getChessNotation(), "san": Pgn.moveToSan(gs, move, validMoves),
+                       "score": workerSearcher.score, "depth": workerSearcher.depth,
+                       "pv": [pvMove.getChessNotation() for pvMove in workerSearcher.pv],
+                       "nodes": workerSearcher.nodes, "seconds": time.perf_counter() - startTime})
+    except Exception as error:
+        result["error"] = str(error) or type(error).__name__
+    return result
+
+
+'''
+The index of the position to go on with when resuming the output file of an earlier run, the one after its last
+result, None if it has no result yet. A last line cut short when that run was stopped is removed.
+'''
+
+
+def resumeIndex(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb+") as outputFile:
+        data = outputFile.read()
+        end = data.rfind(b"\n") + 1
+        if end < len(data):
+            outputFile.truncate(end)
+    if end == 0:
+        return None
+    return json.loads(data[data.rfind(b"\n", 0, end - 1) + 1:end])["index"] + 1
+
+
+'''
+Analyse the positions (an iterable of readPositions dicts) and write the result lines to outputFile in their
+order, the first one numbered start. Returns the number of positions analysed.
+'''
+
+
+def runAnalysis(positions, outputFile, processes, timeLimit=None, nodeLimit=None, maxDepth=MAX_DEPTH,
+                backend="mailbox", start=0):
+    pool = multiprocessing.Pool(processes, initializer=startWorker, initargs=(backend,))
+    pending = collections.deque()  # results not written yet, in input order
+    analysed = 0
+    startTime = time.time()
+
+    def writeResult():
+        nonlocal analysed
+        outputFile.write(json.dumps(pending.popleft().get()) + "\n")
+        outputFile.flush()
+        analysed += 1
+        if analysed % PROGRESS_INTERVAL == 0:
+            print(str(start + analysed) + " positions, " + format(analysed / (time.time() - startTime), ".1f") +
+                  " per second", file=sys.stderr)
+
+    try:
+        for index, position in enumerate(positions, start):
+            pending.append(pool.apply_async(analysePosition, ((index, position, timeLimit, nodeLimit, maxDepth),)))
+            while len(pending) >= processes * TASKS_PER_PROCESS or (pending and pending[0].ready()):
+                writeResult()
+        while pending:
+            writeResult()
+    finally:
+        pool.terminate()
+        pool.join()
+    return analysed
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Analyse every position of a FEN, EPD or PGN file")
+    parser.add_argument("input", help="FEN/EPD file (one position per line) or PGN file")
+    parser.add_argument("--format", choices=("fen", "pgn"), help="input format (default: pgn for a .pgn file)")
+    parser.add_argument("--output", help="JSON lines file to write (default: stdout)")
+    parser.add_argument("--resume", action="store_true", help="go on with the positions the output file lacks")
+    parser.add_argument("--start", type=int, default=0, help="skip this many positions of the input (default: 0)")
+    parser.add_argument("--depth", type=int, help="search depth of every position")
+    parser.add_argument("--time", type=int, help="milliseconds to search every position")
+    parser.add_argument("--nodes", type=int, help="nodes to search every position")
+    parser.add_argument("--backend", choices=("mailbox", "bitboard"), default="mailbox",
+                        help="move generator (default: mailbox)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="positions searched at once (default: number of cores)")
+    args = parser.parse_args(args)
+    if args.depth is None and args.time is None and args.nodes is None:
+        parser.error("give --depth, --time or --nodes")
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+    inputFormat = args.format or ("pgn" if args.input.lower().endswith(".pgn") else "fen")
+    start = max(0, args.start)
+    if args.resume:
+        index = resumeIndex(args.output)
+        if index is not None:
+            start = index
+
+    with open(args.input, errors="replace") as inputFile:
+        positions = itertools.islice(readPositions(inputFile, inputFormat), start, None)
+        outputFile = open(args.output, "a") if args.output else sys.stdout
+        try:
+            analysed = runAnalysis(positions, outputFile, max(1, args.processes), args.time, args.nodes,
+                                   max(1, args.depth) if args.depth else MAX_DEPTH, args.backend, start)
+        finally:
+            if outputFile is not sys.stdout:
+                outputFile.close()
+    print(str(analysed) + " positions analysed", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,352 @@
+from ChessEngine import GameState, Move, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, WHITE, BLACK, \
+    COLOR_MASK, PROMOTION_MOVE, EN_PASSANT_MOVE, CASTLE_MOVE, boardSquares, squareCols, \
+    promotedPiece
+
+# Bitboards are python ints, bit number row * 8 + col (row 0 being the 8th rank, as everywhere else)
+FULL_BOARD = (1 << 64) - 1
+
+squareBits = [-1] * 120  # mailbox square -> bit number
+bitSquares = [0] * 64  # bit number -> mailbox square
+for bit, square in enumerate(boardSquares):
+    squareBits[square] = bit
+    bitSquares[bit] = square
+
+# (row, col) steps of the 8 directions; the first 4 are rook directions, the last 4 bishop directions
+directionSteps = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
+# a ray in a direction with a negative step goes towards lower bit numbers, so its nearest blocker is the
+# most significant bit of the blockers instead of the least significant one
+negativeDirections = tuple(dRow < 0 or (dRow == 0 and dCol < 0) for dRow, dCol in directionSteps)
+
+
+def stepBits(bit, steps):
+    bits = 0
+    row, col = divmod(bit, 8)
+    for dRow, dCol in steps:
+        if 0 <= row + dRow < 8 and 0 <= col + dCol < 8:
+            bits |= 1 << ((row + dRow) * 8 + col + dCol)
+    return bits
+
+
+def rayBits(bit, dRow, dCol):
+    bits = 0
+    row, col = divmod(bit, 8)
+    row += dRow
+    col += dCol
+    while 0 <= row < 8 and 0 <= col < 8:
+        bits |= 1 << (row * 8 + col)
+        row += dRow
+        col += dCol
+    return bits
+
+
+knightAttacks = [stepBits(bit, ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1)))
+                 for bit in range(64)]
+kingAttacks = [stepBits(bit, directionSteps) for bit in range(64)]
+# squares attacked by a pawn of the color standing on the square; white pawns move up (towards row 0)
+pawnAttacks = {WHITE: [stepBits(bit, ((-1, -1), (-1, 1))) for bit in range(64)],
+               BLACK: [stepBits(bit, ((1, -1), (1, 1))) for bit in range(64)]}
+rays = [[rayBits(bit, dRow, dCol) for bit in range(64)] for dRow, dCol in directionSteps]  # [direction][bit]
+rookRays = [rays[0][bit] | rays[1][bit] | rays[2][bit] | rays[3][bit] for bit in range(64)]
+bishopRays = [rays[4][bit] | rays[5][bit] | rays[6][bit] | rays[7][bit] for bit in range(64)]
+
+# squares strictly between two squares on the same line, 0 if they don't share a rank, file or diagonal
+betweenBits = [[0] * 64 for bit in range(64)]
+for bit in range(64):
+    for direction in range(8):
+        ray = rays[direction][bit]
+        target = ray
+        while target:
+            low = target & -target
+            other = low.bit_length() - 1
+            betweenBits[bit][other] = ray & ~rays[direction][other] & ~low
+            target ^= low
+
+'''
+Attacks of a sliding piece along the given directions on a board with the given occupancy,
+the classical way: follow the empty board ray up to the nearest blocker, the blocker included
+'''
+
+
+def slidingAttacks(bit, occupied, directionNumbers):
+    attacks = 0
+    for direction in directionNumbers:
+        ray = rays[direction][bit]
+        blockers = ray & occupied
+        if blockers:
+            if negativeDirections[direction]:
+                blocker = blockers.bit_length() - 1
+            else:
+                blocker = (blockers & -blockers).bit_length() - 1
+            ray ^= rays[direction][blocker]
+        attacks |= ray
+    return attacks
+
+
+def rookAttacks(bit, occupied):
+    return slidingAttacks(bit, occupied, (0, 1, 2, 3))
+
+
+def bishopAttacks(bit, occupied):
+    return slidingAttacks(bit, occupied, (4, 5, 6, 7))
+
+
+'''
+A GameState that generates its moves with bitboards. The mailbox, logs, Zobrist key and score are kept by
+GameState as usual; on top of that one bitboard per piece code and per color is updated by every move.
+Pins and checks are found with bit operations: a pinned piece may only move along its pin line, and when in
+check every move but a king move must land on the check mask (the checker or a square between it and the king).
+'''
+
+
+class BitboardGameState(GameState):
+    backend = "bitboard"
+
+    def __init__(self):
+        GameState.__init__(self)
+        self.computeBitboards()
+
+    '''
+    Build the piece and color bitboards from the mailbox
+    '''
+
+    def computeBitboards(self):
+        self.pieceBitboards = [0] * 32  # indexed by piece code
+        self.colorBitboards = {WHITE: 0, BLACK: 0}
+        for square in boardSquares:
+            piece = self.squares[square]
+            if piece != EMPTY:
+                self.pieceBitboards[piece] |= 1 << squareBits[square]
+                self.colorBitboards[piece & COLOR_MASK] |= 1 << squareBits[square]
+
+    def loadFen(self, fen):
+        GameState.loadFen(self, fen)
+        self.computeBitboards()
+
+    def makeMove(self, move):
+        GameState.makeMove(self, move)
+        self.toggleMoveBits(move)
+
+    def undoMove(self):
+        if len(self.moveLog) != 0:
+            move = self.moveLog[-1]
+            GameState.undoMove(self)
+            self.toggleMoveBits(move)
+
+    '''
+    Flip the bits a move changes. Flipping twice restores them, so undoMove uses the same method.
+    '''
+
+    def toggleMoveBits(self, move):
+        pieceBitboards = self.pieceBitboards
+        colorBitboards = self.colorBitboards
+        startBit = 1 << squareBits[move.startSquare]
+        endBit = 1 << squareBits[move.endSquare]
+        pieceMoved = move.pieceMovedCode
+        color = pieceMoved & COLOR_MASK
+        pieceBitboards[pieceMoved] ^= startBit
+        moveKind = move.moveID >> 14
+        pieceBitboards[promotedPiece(move) if moveKind == PROMOTION_MOVE else pieceMoved] ^= endBit
+        colorBitboards[color] ^= startBit | endBit
+        if move.pieceCapturedCode != EMPTY:
+            if moveKind == EN_PASSANT_MOVE:  # the captured pawn is next to the start square
+                capturedBit = 1 << squareBits[move.startSquare - squareCols[move.startSquare] +
+                                              squareCols[move.endSquare]]
+            else:
+                capturedBit = endBit
+            pieceBitboards[move.pieceCapturedCode] ^= capturedBit
+            colorBitboards[move.pieceCapturedCode & COLOR_MASK] ^= capturedBit
+        if moveKind == CASTLE_MOVE:
+            if move.endSquare > move.startSquare:  # kingside
+                rookBits = (endBit << 1) | (endBit >> 1)
+            else:  # queenside
+                rookBits = (endBit >> 2) | (endBit << 1)
+            pieceBitboards[color | ROOK] ^= rookBits
+            colorBitboards[color] ^= rookBits
+
+    '''
+    Bitboard of the pieces of enemyColor attacking the square, with the given occupancy
+    '''
+
+    def attackersTo(self, bit, enemyColor, occupied):
+        pieceBitboards = self.pieceBitboards
+        allyColor = BLACK if enemyColor == WHITE else WHITE
+        attackers = (knightAttacks[bit] & pieceBitboards[enemyColor | KNIGHT]) | \
+                    (kingAttacks[bit] & pieceBitboards[enemyColor | KING]) | \
+                    (pawnAttacks[allyColor][bit] & pieceBitboards[enemyColor | PAWN])
+        queens = pieceBitboards[enemyColor | QUEEN]
+        diagonalSliders = (pieceBitboards[enemyColor | BISHOP] | queens) & bishopRays[bit]
+        if diagonalSliders:
+            attackers |= bishopAttacks(bit, occupied) & diagonalSliders
+        straightSliders = (pieceBitboards[enemyColor | ROOK] | queens) & rookRays[bit]
+        if straightSliders:
+            attackers |= rookAttacks(bit, occupied) & straightSliders
+        return attackers
+
+    '''
+    Return the bitboard of the pinned ally pieces and, for each of them, the line it may still move on
+    (the squares between the king and the pinner, the pinner included)
+    '''
+
+    def getPins(self, kingBit, allyColor, enemyColor, occupied):
+        pieceBitboards = self.pieceBitboards
+        queens = pieceBitboards[enemyColor | QUEEN]
+        snipers = ((pieceBitboards[enemyColor | ROOK] | queens) & rookRays[kingBit]) | \
+                  ((pieceBitboards[enemyColor | BISHOP] | queens) & bishopRays[kingBit])
+        pinned = 0
+        pinLines = {}
+        allies = self.colorBitboards[allyColor]
+        while snipers:
+            sniper = snipers & -snipers
+            snipers ^= sniper
+            between = betweenBits[kingBit][sniper.bit_length() - 1]
+            blockers = between & occupied
+            if blockers and blockers & (blockers - 1) == 0 and blockers & allies:  # exactly one ally in between
+                pinned |= blockers
+                pinLines[blockers.bit_length() - 1] = between | sniper
+        return pinned, pinLines
+
+    '''
+    All moves considering checks, see GameState.getValidMoves
+    '''
+
+    def getValidMoves(self, capturesOnly=False):
+        moves = []
+        squares = self.squares
+        pieceBitboards = self.pieceBitboards
+        if self.whiteToMove:
+            allyColor, enemyColor = WHITE, BLACK
+        else:
+            allyColor, enemyColor = BLACK, WHITE
+        allies = self.colorBitboards[allyColor]
+        enemies = self.colorBitboards[enemyColor]
+        occupied = allies | enemies
+        kingBitboard = pieceBitboards[allyColor | KING]
+        kingBit = kingBitboard.bit_length() - 1
+        kingSquare = bitSquares[kingBit]
+        checkers = self.attackersTo(kingBit, enemyColor, occupied)
+        self.inCheck = checkers != 0
+        self.pins = {}
+        self.checks = []
+        self.capturesOnly = capturesOnly and not self.inCheck
+        targets = enemies if self.capturesOnly else FULL_BOARD & ~allies
+
+        # king moves, with the king taken off the board so it doesn't hide squares behind it from sliders
+        king = allyColor | KING
+        kingTargets = kingAttacks[kingBit] & targets
+        occupiedWithoutKing = occupied ^ kingBitboard
+        while kingTargets:
+            target = kingTargets & -kingTargets
+            kingTargets ^= target
+            bit = target.bit_length() - 1
+            if not self.attackersTo(bit, enemyColor, occupiedWithoutKing):
+                moves.append(Move.fromSquares(kingSquare, bitSquares[bit], king, squares[bitSquares[bit]]))
+        if checkers & (checkers - 1):  # double check, king has to move
+            self.setGameOver(moves)
+            return moves
+        if not checkers and not self.capturesOnly:
+            self.getCastleMoves(kingSquare, moves, allyColor)
+
+        if checkers:  # capture the checker or block the check
+            checkMask = checkers | betweenBits[kingBit][checkers.bit_length() - 1]
+            targets &= checkMask
+        else:
+            checkMask = FULL_BOARD
+        pinned, pinLines = self.getPins(kingBit, allyColor, enemyColor, occupied)
+
+        knight = allyColor | KNIGHT
+        knights = pieceBitboards[knight] & ~pinned  # a pinned knight can never move
+        while knights:
+            low = knights & -knights
+            knights ^= low
+            bit = low.bit_length() - 1
+            self.addMoves(bit, knight, knightAttacks[bit] & targets, moves)
+
+        for pieceType in (BISHOP, ROOK, QUEEN):
+            piece = allyColor | pieceType
+            sliders = pieceBitboards[piece]
+            while sliders:
+                low = sliders & -sliders
+                sliders ^= low
+                bit = low.bit_length() - 1
+                attacks = 0
+                if pieceType != ROOK:
+                    attacks |= bishopAttacks(bit, occupied)
+                if pieceType != BISHOP:
+                    attacks |= rookAttacks(bit, occupied)
+                attacks &= targets
+                if low & pinned:
+                    attacks &= pinLines[bit]
+                self.addMoves(bit, piece, attacks, moves)
+
+        self.getPawnMoves(allyColor, enemyColor, occupied, checkMask, pinned, pinLines, kingBit, moves)
+        self.setGameOver(moves)
+        return moves
+
+    '''
+    Add a move from the square to each square of the target bitboard
+    '''
+
+    def addMoves(self, bit, piece, targets, moves):
+        squares = self.squares
+        startSquare = bitSquares[bit]
+        while targets:
+            target = targets & -targets
+            targets ^= target
+            endSquare = bitSquares[target.bit_length() - 1]
+            moves.append(Move.fromSquares(startSquare, endSquare, piece, squares[endSquare]))
+
+    def getPawnMoves(self, allyColor, enemyColor, occupied, checkMask, pinned, pinLines, kingBit, moves):
+        squares = self.squares
+        pawn = allyColor | PAWN
+        enemies = self.colorBitboards[enemyColor]
+        if allyColor == WHITE:
+            forward = -8
+            startRow, promotionRow = 6, 0
+        else:
+            forward = 8
+            startRow, promotionRow = 1, 7
+        enPassantBit = -1
+        if self.enPassantSquare:
+            enPassantBit = squareBits[self.enPassantSquare]
+        pawns = self.pieceBitboards[pawn]
+        while pawns:
+            low = pawns & -pawns
+            pawns ^= low
+            bit = low.bit_length() - 1
+            allowed = pinLines[bit] & checkMask if low & pinned else checkMask
+            startSquare = bitSquares[bit]
+            pushBit = bit + forward
+            if not occupied >> pushBit & 1:  # 1 square move
+                if (pushBit >> 3 == promotionRow or not self.capturesOnly) and allowed >> pushBit & 1:
+                    self.addPawnMoves(startSquare, bitSquares[pushBit], pawn, EMPTY, moves)
+                doublePushBit = pushBit + forward
+                if bit >> 3 == startRow and not self.capturesOnly and not occupied >> doublePushBit & 1 \
+                        and allowed >> doublePushBit & 1:  # 2 squares moves
+                    moves.append(Move.fromSquares(startSquare, bitSquares[doublePushBit], pawn, EMPTY))
+            captures = pawnAttacks[allyColor][bit]
+            targets = captures & enemies & allowed
+            while targets:
+                target = targets & -targets
+                targets ^= target
+                endSquare = bitSquares[target.bit_length() - 1]
+                self.addPawnMoves(startSquare, endSquare, pawn, squares[endSquare], moves)
+            if enPassantBit >= 0 and captures >> enPassantBit & 1:
+                # play the capture on the occupancy and see if the king is attacked, this covers pins,
+                # the two pawns leaving the king's row at once and capturing a checking pawn
+                capturedBit = 1 << (enPassantBit - forward)
+                occupiedAfter = (occupied ^ low ^ capturedBit) | (1 << enPassantBit)
+                self.pieceBitboards[enemyColor | PAWN] ^= capturedBit
+                legal = not self.attackersTo(kingBit, enemyColor, occupiedAfter)
+                self.pieceBitboards[enemyColor | PAWN] ^= capturedBit
+                if legal:
+                    moves.append(Move.fromSquares(startSquare, bitSquares[enPassantBit], pawn, enemyColor | PAWN,
+                                                  enPassant=True))
+
+    '''
+    Determine if the enemy player can attack the square
+    '''
+
+    def squareUnderAttack(self, square, allyColor):
+        enemyColor = BLACK if allyColor == WHITE else WHITE
+        occupied = self.colorBitboards[WHITE] | self.colorBitboards[BLACK]
+        return self.attackersTo(squareBits[square], enemyColor, occupied) != 0
@@ -1,6 +1,239 @@
+import random
+
+pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1}
+
+knightScores = [[1, 1, 1, 1, 1, 1, 1, 1],
+                [1, 2, 2, 2, 2, 2, 2, 1],
+                [1, 2, 3, 3, 3, 3, 2, 1],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [1, 2, 3, 3, 3, 3, 2, 1],
+                [1, 2, 2, 2, 2, 2, 2, 1],
+                [1, 1, 1, 1, 1, 1, 1, 1]]
+
+bishopScores = [[4, 3, 2, 1, 1, 2, 3, 4],
+                [3, 4, 3, 2, 2, 3, 4, 3],
+                [2, 3, 4, 3, 3, 4, 3, 2],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [1, 2, 3, 4, 4, 3, 2, 1],
+                [2, 3, 4, 3, 3, 4, 3, 2],
+                [3, 4, 3, 2, 2, 3, 4, 3],
+                [4, 3, 2, 1, 1, 2, 3, 4]]
+
+queenScores = [[1, 1, 1, 3, 1, 1, 1, 1],
+               [1, 2, 3, 3, 3, 1, 1, 1],
+               [1, 4, 3, 3, 3, 4, 2, 1],
+               [1, 2, 3, 3, 3, 2, 2, 1],
+               [1, 2, 3, 3, 3, 2, 2, 1],
+               [1, 4, 3, 3, 3, 4, 2, 1],
+               [1, 1, 2, 3, 3, 1, 1, 1],
+               [1, 1, 1, 3, 1, 1, 1, 1]]
+
+# probably better to try to place rooks on open files, or on same file as other rook/queen
+rookScores = [[4, 3, 4, 4, 4, 4, 3, 4],
+              [4, 4, 4, 4, 4, 4, 4, 4],
+              [1, 1, 2, 3, 3, 2, 1, 1],
+              [1, 2, 3, 4, 4, 3, 2, 1],
+              [1, 2, 3, 4, 4, 3, 2, 1],
+              [1, 1, 2, 2, 2, 2, 1, 1],
+              [4, 4, 4, 4, 4, 4, 4, 4],
+              [4, 3, 4, 4, 4, 4, 3, 4]]
+
+whitePawnScores = [[8, 8, 8, 8, 8, 8, 8, 8],
+                   [8, 8, 8, 8, 8, 8, 8, 8],
+                   [5, 6, 6, 7, 7, 6, 6, 5],
+                   [2, 3, 3, 5, 5, 3, 3, 2],
+                   [1, 2, 3, 4, 4, 3, 2, 1],
+                   [1, 1, 2, 3, 3, 2, 1, 1],
+                   [1, 1, 1, 0, 0, 1, 1, 1],
+                   [0, 0, 0, 0, 0, 0, 0, 0]]
+
+blackPawnScores = [[0, 0, 0, 0, 0, 0, 0, 0],
+                   [1, 1, 1, 0, 0, 1, 1, 1],
+                   [1, 1, 2, 3, 3, 2, 1, 1],
+                   [1, 2, 3, 4, 4, 3, 2, 1],
+                   [2, 3, 3, 5, 5, 3, 3, 2],
+                   [5, 6, 6, 7, 7, 6, 6, 5],
+                   [8, 8, 8, 8, 8, 8, 8, 8],
+                   [8, 8, 8, 8, 8, 8, 8, 8]]
+
+piecePositionScores = {"N": knightScores, "Q": queenScores, "B": bishopScores, "R": rookScores, "bp": blackPawnScores,
+                       "wp": whitePawnScores}
+
+# The board is a 10 x 12 mailbox: the 8 x 8 board surrounded by sentinel squares, so a piece walking off the
+# board always lands on an OFFBOARD square and no row/col bounds checks are needed. Square of (row, col) is
+# 21 + row * 10 + col, row 0 being the 8th rank as in the old 2-D list.
+EMPTY = 0
+PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = 1, 2, 3, 4, 5, 6  # piece type = code & 7
+WHITE = 8
+BLACK = 16
+OFFBOARD = WHITE | BLACK  # ally of both colors, so it stops every ray and is never captured
+TYPE_MASK = 7
+COLOR_MASK = WHITE | BLACK
+
+pieceCodes = {"--": EMPTY}
+for color, colorCode in (("w", WHITE), ("b", BLACK)):
+    for pieceType, piece in enumerate("pNBRQK", 1):
+        pieceCodes[color + piece] = colorCode | pieceType
+pieceNames = ["--"] * 32
+for piece, code in pieceCodes.items():
+    pieceNames[code] = piece
+
+boardSquares = [21 + row * 10 + col for row in range(8) for col in range(8)]  # the 64 real squares
+squareSet = frozenset(boardSquares)
+squareRows = [square // 10 - 2 for square in range(120)]
+squareCols = [square % 10 - 1 for square in range(120)]
+
+# (rook directions, then bishop directions) as mailbox offsets, in the (row, col) order used before:
+# up, left, down, right, up_left, up_right, down_left, down_right
+directions = (-10, -1, 10, 1, -11, -9, 9, 11)
+rookDirections = directions[:4]
+bishopDirections = directions[4:]
+knightMoves = (-21, -19, -12, -8, 8, 12, 19, 21)
+
+
+def toSquare(row, col):
+    return 21 + row * 10 + col
+
+
+promotionPieces = ("Q", "R", "B", "N")
+# piece letters of Forsyth-Edwards Notation, upper case for white
+fenPieceCodes = {"P": WHITE | PAWN, "N": WHITE | KNIGHT, "B": WHITE | BISHOP, "R": WHITE | ROOK, "Q": WHITE | QUEEN,
+                 "K": WHITE | KING, "p": BLACK | PAWN, "n": BLACK | KNIGHT, "b": BLACK | BISHOP, "r": BLACK | ROOK,
+                 "q": BLACK | QUEEN, "k": BLACK | KING}
+fenPieceLetters = {code: letter for letter, code in fenPieceCodes.items()}
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+# Moves are packed in 16 bits: start square index (0 - 63, row * 8 + col) in bits 0-5, end square index in bits 6-11,
+# promotion piece (index in promotionPieces, the queen being 0) in bits 12-13 and the move kind in bits 14-15
+QUIET_MOVE = 0  # any move that is none of the three below, captures included
+PROMOTION_MOVE = 1
+EN_PASSANT_MOVE = 2
+CASTLE_MOVE = 3
+squareIndexes = [0] * 120  # mailbox square -> row * 8 + col
+for row in range(8):
+    for col in range(8):
+        squareIndexes[toSquare(row, col)] = row * 8 + col
+
+
+def packMove(startSquare, endSquare, pieceMoved, enPassant=False, castle=False, promotionPiece="Q"):
+    moveID = squareIndexes[startSquare] | squareIndexes[endSquare] << 6
+    if enPassant:
+        return moveID | EN_PASSANT_MOVE << 14
+    if castle:
+        return moveID | CASTLE_MOVE << 14
+    if (pieceMoved & TYPE_MASK) == PAWN and (squareRows[endSquare] == 0 or squareRows[endSquare] == 7):
+        return moveID | promotionPieces.index(promotionPiece) << 12 | PROMOTION_MOVE << 14
+    return moveID
+
+
+'''
+Squares a piece other than the king can move to when the king on the first square is checked only by the piece on
+the second one: the checking piece itself and, along a line, the squares in between.
+Indexed by kingSquare * 120 + checkSquare.
+'''
+checkEvasionSquares = {}
+for kingSquare in boardSquares:
+    for d in directions:
+        line = []
+        checkSquare = kingSquare + d
+        while checkSquare in squareSet:
+            line.append(checkSquare)
+            checkEvasionSquares[kingSquare * 120 + checkSquare] = frozenset(line)
+            checkSquare += d
+    for m in knightMoves:
+        if kingSquare + m in squareSet:
+            checkEvasionSquares[kingSquare * 120 + kingSquare + m] = frozenset((kingSquare + m,))
+
+# castling rights bits, the bits of CastleRights.getIndex
+WHITE_KINGSIDE, BLACK_KINGSIDE, WHITE_QUEENSIDE, BLACK_QUEENSIDE = 1, 2, 4, 8
+ALL_CASTLING_RIGHTS = 15
+# castling rights that stay after a move from or to the square: moving the king or a rook, or capturing a rook,
+# loses the rights of that king or rook
+castlingRightsKept = [ALL_CASTLING_RIGHTS] * 120
+castlingRightsKept[toSquare(7, 4)] = ALL_CASTLING_RIGHTS & ~(WHITE_KINGSIDE | WHITE_QUEENSIDE)
+castlingRightsKept[toSquare(7, 7)] = ALL_CASTLING_RIGHTS & ~WHITE_KINGSIDE
+castlingRightsKept[toSquare(7, 0)] = ALL_CASTLING_RIGHTS & ~WHITE_QUEENSIDE
+castlingRightsKept[toSquare(0, 4)] = ALL_CASTLING_RIGHTS & ~(BLACK_KINGSIDE | BLACK_QUEENSIDE)
+castlingRightsKept[toSquare(0, 7)] = ALL_CASTLING_RIGHTS & ~BLACK_KINGSIDE
+castlingRightsKept[toSquare(0, 0)] = ALL_CASTLING_RIGHTS & ~BLACK_QUEENSIDE
+UNDO_STACK_SIZE = 256  # moves the undo stack has room for before it grows
+
+'''
+Piece code a promotion move puts on the board: the promotion pieces Q, R, B, N are the piece types QUEEN down to
+KNIGHT, so the type is QUEEN minus the promotion index
+'''
+
+
+def promotedPiece(move):
+    return (move.pieceMovedCode & COLOR_MASK) | (QUEEN - (move.moveID >> 12 & 3))
+
+
+'''
+Score of every piece on every square in tenths of a pawn: 10 * material + position bonus.
+Positive for white pieces and negative for black pieces, so the sum over the board is the score for white.
+Indexed by [piece code][mailbox square].
+'''
+
+
+def buildPieceSquareScores():
+    scores = [[0] * 120 for code in range(32)]
+    for color, sign in (("w", 1), ("b", -1)):
+        for piece in pieceScore:
+            if piece == "p":
+                positionScores = piecePositionScores[color + piece]
+            elif piece == "K":  # no position table for the king
+                positionScores = [[0] * 8 for row in range(8)]
+            else:
+                positionScores = piecePositionScores[piece]
+            for row in range(8):
+                for col in range(8):
+                    scores[pieceCodes[color + piece]][toSquare(row, col)] = \
+                        sign * (pieceScore[piece] * 10 + positionScores[row][col])
+    return scores
+
+
+pieceSquareScores = buildPieceSquareScores()
+
+# Zobrist keys: one random 64 bit number for each piece on each square, for the side to move,
+# for each of the 16 castling rights combinations and for each en passant file
+zobristRandom = random.Random(20230513)
+zobristPieces = [[0] * 120 for code in range(32)]  # [piece code][mailbox square], 0 for EMPTY
+for color in 'wb':
+    for piece in 'pRNBQK':
+        for row in range(8):
+            for col in range(8):
+                zobristPieces[pieceCodes[color + piece]][toSquare(row, col)] = zobristRandom.getrandbits(64)
+zobristBlackToMove = zobristRandom.getrandbits(64)
+zobristCastling = [zobristRandom.getrandbits(64) for i in range(16)]
+zobristEnPassant = [zobristRandom.getrandbits(64) for col in range(8)]
+
+
+'''
+Create a game state using the chosen move generator backend:
+"mailbox" for GameState itself, "bitboard" for BitboardEngine.BitboardGameState,
+set up in the position of the FEN if one is given
+'''
+
+
+def newGameState(backend="mailbox", fen=None):
+    if backend == "bitboard":
+        import BitboardEngine  # imported here, the bitboard backend is built on top of this module
+        gameStateClass = BitboardEngine.BitboardGameState
+    elif backend == "mailbox":
+        gameStateClass = GameState
+    else:
+        raise ValueError("unknown move generator backend: " + backend)
+    if fen is not None:
+        return gameStateClass.fromFen(fen)
+    return gameStateClass()
+
+
 class GameState():
+    backend = "mailbox"  # name of the move generator, for newGameState
+
     def __init__(self):
-        self.board = [
+        board = [
             ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
             ["bp", "bp", "bp", "bp", "bp", "bp", "bp", "bp"],
             ["--", "--", "--", "--", "--", "--", "--", "--"],
@@ -9,71 +242,256 @@ class GameState():
             ["--", "--", "--", "--", "--", "--", "--", "--"],
             ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
-        self.moveFunctions = {'p': self.getPawnMoves, 'R': self.getRookMoves, 'N': self.getKnightMoves,
-                              'B': self.getBishopMoves, 'Q': self.getQueenMoves, 'K': self.getKingMoves}
+        self.squares = bytearray([OFFBOARD]) * 120  # mailbox of piece codes
+        for row in range(8):
+            for col in range(8):
+                self.squares[toSquare(row, col)] = pieceCodes[board[row][col]]
+        self.board = BoardView(self.squares)  # board[row][col] == "wp", for the UI and older code
+        self.moveFunctions = {PAWN: self.getPawnMoves, ROOK: self.getRookMoves, KNIGHT: self.getKnightMoves,
+                              BISHOP: self.getBishopMoves, QUEEN: self.getQueenMoves, KING: self.getKingMoves}
         self.moveLog = []
+        self.startFen = START_FEN  # position before the first move of moveLog
         self.whiteToMove = True
-        self.whiteKingLocation = (7, 4)
-        self.blackKingLocation = (0, 4)
+        self.whiteKingSquare = toSquare(7, 4)
+        self.blackKingSquare = toSquare(0, 4)
         self.inCheck = False
-        self.pins = []
+        self.pins = {}  # square of a pinned piece: direction of the pin
         self.checks = []
+        self.evasionSquares = None  # squares that get out of the single check, None when not in check
         self.checkMate = False
         self.staleMate = False
-        self.enPassantPossible = ()  # coordinates for the square where en passant capture is possible
-        self.enPassantPossibleLog = [self.enPassantPossible]
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+        self.capturesOnly = False  # when set the move generators skip quiet moves
+        self.enPassantSquare = 0  # mailbox square where en passant capture is possible, 0 if none
+        self.castlingRights = ALL_CASTLING_RIGHTS  # 4 bits, see CastleRights.getIndex
+        self.halfmoveClock = 0  # moves since the last capture or pawn move, for the fifty move rule
+        self.fullmoveNumber = 1  # starts at 1 and goes up after every black move
+        self.zobristKey = self.computeZobristKey()
+        self.boardScore = self.computeBoardScore()  # material and position score for white, in tenths of a pawn
+        # undo stack, one entry per move of moveLog: what undoMove can't work out from the move itself.
+        # Preallocated and overwritten in place, so making and undoing moves doesn't build any objects.
+        self.undoKeys = [0] * UNDO_STACK_SIZE  # Zobrist key before the move
+        self.undoScores = [0] * UNDO_STACK_SIZE  # board score before the move
+        # castling rights | en passant square << 4 | halfmove clock << 11 before the move
+        self.undoStates = [0] * UNDO_STACK_SIZE
+        self.nullMoveStates = []  # (en passant square, Zobrist key) before every null move not undone yet
+
+    '''
+    (row, col) of the kings, as the rest of the program used to see them
+    '''
+
+    @property
+    def whiteKingLocation(self):
+        return squareRows[self.whiteKingSquare], squareCols[self.whiteKingSquare]
+
+    @property
+    def blackKingLocation(self):
+        return squareRows[self.blackKingSquare], squareCols[self.blackKingSquare]
+
+    '''
+    (row, col) of the en passant square or (), and the castling rights as a CastleRights, as they used to be kept
+    '''
+
+    @property
+    def enPassantPossible(self):
+        if self.enPassantSquare == 0:
+            return ()
+        return squareRows[self.enPassantSquare], squareCols[self.enPassantSquare]
+
+    @property
+    def currentCastlingRight(self):
+        return CastleRights.fromIndex(self.castlingRights)
+
+    '''
+    A new game state set up in the position given in Forsyth-Edwards Notation, see loadFen
+    '''
+
+    @classmethod
+    def fromFen(cls, fen):
+        gs = cls()
+        gs.loadFen(fen)
+        return gs
+
+    '''
+    Set up the position given in Forsyth-Edwards Notation, e.g. the start position is
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1". The move history is cleared.
+    The halfmove clock and the fullmove number may be left out, they default to 0 and 1.
+    '''
+
+    def loadFen(self, fen):
+        fields = fen.split()
+        if len(fields) < 2:
+            raise ValueError("FEN needs at least the piece placement and the side to move: " + fen)
+        rows = fields[0].split("/")
+        if len(rows) != 8:
+            raise ValueError("FEN piece placement needs 8 rows: " + fen)
+        pieces = []  # piece codes of the 64 squares, in the order of boardSquares
+        for rowString in rows:
+            rowPieces = []
+            for char in rowString:
+                if char in "12345678":
+                    rowPieces += [EMPTY] * int(char)
+                elif char in fenPieceCodes:
+                    rowPieces.append(fenPieceCodes[char])
+                else:
+                    raise ValueError("unknown piece " + char + " in FEN: " + fen)
+            if len(rowPieces) != 8:
+                raise ValueError("FEN row " + rowString + " is not 8 squares long: " + fen)
+            pieces += rowPieces
+        if pieces.count(WHITE | KING) != 1 or pieces.count(BLACK | KING) != 1:
+            raise ValueError("FEN needs one king of each color: " + fen)
+        if fields[1] not in ("w", "b"):
+            raise ValueError("FEN side to move must be w or b: " + fen)
+        castling = fields[2] if len(fields) > 2 else "-"
+        enPassant = fields[3] if len(fields) > 3 else "-"
+        if castling != "-" and (not castling or any(char not in "KQkq" for char in castling)):
+            raise ValueError("bad castling rights " + castling + " in FEN: " + fen)
+        halfmoveClock = fields[4] if len(fields) > 4 else "0"
+        fullmoveNumber = fields[5] if len(fields) > 5 else "1"
+        if not halfmoveClock.isdigit() or not fullmoveNumber.isdigit() or int(fullmoveNumber) < 1:
+            raise ValueError("bad move clocks " + halfmoveClock + " " + fullmoveNumber + " in FEN: " + fen)
+
+        for square, piece in zip(boardSquares, pieces):
+            self.squares[square] = piece  # changed in place, the board view shares it
+        self.whiteToMove = fields[1] == "w"
+        self.startFen = fen
+        self.whiteKingSquare = boardSquares[pieces.index(WHITE | KING)]
+        self.blackKingSquare = boardSquares[pieces.index(BLACK | KING)]
+        self.moveLog = []
+        self.inCheck = False
+        self.pins = {}  # square of a pinned piece: direction of the pin
+        self.checks = []
+        self.evasionSquares = None  # squares that get out of the single check, None when not in check
+        self.checkMate = False
+        self.staleMate = False
+        if enPassant == "-":
+            self.enPassantSquare = 0
+        elif len(enPassant) == 2 and enPassant[0] in Move.filesToCols and enPassant[1] in "36":
+            self.enPassantSquare = toSquare(Move.ranksToRows[enPassant[1]], Move.filesToCols[enPassant[0]])
+        else:
+            raise ValueError("bad en passant square " + enPassant + " in FEN: " + fen)
+        self.castlingRights = CastleRights("K" in castling, "k" in castling, "Q" in castling,
+                                           "q" in castling).getIndex()
+        self.halfmoveClock = int(halfmoveClock)
+        self.fullmoveNumber = int(fullmoveNumber)
+        self.zobristKey = self.computeZobristKey()
+        self.boardScore = self.computeBoardScore()
+
+    '''
+    The current position in Forsyth-Edwards Notation, loadFen of it gives back the same position
+    '''
+
+    def toFen(self):
+        rows = []
+        for row in range(8):
+            rowString = ""
+            emptySquares = 0
+            for col in range(8):
+                piece = self.squares[toSquare(row, col)]
+                if piece == EMPTY:
+                    emptySquares += 1
+                else:
+                    if emptySquares:
+                        rowString += str(emptySquares)
+                        emptySquares = 0
+                    rowString += fenPieceLetters[piece]
+            if emptySquares:
+                rowString += str(emptySquares)
+            rows.append(rowString)
+        castling = ""
+        for right, letter in ((WHITE_KINGSIDE, "K"), (WHITE_QUEENSIDE, "Q"), (BLACK_KINGSIDE, "k"),
+                              (BLACK_QUEENSIDE, "q")):
+            if self.castlingRights & right:
+                castling += letter
+        if self.enPassantSquare:
+            enPassant = Move.colsToFiles[squareCols[self.enPassantSquare]] + \
+                Move.rowToRanks[squareRows[self.enPassantSquare]]
+        else:
+            enPassant = "-"
+        return " ".join(("/".join(rows), "w" if self.whiteToMove else "b", castling or "-", enPassant,
+                         str(self.halfmoveClock), str(self.fullmoveNumber)))
 
     '''
-    Takes a Move as a paramater and executes it (this will not work for castling, pawn promotion, and en-passant.
+    Takes a Move as a paramater and executes it, castling, pawn promotion and en-passant included
     '''
 
     def makeMove(self, move):
-        self.board[move.endRow][move.endCol] = move.pieceMoved
-        self.board[move.startRow][move.startCol] = "--"
+        squares = self.squares
+        start = move.startSquare
+        end = move.endSquare
+        pieceMoved = move.pieceMovedCode
+        pieceCaptured = move.pieceCapturedCode
+        moveKind = move.moveID >> 14
+        ply = len(self.moveLog)
+        if ply == len(self.undoKeys):
+            self.growUndoStack()
+        # so undoMove can restore the key, the score, the castling rights, the en passant square and the clock
+        self.undoKeys[ply] = self.zobristKey
+        self.undoScores[ply] = self.boardScore
+        self.undoStates[ply] = self.castlingRights | self.enPassantSquare << 4 | self.halfmoveClock << 11
+        if (pieceMoved & TYPE_MASK) == PAWN or pieceCaptured != EMPTY:
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
+        if (pieceMoved & COLOR_MASK) == BLACK:
+            self.fullmoveNumber += 1
+        key = self.zobristKey ^ zobristBlackToMove ^ zobristPieces[pieceMoved][start]
+        score = self.boardScore - pieceSquareScores[pieceMoved][start]
+        if pieceCaptured != EMPTY and moveKind != EN_PASSANT_MOVE:
+            key ^= zobristPieces[pieceCaptured][end]
+            score -= pieceSquareScores[pieceCaptured][end]
+        if self.enPassantSquare:
+            key ^= zobristEnPassant[squareCols[self.enPassantSquare]]
+        key ^= zobristCastling[self.castlingRights]
+
+        squares[start] = EMPTY
+        # pawn promotion
+        if moveKind == PROMOTION_MOVE:
+            # tốt đi xuống cuối hàng thì phong hậu
+            # cải tiến thêm phong thành xe, mã, tượng
+            piecePlaced = promotedPiece(move)
+        else:
+            piecePlaced = pieceMoved
+        squares[end] = piecePlaced
+        key ^= zobristPieces[piecePlaced][end]
+        score += pieceSquareScores[piecePlaced][end]
         self.moveLog.append(move)  # log the move so we can undo it later
         self.whiteToMove = not self.whiteToMove  # switch turns
         # update the king's location if moved
-        if move.pieceMoved == 'wK':
-            self.whiteKingLocation = (move.endRow, move.endCol)
-        elif move.pieceMoved == "bK":
-            self.blackKingLocation = (move.endRow, move.endCol)
+        if pieceMoved == WHITE | KING:
+            self.whiteKingSquare = end
+        elif pieceMoved == BLACK | KING:
+            self.blackKingSquare = end
 
         # if pawn moves twice, next move can capture enpassant
-        if move.pieceMoved[1] == 'p' and abs(move.startRow - move.endRow) == 2:
-            self.enPassantPossible = ((move.endRow + move.startRow) // 2, move.endCol)
+        if (pieceMoved & TYPE_MASK) == PAWN and abs(start - end) == 20:
+            self.enPassantSquare = (start + end) // 2
+            key ^= zobristEnPassant[squareCols[end]]
         else:
-            self.enPassantPossible = ()
+            self.enPassantSquare = 0
 
         # enpassant move
-        if move.enPassant:
-            self.board[move.startRow][move.endCol] = "--"  # capturing the pawn
-
-        # pawn promotion
-        if move.pawnPromotion:
-            promotedPiece = 'Q'  # we can make this part of the ui later
-            self.board[move.endRow][move.endCol] = move.pieceMoved[
-                                                       0] + promotedPiece  # tốt đi xuống cuối hàng thì phong hậu
-            # cải tiến thêm phong thành xe, mã, tượng
-            # chưa fix được
+        if moveKind == EN_PASSANT_MOVE:
+            capturedSquare = start - squareCols[start] + squareCols[end]  # same row as start, same col as end
+            squares[capturedSquare] = EMPTY  # capturing the pawn
+            key ^= zobristPieces[pieceCaptured][capturedSquare]
+            score -= pieceSquareScores[pieceCaptured][capturedSquare]
 
         # castle move
-        if move.castle:
-            if move.endCol - move.startCol == 2:  # kingside castle move
-                self.board[move.endRow][move.endCol - 1] = self.board[move.endRow][move.endCol + 1]  # moves the rook
-                self.board[move.endRow][move.endCol + 1] = '--'  # erase ole rook
+        if moveKind == CASTLE_MOVE:
+            if end - start == 2:  # kingside castle move
+                rookFrom, rookTo = end + 1, end - 1
             else:  # queenside castle move
-                self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 2]  # moves the rook
-                self.board[move.endRow][move.endCol - 2] = '--'
-
-        self.enPassantPossibleLog.append(self.enPassantPossible)
-
-        # update castling rights - whenever it is a rock or a king move
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+                rookFrom, rookTo = end - 2, end + 1
+            rook = squares[rookFrom]
+            squares[rookTo] = rook  # moves the rook
+            squares[rookFrom] = EMPTY  # erase ole rook
+            key ^= zobristPieces[rook][rookFrom] ^ zobristPieces[rook][rookTo]
+            score += pieceSquareScores[rook][rookTo] - pieceSquareScores[rook][rookFrom]
+
+        # update castling rights - whenever it is a rock or a king move, or a rook is captured
+        self.castlingRights &= castlingRightsKept[start] & castlingRightsKept[end]
+        self.zobristKey = key ^ zobristCastling[self.castlingRights]
+        self.boardScore = score
 
     '''
     Undo the last move made
@@ -82,244 +500,235 @@ class GameState():
     def undoMove(self):
         if len(self.moveLog) != 0:  # make sure that there is a move to undo
             move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
+            squares = self.squares
+            start = move.startSquare
+            end = move.endSquare
+            squares[start] = move.pieceMovedCode
+            squares[end] = move.pieceCapturedCode
             self.whiteToMove = not self.whiteToMove  # switch turns back
             # update the king's position if needed
-            if move.pieceMoved == 'wK':
-                self.whiteKingLocation = (move.startRow, move.startCol)
-            elif move.pieceMoved == "bK":
-                self.blackKingLocation = (move.startRow, move.startCol)
+            if move.pieceMovedCode == WHITE | KING:
+                self.whiteKingSquare = start
+            elif move.pieceMovedCode == BLACK | KING:
+                self.blackKingSquare = start
+            moveKind = move.moveID >> 14
             # undo en passant
-            if move.enPassant:
-                self.board[move.endRow][move.endCol] = '--'  # removes the pawn that was added in wrong square
-                self.board[move.startRow][
-                    move.endCol] = move.pieceCaptured  # puts the pawn back on the correct square it was captured from
-
-            self.enPassantPossibleLog.pop()
-            self.enPassantPossible = self.enPassantPossibleLog[-1]
-            # give back castle rights if move took them away
-            self.castleRightsLog.pop()  # get rid of the new castle rights from the move we are undoing
-            newRights = self.castleRightsLog[-1]
-            self.currentCastlingRight = CastleRights(newRights.wks, newRights.bks, newRights.wqs, newRights.bqs)
+            if moveKind == EN_PASSANT_MOVE:
+                squares[end] = EMPTY  # removes the pawn that was added in wrong square
+                # puts the pawn back on the correct square it was captured from
+                squares[start - squareCols[start] + squareCols[end]] = move.pieceCapturedCode
+
+            # give back castle rights if move took them away, and the en passant square
+            ply = len(self.moveLog)
+            state = self.undoStates[ply]
+            self.castlingRights = state & 15
+            self.enPassantSquare = state >> 4 & 127
+            self.halfmoveClock = state >> 11
+            if (move.pieceMovedCode & COLOR_MASK) == BLACK:
+                self.fullmoveNumber -= 1
             # undo castle move
-            if move.castle:
-                if move.endCol - move.startCol == 2:  # kingside
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
-                    self.board[move.endRow][move.endCol - 1] = '--'
+            if moveKind == CASTLE_MOVE:
+                if end - start == 2:  # kingside
+                    squares[end + 1] = squares[end - 1]
+                    squares[end - 1] = EMPTY
                 else:  # queenside
-                    self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
-                    self.board[move.endRow][move.endCol + 1] = '--'
+                    squares[end - 2] = squares[end + 1]
+                    squares[end + 1] = EMPTY
 
+            self.zobristKey = self.undoKeys[ply]
+            self.boardScore = self.undoScores[ply]
             self.checkMate = False
             self.staleMate = False
 
     '''
-    Update the castle rights given the move
-    '''
-
-    def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == 'bk':
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        elif move.pieceMoved == 'wR':
-            if move.startRow == 7:
-                if move.startCol == 0:  # left rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7:  # right rook
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == 'bR':
-            if move.startRow == 0:
-                if move.startCol == 0:  # left rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7:  # right rook
-                    self.currentCastlingRight.bks = False
-
-        # if a rook is captured
-        if move.pieceCaptured == 'wR':
-            if move.endRow == 7:
-                if move.endCol == 0:
-                    self.currentCastlingRight.wqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.wks = False
-        elif move.pieceCaptured == 'bR':
-            if move.endRow == 0:
-                if move.endCol == 0:
-                    self.currentCastlingRight.bqs = False
-                elif move.endCol == 7:
-                    self.currentCastlingRight.bks = False
-
-    '''
-    Return if the player is in check, a list of pins, and a list of checks
+    Pass the turn without moving, for the null move pruning of the search. It is not logged, so it has to be
+    taken back with undoNullMove before the move made before it is undone.
+    '''
+
+    def makeNullMove(self):
+        self.nullMoveStates.append((self.enPassantSquare, self.zobristKey))
+        key = self.zobristKey ^ zobristBlackToMove
+        if self.enPassantSquare:
+            key ^= zobristEnPassant[squareCols[self.enPassantSquare]]
+            self.enPassantSquare = 0
+        self.zobristKey = key
+        self.whiteToMove = not self.whiteToMove
+
+    def undoNullMove(self):
+        self.enPassantSquare, self.zobristKey = self.nullMoveStates.pop()
+        self.whiteToMove = not self.whiteToMove
+        self.checkMate = False
+        self.staleMate = False
+
+    '''
+    Compute the Zobrist key of the current position from scratch
+    '''
+
+    def computeZobristKey(self):
+        key = 0
+        for square in boardSquares:
+            key ^= zobristPieces[self.squares[square]][square]
+        if not self.whiteToMove:
+            key ^= zobristBlackToMove
+        if self.enPassantSquare:
+            key ^= zobristEnPassant[squareCols[self.enPassantSquare]]
+        return key ^ zobristCastling[self.castlingRights]
+
+    '''
+    Compute the material and position score of the current position from scratch
+    '''
+
+    def computeBoardScore(self):
+        score = 0
+        for square in boardSquares:
+            score += pieceSquareScores[self.squares[square]][square]
+        return score
+
+    '''
+    Make the undo stack twice as long, for games longer than UNDO_STACK_SIZE moves
+    '''
+
+    def growUndoStack(self):
+        size = len(self.undoKeys)
+        self.undoKeys += [0] * size
+        self.undoScores += [0] * size
+        self.undoStates += [0] * size
+
+    '''
+    Return if the player is in check, the pins as a dict {square of the pinned piece: direction from the king}
+    and a list of checks
     '''
 
     def checkForPinsAndChecks(self):
-        pins = []  # squares where the allied pinned piece is and direction pinned from
+        pins = {}  # squares where the allied pinned piece is: direction pinned from
         checks = []  # squares where enemy is applying a check
         inCheck = False
+        squares = self.squares
         if self.whiteToMove:
-            enemyColor = 'b'
-            allyColor = 'w'
-            startRow = self.whiteKingLocation[0]
-            startCol = self.whiteKingLocation[1]
+            enemyColor = BLACK
+            startSquare = self.whiteKingSquare
         else:
-            enemyColor = 'w'
-            allyColor = 'b'
-            startRow = self.blackKingLocation[0]
-            startCol = self.blackKingLocation[1]
+            enemyColor = WHITE
+            startSquare = self.blackKingSquare
         # check outward from king for pins and checks, keep track of pins
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
+        for j in range(8):
             d = directions[j]
-            possiblePin = ()  # reset possible pins
-            for i in range(1, 8):
-                endRow = startRow + d[0] * i
-                endCol = startCol + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor and endPiece[1] != 'K':
-                        if possiblePin == ():  # 1st allied piece could be pinned
-                            possiblePin = (endRow, endCol, d[0], d[1])
+            possiblePin = None  # reset possible pins
+            endSquare = startSquare + d
+            distance = 1
+            while True:
+                endPiece = squares[endSquare]
+                if endPiece != EMPTY:
+                    if endPiece == OFFBOARD:
+                        break  # off board
+                    if (endPiece & COLOR_MASK) != enemyColor:
+                        if possiblePin is None:  # 1st allied piece could be pinned
+                            possiblePin = endSquare
                         else:  # 2nd allied piece, so no pin or check possible in this direction
                             break
-                    elif endPiece[0] == enemyColor:
-                        typeChess = endPiece[1]
-                        if (0 <= j <= 3 and typeChess == 'R') or \
-                                (4 <= j <= 7 and typeChess == "B") or \
-                                (i == 1 and typeChess == 'p' and (
-                                        (enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
-                                (typeChess == "Q") or (i == 1 and typeChess == "K"):
-                            if possiblePin == (): #no piece blocking, so check
+                    else:
+                        typeChess = endPiece & TYPE_MASK
+                        if (j <= 3 and typeChess == ROOK) or \
+                                (j >= 4 and typeChess == BISHOP) or \
+                                (distance == 1 and typeChess == PAWN and (
+                                        (enemyColor == WHITE and j >= 6) or (enemyColor == BLACK and 4 <= j <= 5))) or \
+                                (typeChess == QUEEN) or (distance == 1 and typeChess == KING):
+                            if possiblePin is None:  # no piece blocking, so check
                                 inCheck = True
-                                checks.append((endRow, endCol, d[0], d[1]))
-                                break
-                            else: #piece blocking so pin
-                                pins.append(possiblePin)
-                                break
-                        else:  # enemy piece not applying check:
-                            break
-                else:
-                    break  # off board
+                                checks.append((endSquare, d))
+                            else:  # piece blocking so pin
+                                pins[possiblePin] = d
+                        break  # enemy piece applying check, pinning or neither
+                endSquare += d
+                distance += 1
         # check for knight checks
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        enemyKnight = enemyColor | KNIGHT
         for m in knightMoves:
-            endRow = startRow + m[0]
-            endCol = startCol + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] == enemyColor and endPiece[1] == 'N':  # enemy knight attack king
-                    inCheck = True
-                    checks.append((endRow, endCol, m[0], m[1]))
+            if squares[startSquare + m] == enemyKnight:  # enemy knight attack king
+                inCheck = True
+                checks.append((startSquare + m, m))
         return inCheck, pins, checks
 
     '''
     All moves considering checks
-    nums = [0,1,2,3,3,4,5]
-    for num in nums:
-        if num == 3:
-            nums.remove(num)
+    In single check the pieces other than the king only generate moves to the evasion squares (capture the
+    checking piece or block its line), in double check only the king moves.
+    With capturesOnly only captures and promotions are generated (for the quiescence search), unless the
+    player is in check: then all the moves getting out of check are returned, so checkmate is still detected.
     '''
 
-    def getValidMoves(self):
-        moves = []
+    def getValidMoves(self, capturesOnly=False):
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
-        if self.whiteToMove:
-            kingRow = self.whiteKingLocation[0]
-            kingCol = self.whiteKingLocation[1]
+        self.capturesOnly = capturesOnly and not self.inCheck
+        kingSquare = self.whiteKingSquare if self.whiteToMove else self.blackKingSquare
+        if len(self.checks) > 1:  # double check, king has to move
+            self.evasionSquares = None
+            moves = []
+            self.getKingMoves(kingSquare, moves)
         else:
-            kingRow = self.blackKingLocation[0]
-            kingCol = self.blackKingLocation[1]
-        if self.inCheck:
-            if len(self.checks) == 1:  # only 1 check, block check or move king
-                moves = self.getAllPossibleMoves()
-                # to block a check you must move a piece into one of the squares between the enemy piece and king
-                check = self.checks[0]  # check information
-                checkRow = check[0]
-                checkCol = check[1]
-                pieceChecking = self.board[checkRow][checkCol]  # enemy piece causing the check
-                validSquares = []  # squares that pieces can move to
-                # if knight, must capture knight or move king, other pieces can be blocked
-                if pieceChecking[1] == 'N':
-                    validSquares = [(checkRow, checkCol)]
-                else:
-                    for i in range(1, 8):
-                        # check[2] and check[3] are the check directions
-                        validSquare = (kingRow + check[2] * i, kingCol + check[3] * i)
-                        validSquares.append(validSquare)
-                        if validSquare[0] == checkRow and validSquare[
-                            1] == checkCol:  # once you get to piece and checks
-                            break
-                # get rid of any moves that don't block check or move king
-                for i in range(len(moves) - 1, -1,
-                               -1):  # go through backwards when you are removing from a list as iterating
-                    if moves[i].pieceMoved[1] != 'K':  # move doesn't move king so it must block or capture
-                        if not (moves[i].endRow,
-                                moves[i].endCol) in validSquares:  # move doesn't block check or capture piece
-                            moves.remove(moves[i])
-            else:  # double check, king has to move
-                self.getKingMoves(kingRow, kingCol, moves)
-        else:  # double check, king has to move
+            if self.inCheck:  # only 1 check, block check, capture the checking piece or move king
+                self.evasionSquares = checkEvasionSquares[kingSquare * 120 + self.checks[0][0]]
+            else:
+                self.evasionSquares = None
             moves = self.getAllPossibleMoves()
 
+        self.setGameOver(moves)
+        return moves
+
+    '''
+    Update the checkmate and stalemate flags for the valid moves just generated
+    '''
+
+    def setGameOver(self, moves):
         if len(moves) == 0:
             if self.inCheck:
                 self.checkMate = True
             else:
-                self.staleMate = False
+                self.staleMate = not self.capturesOnly  # without the quiet moves it's only a quiet position
         else:
             self.checkMate = False
             self.staleMate = False
-        return moves
-
 
     '''
     Determine if the enemy player can attack the square
     '''
 
-    def squareUnderAttack(self, row, col, allyColor): # chưa hiểu sáng mai tìm hiểu kỹ
+    def squareUnderAttack(self, square, allyColor):
         # check outward from square
-        enemyColor = 'w' if allyColor == 'b' else 'b'
-        #directions = ((-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1))
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
+        enemyColor = BLACK if allyColor == WHITE else WHITE
+        squares = self.squares
+        for j in range(8):
             d = directions[j]
-            for i in range(1, 8):
-                endRow = row + d[0] * i
-                endCol = col + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor:  # no attack from that direction
-                        break
-                    elif endPiece[0] == enemyColor:
-                        typeChess = endPiece[1]
-                        # 5 possibilities here in this complex conditional
-                        # 1. orthogonally away from square and piece is a rook
-                        # 2. diagonally away from square and piece is a bishop
-                        # 3. 1 square away diagonally from square and piece is a pawn
-                        # 4. any direction and piece is a queen
-                        # 5. any direction 1 square away and piece is a king
-                        if (0 <= j <= 3 and typeChess == 'R') or \
-                                (4 <= j <= 7 and typeChess == "B") or \
-                                (i == 1 and typeChess == 'p' and (
-                                        (enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
-                                (typeChess == "Q") or (i == 1 and type == "K"):
-                            return True
-                        else:  # enemy piece not applying check:
-                            break
-                else:
-                    break  # off board
+            endSquare = square + d
+            endPiece = squares[endSquare]
+            if endPiece != EMPTY:  # a piece next to the square
+                if (endPiece & COLOR_MASK) == enemyColor:
+                    typeChess = endPiece & TYPE_MASK
+                    # 5 possibilities here in this complex conditional
+                    # 1. orthogonally away from square and piece is a rook
+                    # 2. diagonally away from square and piece is a bishop
+                    # 3. 1 square away diagonally from square and piece is a pawn
+                    # 4. any direction and piece is a queen
+                    # 5. any direction 1 square away and piece is a king
+                    if (j <= 3 and typeChess == ROOK) or \
+                            (j >= 4 and typeChess == BISHOP) or \
+                            (typeChess == PAWN and (
+                                    (enemyColor == WHITE and j >= 6) or (enemyColor == BLACK and 4 <= j <= 5))) or \
+                            (typeChess == QUEEN) or (typeChess == KING):
+                        return True
+                continue
+            while endPiece == EMPTY:
+                endSquare += d
+                endPiece = squares[endSquare]
+            if (endPiece & COLOR_MASK) == enemyColor:
+                typeChess = endPiece & TYPE_MASK
+                if typeChess == QUEEN or typeChess == (ROOK if j <= 3 else BISHOP):
+                    return True
         # check for knight checks
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+        enemyKnight = enemyColor | KNIGHT
         for m in knightMoves:
-            endRow = row + m[0]
-            endCol = col + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] == enemyColor and endPiece[1] == 'N':  # enemy knight attack king
-                    return True
+            if squares[square + m] == enemyKnight:  # enemy knight attack king
+                return True
 
         return False
 
@@ -329,261 +738,255 @@ class GameState():
 
     def getAllPossibleMoves(self):
         moves = []
-        for row in range(len(self.board)):
-            for col in range(len(self.board)):
-                turn = self.board[row][col][0]
-                if (turn == "w" and self.whiteToMove) or (turn == "b" and not self.whiteToMove):
-                    piece = self.board[row][col][1]
-                    self.moveFunctions[piece](row, col,
-                                              moves)  # calls the appropriate move function based on piece type
+        squares = self.squares
+        allyColor = WHITE if self.whiteToMove else BLACK
+        for square in boardSquares:
+            piece = squares[square]
+            if (piece & COLOR_MASK) == allyColor:
+                # calls the appropriate move function based on piece type
+                self.moveFunctions[piece & TYPE_MASK](square, moves)
         return moves
 
     '''
-    Get all the pawn moves for the pawn located at row,col and add these moves to the list
+    Get all the pawn moves for the pawn located at square and add these moves to the list
     '''
 
-    def getPawnMoves(self, row, col, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-
+    def getPawnMoves(self, square, moves):
+        pinDirection = self.pins.get(square, 0)
+        evasionSquares = self.evasionSquares
+        squares = self.squares
+        pawn = squares[square]
         if self.whiteToMove:
-            moveAmount = -1
+            moveAmount = -10
             startRow = 6
-            enemyColor = 'b'
-            kingRow, kingCol = self.whiteKingLocation
+            enemyColor = BLACK
         else:
-            moveAmount = 1
+            moveAmount = 10
             startRow = 1
-            enemyColor = 'w'
-            kingRow, kingCol = self.blackKingLocation
-
-        if self.board[row + moveAmount][col] == "--":  # 1 square move
-            if not piecePinned or pinDirection == (moveAmount, 0):
-                moves.append(Move((row, col), (row + moveAmount, col), self.board))
-                if row == startRow and self.board[row + 2 * moveAmount][col] == "--":  # 2 squares moves
-                    moves.append(Move((row, col), (row + 2 * moveAmount, col), self.board))
-
-        if col - 1 >= 0:  # capture to left
-            if not piecePinned or pinDirection == (moveAmount, -1):
-                if self.board[row + moveAmount][col - 1][0] == enemyColor:
-                    moves.append(Move((row, col), (row + moveAmount, col - 1), self.board))
-                if (row + moveAmount, col - 1) == self.enPassantPossible:
-                    attackingPiece = blockingPiece = False
-                    if kingRow == row:
-                        if kingCol < col:  # king is left of the pawn
-                            # inside between king and pawn; outside range between pawn border
-                            insideRange = range(kingCol + 1, col - 1)
-                            outsideRange = range(col + 1, 8)
-                        else:  # king right of the pawn
-                            insideRange = range(kingCol - 1, col, -1)
-                            outsideRange = range(col - 2, -1, -1)
-                        for i in insideRange:
-                            if self.board[row][i] != '--':  # some other piece beside en-passant pawn blocks
-                                blockingPiece = True
-                        for i in outsideRange:
-                            square = self.board[row][i]
-                            if square[0] == enemyColor and (square[1] == 'R' or square[1] == 'Q'):
-                                attackingPiece = True
-                            elif square != '--':
-                                blockingPiece = True
-                    if not attackingPiece or blockingPiece:
-                        moves.append(Move((row, col), (row + moveAmount, col - 1), self.board, enPassant=True))
-
-        if col + 1 <= 7:  # capture to right
-            if not piecePinned or pinDirection == (moveAmount, 1):
-                if self.board[row + moveAmount][col + 1][0] == enemyColor:
-                    moves.append(Move((row, col), (row + moveAmount, col + 1), self.board))
-                if (row + moveAmount, col + 1) == self.enPassantPossible:
-                    attackingPiece = blockingPiece = False
-                    if kingRow == row:
-                        if kingCol < col:  # king is left of the pawn
-                            # inside between king and pawn; outside range between pawn border
-                            insideRange = range(kingCol + 1, col)
-                            outsideRange = range(col + 2, 8)
-                        else:  # king right of the pawn
-                            insideRange = range(kingCol - 1, col + 1, -1)
-                            outsideRange = range(col - 1, -1, -1)
-                        for i in insideRange:
-                            if self.board[row][i] != '--':  # some other piece beside en-passant pawn blocks
-                                blockingPiece = True
-                        for i in outsideRange:
-                            square = self.board[row][i]
-                            if square[0] == enemyColor and (square[1] == 'R' or square[1] == 'Q'):
-                                attackingPiece = True
-                            elif square != '--':
-                                blockingPiece = True
-                    if not attackingPiece or blockingPiece:
-                        moves.append(Move((row, col), (row + moveAmount, col + 1), self.board, enPassant=True))
-
-    '''
-    Get all the rook moves for the pawn located at row,col and add these moves to the list
-    '''
-
-    def getRookMoves(self, row, col, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                if self.board[row][col][1] != 'Q':
-                    # can't remove queen from pin on rook moves, only remove it on bishop moves
-                    self.pins.remove(self.pins[i])
-                break
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1))  # (up,left,down,right)
-        enemyColor = 'b' if self.whiteToMove else 'w'
-        for d in directions:
-            for i in range(1, 8):
-                endRow = row + d[0] * i
-                endCol = col + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:  # on board
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":  # empty square valid
-                            moves.append(Move((row, col), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:  # enemy piece valid
-                            moves.append(Move((row, col), (endRow, endCol), self.board))
-                            break
-                        else:  # friendly piece invalid
-                            break
-                else:  # off board
-                    break
+            enemyColor = WHITE
+
+        endSquare = square + moveAmount
+        if squares[endSquare] == EMPTY:  # 1 square move
+            if not pinDirection or pinDirection == moveAmount or pinDirection == -moveAmount:
+                promotion = squareRows[endSquare] == 0 or squareRows[endSquare] == 7
+                if (not self.capturesOnly or promotion) and (evasionSquares is None or endSquare in evasionSquares):
+                    self.addPawnMoves(square, endSquare, pawn, EMPTY, moves)
+                if squareRows[square] == startRow and squares[endSquare + moveAmount] == EMPTY \
+                        and not self.capturesOnly \
+                        and (evasionSquares is None or endSquare + moveAmount in evasionSquares):  # 2 squares moves
+                    moves.append(Move.fromSquares(square, endSquare + moveAmount, pawn, EMPTY))
+
+        enPassantSquare = self.enPassantSquare
+        for captureDirection in (moveAmount - 1, moveAmount + 1):  # capture to left, capture to right
+            if not pinDirection or pinDirection == captureDirection or pinDirection == -captureDirection:
+                endSquare = square + captureDirection
+                endPiece = squares[endSquare]
+                if (endPiece & COLOR_MASK) == enemyColor:
+                    if evasionSquares is None or endSquare in evasionSquares:
+                        self.addPawnMoves(square, endSquare, pawn, endPiece, moves)
+                elif endSquare == enPassantSquare and (evasionSquares is None or endSquare in evasionSquares or
+                                                       endSquare - moveAmount in evasionSquares) \
+                        and self.enPassantIsLegal(square, endSquare):
+                    # in check en passant can block the check or capture the checking pawn beside the pawn
+                    moves.append(Move.fromSquares(square, endSquare, pawn, enemyColor | PAWN, enPassant=True))
+
+    '''
+    Add the pawn move from startSquare to endSquare, or one move per promotion piece when it reaches the last
+    row. The quiescence search only needs the queen promotions.
+    '''
+
+    def addPawnMoves(self, startSquare, endSquare, pawn, pieceCaptured, moves):
+        if squareRows[endSquare] == 0 or squareRows[endSquare] == 7:
+            for promotionPiece in ("Q",) if self.capturesOnly else promotionPieces:
+                moves.append(Move.fromSquares(startSquare, endSquare, pawn, pieceCaptured,
+                                              promotionPiece=promotionPiece))
+        else:
+            moves.append(Move.fromSquares(startSquare, endSquare, pawn, pieceCaptured))
+
+    '''
+    An en passant capture removes two pawns from the row of the capturing pawn, which can expose the king
+    to a rook or queen along that row. Play the capture on the board and see if the king is attacked.
+    '''
+
+    def enPassantIsLegal(self, startSquare, endSquare):
+        squares = self.squares
+        capturedSquare = startSquare - squareCols[startSquare] + squareCols[endSquare]
+        pawn = squares[startSquare]
+        capturedPawn = squares[capturedSquare]
+        squares[startSquare] = squares[capturedSquare] = EMPTY
+        squares[endSquare] = pawn
+        kingSquare = self.whiteKingSquare if self.whiteToMove else self.blackKingSquare
+        legal = not self.squareUnderAttack(kingSquare, pawn & COLOR_MASK)
+        squares[endSquare] = EMPTY
+        squares[startSquare] = pawn
+        squares[capturedSquare] = capturedPawn
+        return legal
+
+    '''
+    Get all the moves along the given directions for the rook, bishop or queen located at square
+    '''
+
+    def getSlidingMoves(self, square, moves, pieceDirections, pinDirection):
+        squares = self.squares
+        piece = squares[square]
+        enemyColor = BLACK if self.whiteToMove else WHITE
+        capturesOnly = self.capturesOnly
+        evasionSquares = self.evasionSquares
+        for d in pieceDirections:
+            if not pinDirection or pinDirection == d or pinDirection == -d:
+                endSquare = square + d
+                endPiece = squares[endSquare]
+                while endPiece == EMPTY:  # empty square valid
+                    if not capturesOnly and (evasionSquares is None or endSquare in evasionSquares):
+                        moves.append(Move.fromSquares(square, endSquare, piece, EMPTY))
+                    endSquare += d
+                    endPiece = squares[endSquare]
+                if (endPiece & COLOR_MASK) == enemyColor:  # enemy piece valid, friendly piece or off board invalid
+                    if evasionSquares is None or endSquare in evasionSquares:
+                        moves.append(Move.fromSquares(square, endSquare, piece, endPiece))
+
+    '''
+    Get all the rook moves for the pawn located at square and add these moves to the list
+    '''
+
+    def getRookMoves(self, square, moves):
+        self.getSlidingMoves(square, moves, rookDirections, self.pins.get(square, 0))
 
     '''
-    Get all the knight moves for the pawn located at row,col and add these moves to the list
+    Get all the knight moves for the pawn located at square and add these moves to the list
     '''
 
-    def getKnightMoves(self, row, col, moves):
-        piecePinned = False
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piecePinned = True
-                self.pins.remove(self.pins[i])
-                break
-        knightMoves = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
-        allyColor = 'w' if self.whiteToMove else 'b'
+    def getKnightMoves(self, square, moves):
+        if square in self.pins:
+            return  # a pinned knight can never move
+        squares = self.squares
+        knight = squares[square]
+        enemyColor = BLACK if self.whiteToMove else WHITE
+        evasionSquares = self.evasionSquares
         for m in knightMoves:
-            endRow = row + m[0]
-            endCol = col + m[1]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                if not piecePinned:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] != allyColor:
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-
-    '''
-    Get all the bishop moves for the pawn located at row,col and add these moves to the list
-    '''
-
-    def getBishopMoves(self, row, col, moves):
-        piecePinned = False
-        pinDirection = ()
-        for i in range(len(self.pins) - 1, -1, -1):
-            if self.pins[i][0] == row and self.pins[i][1] == col:
-                piecePinned = True
-                pinDirection = (self.pins[i][2], self.pins[i][3])
-                self.pins.remove(self.pins[i])
-                break
-        directions = ((-1, -1), (1, -1), (1, 1), (-1, 1))  # (up_left,down_left,up_right,down_right)
-        enemyColor = 'b' if self.whiteToMove else 'w'
-        for d in directions:
-            for i in range(1, 8):  # bishop can move max of 7 squares
-                endRow = row + d[0] * i
-                endCol = col + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    if not piecePinned or pinDirection == d or pinDirection == (-d[0], -d[1]):
-                        endPiece = self.board[endRow][endCol]
-                        if endPiece == "--":  # empty square valid
-                            moves.append(Move((row, col), (endRow, endCol), self.board))
-                        elif endPiece[0] == enemyColor:  # enemy piece valid
-                            moves.append(Move((row, col), (endRow, endCol), self.board))
-                            break
-                        else:  # friendly piece invalid
-                            break
-                else:  # off board
-                    break
+            endPiece = squares[square + m]
+            if evasionSquares is not None and square + m not in evasionSquares:
+                continue
+            if endPiece == EMPTY:
+                if not self.capturesOnly:
+                    moves.append(Move.fromSquares(square, square + m, knight, EMPTY))
+            elif (endPiece & COLOR_MASK) == enemyColor:
+                moves.append(Move.fromSquares(square, square + m, knight, endPiece))
 
     '''
-    Get all the queen moves for the pawn located at row,col and add these moves to the list
+    Get all the bishop moves for the pawn located at square and add these moves to the list
     '''
 
-    def getQueenMoves(self, row, col, moves):
-        self.getRookMoves(row, col, moves)
-        self.getBishopMoves(row, col, moves)
+    def getBishopMoves(self, square, moves):
+        self.getSlidingMoves(square, moves, bishopDirections, self.pins.get(square, 0))
 
     '''
-    Get all the king moves for the pawn located at row,col and add these moves to the list
+    Get all the queen moves for the pawn located at square and add these moves to the list
     '''
 
-    def getKingMoves(self, row, col, moves):
-        rowMoves = (-1, -1, -1, 0, 0, 1, 1, 1)
-        colMoves = (-1, 0, 1, -1, 1, -1, 0, 1)
-        allyColor = "w" if self.whiteToMove else "b"
-        for i in range(8):
-            endRow = row + rowMoves[i]
-            endCol = col + colMoves[i]
-            if 0 <= endRow < 8 and 0 <= endCol < 8:
-                endPiece = self.board[endRow][endCol]
-                if endPiece[0] != allyColor:  # not an ally piece enpty or eenemy piece
-                    # place king on end square and check for checks
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (endRow, endCol)
-                    else:
-                        self.blackKingLocation = (endRow, endCol)
-                    inCheck, pins, checks = self.checkForPinsAndChecks()
-                    if not inCheck:
-                        moves.append(Move((row, col), (endRow, endCol), self.board))
-                    # place king back on original location
-                    if allyColor == 'w':
-                        self.whiteKingLocation = (row, col)
-                    else:
-                        self.blackKingLocation = (row, col)
-        self.getCastleMoves(row, col, moves, allyColor)
+    def getQueenMoves(self, square, moves):
+        self.getSlidingMoves(square, moves, directions, self.pins.get(square, 0))
 
     '''
-    Generate all valid castle moves for the kings at (row, col) and add them to the list of moves
+    Get all the king moves for the pawn located at square and add these moves to the list
     '''
 
-    def getCastleMoves(self, row, col, moves, allyColor):
-        inCheck = self.squareUnderAttack(row, col, allyColor)
-        if inCheck:
+    def getKingMoves(self, square, moves):
+        squares = self.squares
+        king = squares[square]
+        allyColor = king & COLOR_MASK
+        enemyColor = BLACK if allyColor == WHITE else WHITE
+        # lift the king off the board, so it doesn't hide the squares behind it from sliding attackers
+        squares[square] = EMPTY
+        for d in directions:
+            endSquare = square + d
+            endPiece = squares[endSquare]
+            if (endPiece == EMPTY and not self.capturesOnly) or (endPiece & COLOR_MASK) == enemyColor:
+                # not an ally piece enpty or eenemy piece, check for checks on the end square
+                if not self.squareUnderAttack(endSquare, allyColor):
+                    moves.append(Move.fromSquares(square, endSquare, king, endPiece))
+        # place king back on original location
+        squares[square] = king
+        if not self.capturesOnly:
+            self.getCastleMoves(square, moves, allyColor)
+
+    '''
+    Generate all valid castle moves for the kings at square and add them to the list of moves
+    '''
+
+    def getCastleMoves(self, square, moves, allyColor):
+        if self.inCheck:
             return  # can't castle in check
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (
-                not self.whiteToMove and self.currentCastlingRight.bks):
-            self.getKingsideCastleMoves(row, col, moves, allyColor)
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (
-                not self.whiteToMove and self.currentCastlingRight.bqs):
-            self.getQueensideCastleMoves(row, col, moves, allyColor)
+        if self.castlingRights & (WHITE_KINGSIDE if self.whiteToMove else BLACK_KINGSIDE):
+            self.getKingsideCastleMoves(square, moves, allyColor)
+        if self.castlingRights & (WHITE_QUEENSIDE if self.whiteToMove else BLACK_QUEENSIDE):
+            self.getQueensideCastleMoves(square, moves, allyColor)
 
     '''
-    Generate kingside castle moves for the king at (row, col).
+    Generate kingside castle moves for the king at square.
     This method will only be called if player still has castle rights kingside
     '''
 
-    def getKingsideCastleMoves(self, row, col, moves, allyColor):
+    def getKingsideCastleMoves(self, square, moves, allyColor):
         # check if two square between king and rook are clear and not under attack
-        if self.board[row][col + 1] == '--' and self.board[row][col + 2] == '--' \
-                and not self.squareUnderAttack(row, col + 1, allyColor) \
-                and not self.squareUnderAttack(row, col + 2, allyColor):
-            moves.append(Move((row, col), (row, col + 2), self.board, castle=True))
+        if self.squares[square + 1] == EMPTY and self.squares[square + 2] == EMPTY \
+                and not self.squareUnderAttack(square + 1, allyColor) \
+                and not self.squareUnderAttack(square + 2, allyColor):
+            moves.append(Move.fromSquares(square, square + 2, self.squares[square], EMPTY, castle=True))
 
     '''
-    Generate queenside castle moves for the king at (row, col).
+    Generate queenside castle moves for the king at square.
     This method will only be called if player still has castle rights queenside
     '''
 
-    def getQueensideCastleMoves(self, row, col, moves, allyColor):
+    def getQueensideCastleMoves(self, square, moves, allyColor):
         # check if three square between king and rook are clear and two squares left of king are not under attack
-        if self.board[row][col - 1] == '--' and self.board[row][col - 2] == '--' and self.board[row][col - 3] == '--' \
-                and not self.squareUnderAttack(row, col - 1, allyColor) \
-                and not self.squareUnderAttack(row, col - 2, allyColor):
-            moves.append(Move((row, col), (row, col - 2), self.board, castle=True))
+        if self.squares[square - 1] == EMPTY and self.squares[square - 2] == EMPTY \
+                and self.squares[square - 3] == EMPTY \
+                and not self.squareUnderAttack(square - 1, allyColor) \
+                and not self.squareUnderAttack(square - 2, allyColor):
+            moves.append(Move.fromSquares(square, square - 2, self.squares[square], EMPTY, castle=True))
+
+
+'''
+Read only view of the mailbox as the old 8 x 8 list of two character strings: board[row][col] == "wp" or "--".
+Kept for the UI and for code written against the 2-D list, the engine itself uses GameState.squares.
+'''
+
+
+class BoardView:
+    def __init__(self, squares):
+        self.squares = squares
+
+    def __getitem__(self, row):
+        if not 0 <= row < 8:
+            raise IndexError("board row out of range")
+        return BoardRowView(self.squares, toSquare(row, 0))
+
+    def __len__(self):
+        return 8
+
+    def __iter__(self):
+        for row in range(8):
+            yield self[row]
+
+
+class BoardRowView:
+    def __init__(self, squares, firstSquare):
+        self.squares = squares
+        self.firstSquare = firstSquare
+
+    def __getitem__(self, col):
+        if not 0 <= col < 8:
+            raise IndexError("board column out of range")
+        return pieceNames[self.squares[self.firstSquare + col]]
+
+    def __len__(self):
+        return 8
+
+    def __iter__(self):
+        for col in range(8):
+            yield pieceNames[self.squares[self.firstSquare + col]]
 
 
 class CastleRights:
@@ -593,6 +996,18 @@ class CastleRights:
         self.wqs = wqs
         self.bqs = bqs
 
+    '''
+    Pack the four rights into a number from 0 to 15, used to index the Zobrist castling keys
+    '''
+
+    def getIndex(self):
+        return self.wks | self.bks << 1 | self.wqs << 2 | self.bqs << 3
+
+    @classmethod
+    def fromIndex(cls, index):
+        return cls(bool(index & WHITE_KINGSIDE), bool(index & BLACK_KINGSIDE), bool(index & WHITE_QUEENSIDE),
+                   bool(index & BLACK_QUEENSIDE))
+
 
 class Move:
     # maps keys to values
@@ -606,28 +1021,94 @@ class Move:
                    "e": 4, "f": 5, "g": 6, "h": 7}
     colsToFiles = {v: k for k, v in filesToCols.items()}
 
-    def __init__(self, startSq, endSq, board, enPassant=False, castle=False):
-        self.startRow = startSq[0]
-        self.startCol = startSq[1]
-        self.endRow = endSq[0]
-        self.endCol = endSq[1]
-        self.pieceMoved = board[self.startRow][self.startCol]
-        self.pieceCaptured = board[self.endRow][self.endCol]
-        # pawn promotion
-        self.pawnPromotion = self.pieceMoved[1] == 'p' and (self.endRow == 0 or self.endRow == 7)
-        # castle move
-        self.castle = castle
-        # en passant
-        self.enPassant = enPassant
-        if self.enPassant:
-            self.pieceCaptured = 'wp' if self.pieceMoved == 'bp' else 'bp'  # tốt bị chặn ăn chéo
+    # A move is its packed 16 bit moveID (see packMove) plus the pieces it moves and captures. Everything else,
+    # rows and cols, piece names and flags, is worked out from those when asked for, so the move generators
+    # only pay for what the search reads.
+    __slots__ = ("moveID", "startSquare", "endSquare", "pieceMovedCode", "pieceCapturedCode")
+
+    def __init__(self, startSq, endSq, board, enPassant=False, castle=False, promotionPiece="Q"):
+        startRow, startCol = startSq
+        endRow, endCol = endSq
+        pieceMoved = board[startRow][startCol]
+        pieceCaptured = board[endRow][endCol]
+        # the flags follow from the board, so a move built from the player's clicks equals the generated one
+        if pieceMoved[1] == 'K' and abs(endCol - startCol) == 2:
+            castle = True
+        elif pieceMoved[1] == 'p' and startCol != endCol and pieceCaptured == '--':
+            enPassant = True
+        if enPassant:
+            pieceCaptured = 'wp' if pieceMoved == 'bp' else 'bp'  # tốt bị chặn ăn chéo
+        self.startSquare = toSquare(startRow, startCol)
+        self.endSquare = toSquare(endRow, endCol)
+        self.pieceMovedCode = pieceCodes[pieceMoved]
+        self.pieceCapturedCode = pieceCodes[pieceCaptured]
+        self.moveID = packMove(self.startSquare, self.endSquare, self.pieceMovedCode, enPassant, castle,
+                               promotionPiece)
 
-        self.isCapture = self.pieceCaptured != '--'
-        self.moveID = self.startRow * 1000 + self.startCol * 100 + self.endRow * 10 + self.endCol
-        # print(self.moveID)
+    '''
+    Build a move from mailbox squares and piece codes, as the move generators do
+    '''
+
+    @classmethod
+    def fromSquares(cls, startSquare, endSquare, pieceMoved, pieceCaptured, enPassant=False, castle=False,
+                    promotionPiece="Q"):
+        move = cls.__new__(cls)
+        move.startSquare = startSquare
+        move.endSquare = endSquare
+        move.pieceMovedCode = pieceMoved
+        move.pieceCapturedCode = pieceCaptured
+        if enPassant or castle or (pieceMoved & TYPE_MASK) == PAWN:
+            move.moveID = packMove(startSquare, endSquare, pieceMoved, enPassant, castle, promotionPiece)
+        else:  # the usual case, packMove inlined
+            move.moveID = squareIndexes[startSquare] | squareIndexes[endSquare] << 6
+        return move
+
+    @property
+    def startRow(self):
+        return squareRows[self.startSquare]
+
+    @property
+    def startCol(self):
+        return squareCols[self.startSquare]
+
+    @property
+    def endRow(self):
+        return squareRows[self.endSquare]
+
+    @property
+    def endCol(self):
+        return squareCols[self.endSquare]
+
+    @property
+    def pieceMoved(self):
+        return pieceNames[self.pieceMovedCode]
+
+    @property
+    def pieceCaptured(self):
+        return pieceNames[self.pieceCapturedCode]
+
+    @property
+    def isCapture(self):
+        return self.pieceCapturedCode != EMPTY
+
+    @property
+    def pawnPromotion(self):
+        return self.moveID >> 14 == PROMOTION_MOVE
+
+    @property
+    def enPassant(self):
+        return self.moveID >> 14 == EN_PASSANT_MOVE
+
+    @property
+    def castle(self):
+        return self.moveID >> 14 == CASTLE_MOVE
+
+    @property
+    def promotionPiece(self):  # "Q", "R", "B" or "N", "" if the move is not a promotion
+        return promotionPieces[self.moveID >> 12 & 3] if self.moveID >> 14 == PROMOTION_MOVE else ""
 
     '''
-    Overriding the equals method
+    Overriding the equals method, two moves are equal when they have the same packed value
     '''
 
     def __eq__(self, other):
@@ -635,9 +1116,13 @@ class Move:
             return self.moveID == other.moveID
         return False
 
+    def __hash__(self):
+        return self.moveID
+
     def getChessNotation(self):
         # you can add to make this like real chess notation
-        return str(self.getRankFile(self.startRow, self.startCol)) + str(self.getRankFile(self.endRow, self.endCol))
+        return str(self.getRankFile(self.startRow, self.startCol)) + str(self.getRankFile(self.endRow, self.endCol)) \
+            + self.promotionPiece.lower()
 
     def getRankFile(self, row, col):
         return self.colsToFiles[col] + self.rowToRanks[row]
@@ -1,8 +1,11 @@
+import os
+
 import pygame as p
 
 import ChessEngine
 import SmartMoveFinder
-from multiprocessing import Process, Queue
+from EngineWorker import EngineWorker
+from OpeningBook import OpeningBook
 
 BOARD_WIDTH = BOARD_HEIGHT = 512 # kích thước của bàn cờ 8 x 8
 MOVE_LOG_PANEL_WIDTH = 250 # chiều rộng của phần hiển thị nước cờ
@@ -10,6 +13,10 @@ MOVE_LOG_PANEL_HEIGHT = BOARD_HEIGHT # chiều dài của phần hiển thị n
 DIMENSION = 8 # kích thước bàn cờ gồm 8 ô
 Square_SIZE = BOARD_HEIGHT // DIMENSION # kích thước của mỗi ô vuông tiêu chuẩn
 MAX_FPS = 15  # for animations
+MOVE_GENERATOR = "mailbox"  # or "bitboard", see ChessEngine.newGameState
+SEARCH_PROCESSES = 1  # more than 1 splits the AI search over that many processes, see ParallelSearch
+PONDER = True  # let the AI think about its next move while the human thinks
+BOOK_FILE = "book.bin"  # Polyglot opening book the AI plays from while it can, see OpeningBook
 IMAGES = {}
 
 '''
@@ -30,7 +37,7 @@ def main():
     clock = p.time.Clock()
     #screen.fill(p.Color("pink"))
     moveLogFont = p.font.SysFont("Times New Roman", 12, False, False) # thông số của các nước đi
-    gs = ChessEngine.GameState()
+    gs = ChessEngine.newGameState(MOVE_GENERATOR)
     validMoves = gs.getValidMoves()
     moveMade = False  # flag variable for when a move is made
     animate = False  # flag variable for when we should animate a move
@@ -42,7 +49,8 @@ def main():
     playerOne = False # if a Human is playing white, then this will be True. If an AI is playing
     playerTwo = True  # Same as above for black
     AIThingking = False
-    moveFinderProcess = None
+    engine = EngineWorker(MOVE_GENERATOR, SEARCH_PROCESSES)  # searches in its own process, kept for the whole game
+    book = OpeningBook(BOOK_FILE) if os.path.exists(BOOK_FILE) else None
     moveUndone = False
     while running:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
@@ -81,41 +89,47 @@ def main():
                     moveMade = True
                     animate = False
                     gameOver = False
-                    if AIThingking:
-                        moveFinderProcess.terminate()
-                        AIThingking = False
+                    engine.cancel()  # stop thinking or pondering
+                    AIThingking = False
                     moveUndone = True
                 if e.key == p.K_r:  # Sau khi kết thúc, ta có thể bấm "r" để bắt đầu một game đấu mới
-                    gs = ChessEngine.GameState()
+                    gs = ChessEngine.newGameState(MOVE_GENERATOR)
                     validMoves = gs.getValidMoves()
                     squareSelected = ()
                     playerClicks = []
                     moveMade = True
                     animate = False
                     gameOver = False
-                    if AIThingking:
-                        moveFinderProcess.terminate()
-                        AIThingking = False
+                    engine.cancel()  # stop thinking or pondering
+                    AIThingking = False
                     moveUndone = True
 
         # AI move finder:
         if not gameOver and not humanTurn and not moveUndone:
-            if not AIThingking:
+            bookMove = book.chooseMove(gs, validMoves) if book is not None and not AIThingking else None
+            if bookMove is not None:  # played straight away, no search
+                engine.cancel()  # stop pondering
+                gs.makeMove(bookMove)
+                moveMade = True
+                animate = True
+            elif not AIThingking:
                 AIThingking = True
                 print("thinking....")
-                returnQueue = Queue()  # used to pass data between threads
-                moveFinderProcess = Process(target=SmartMoveFinder.findBestMoves, args=(gs, validMoves, returnQueue))
-                moveFinderProcess.start()  # call findBestMoves(gs, validMoves, returnQueue)
+                engine.search(gs)
 
-            if not moveFinderProcess.is_alive():
+            result = engine.getResult() if bookMove is None else None
+            if result is not None:
                 print("don't thinking......")
-                AIMove = returnQueue.get()
+                AIMove = result.findMove(validMoves)
                 if AIMove is None:
                     AIMove = SmartMoveFinder.findRandomMove(validMoves)
                 gs.makeMove(AIMove)
                 moveMade = True
                 animate = True
                 AIThingking = False
+                humanNext = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
+                if PONDER and humanNext and result.ponderMove is not None and result.move == AIMove.getChessNotation():
+                    engine.ponder(gs, result.ponderMove)  # think on the human's time about the reply expected
 
         if moveMade:
             if animate:
@@ -146,6 +160,9 @@ def main():
 
         clock.tick(MAX_FPS)
         p.display.flip() # cập nhật nội dung của toàn bộ màn hình ( bao gồm cả phần chơi và phần hiển thị nước cờ).
+    engine.close()
+    if book is not None:
+        book.close()
 
 
 '''
@@ -0,0 +1,305 @@
+'''
+Engine service: an asyncio server that searches positions for many clients (games) at once. Clients connect to a
+local TCP socket and send requests as JSON lines; a request is queued, and one of a pool of EngineWorker processes,
+each with its searcher kept warm from one request to the next, searches it as soon as it is free.
+    python EngineService.py --port 8765 --workers 4
+Requests, one JSON object per line:
+    {"id": 1, "fen": "<FEN>", "moves": ["e2e4", "e7e5"], "time": 500, "depth": 8, "nodes": 100000, "deadline": 2000}
+        search the position after the moves (fen defaults to the start position, moves to none) within the time
+        (milliseconds), depth and nodes given, time defaulting to TIME_LIMIT when no limit is given. deadline is
+        the milliseconds the client can wait for the answer: a request still queued then is dropped, and the
+        search stops in time to answer before it.
+    {"cancel": 1}
+        drop the request with that id, queued or searching
+    {"status": true}
+        queue length, searches running and cache statistics
+Replies, one JSON object per line, in the order the searches finish:
+    {"id": 1, "move": "g1f3", "score": 0.2, "depth": 6, "pv": ["g1f3", "b8c6"], "nodes": 35000, "cached": false}
+    {"id": 1, "error": "cancelled"}  (or "queue full", "deadline exceeded", "engine worker died", a position
+                                      that is not valid, ...)
+A request finding the queue full (QUEUE_SIZE requests waiting) is answered "queue full" straight away, for the
+client to try again later, instead of the queue growing without limit. Results are cached by the Zobrist key of
+the position and the limits of the search (LRU, CACHE_SIZE results), so the same request is answered without a
+search; a search cut short by its deadline or cancelled is not cached.
+'''
+import argparse
+import asyncio
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import time
+
+import ChessEngine
+from EngineWorker import EngineWorker, playMoves
+from SmartMoveFinder import TIME_LIMIT, MAX_DEPTH
+
+PORT = 8765
+QUEUE_SIZE = 256  # requests waiting for a worker, more are turned away
+CACHE_SIZE = 4096  # search results kept
+DEADLINE_MARGIN = 50  # milliseconds of a deadline kept for sending the answer
+MAX_LINE = 1 << 16  # longest request line accepted, in bytes
+POLL_INTERVAL = 0.5  # seconds between two checks that the worker of a running search is still alive
+
+'''
+A request of a client: the position and limits of the search, and where to send the answer
+'''
+
+
+class Job:
+    def __init__(self, requestId, client, gs, timeLimit, nodeLimit, maxDepth, deadline):
+        self.requestId = requestId
+        self.client = client
+        self.gs = gs
+        self.timeLimit = timeLimit
+        self.nodeLimit = nodeLimit
+        self.maxDepth = maxDepth
+        self.deadline = deadline  # time.time() the answer is due, None for no deadline
+        self.cacheKey = (gs.zobristKey, timeLimit, nodeLimit, maxDepth)
+        self.worker = None  # the EngineWorker searching it
+        self.cancelled = False
+
+
+'''
+A connected client: sends its replies and keeps its requests not answered yet, by id
+'''
+
+
+class Client:
+    def __init__(self, writer):
+        self.writer = writer
+        self.jobs = {}
+
+    def send(self, reply):
+        if not self.writer.is_closing():
+            self.writer.write((json.dumps(reply) + "\n").encode())
+
+
+class EngineService:
+    def __init__(self, workers=os.cpu_count() or 1, backend="mailbox", queueSize=QUEUE_SIZE, cacheSize=CACHE_SIZE):
+        self.workers = [EngineWorker(backend) for i in range(max(1, workers))]
+        # every worker's result is waited for in a thread of its own, the event loop never blocks on a worker
+        self.executor = concurrent.futures.ThreadPoolExecutor(len(self.workers))
+        self.backend = backend
+        self.queue = asyncio.Queue(queueSize)
+        self.cache = collections.OrderedDict()  # cache key: reply without the id, least recently used first
+        self.cacheSize = cacheSize
+        self.cacheHits = 0
+        self.cacheMisses = 0
+        self.running = 0  # searches running
+        self.served = 0  # requests answered with a move
+
+    '''
+    Serve clients on the local socket until cancelled
+    '''
+
+    async def serve(self, host="127.0.0.1", port=PORT):
+        dispatchers = [asyncio.create_task(self.dispatch(worker)) for worker in self.workers]
+        server = await asyncio.start_server(self.handleClient, host, port, limit=MAX_LINE)
+        print("engine service on " + host + ":" + str(port) + " with " + str(len(self.workers)) + " workers",
+              file=sys.stderr)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+            self.close()
+
+    async def handleClient(self, reader, writer):
+        client = Client(writer)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, ConnectionError):  # line too long or connection lost
+                    break
+                if not line:
+                    break
+                self.handleRequest(client, line)
+                await writer.drain()
+        finally:
+            for job in list(client.jobs.values()):  # nobody left to answer
+                self.cancel(job)
+            writer.close()
+
+    def handleRequest(self, client, line):
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("a request is a JSON object")
+        except ValueError as error:
+            client.send({"error": "bad request: " + str(error)})
+            return
+        if "cancel" in request:
+            job = client.jobs.get(request["cancel"])
+            if job is not None:
+                self.cancel(job)
+            return
+        if "status" in request:
+            client.send(self.status())
+            return
+        requestId = request.get("id")
+        if not isinstance(requestId, (str, int)):
+            client.send({"error": "a request needs an id, a string or a number"})
+            return
+        if requestId in client.jobs:
+            client.send({"id": requestId, "error": "request id in use"})
+            return
+        try:
+            job = self.createJob(client, request)
+        except (ValueError, TypeError) as error:
+            client.send({"id": requestId, "error": str(error)})
+            return
+        reply = self.cache.get(job.cacheKey)
+        if reply is not None:
+            self.cache.move_to_end(job.cacheKey)
+            self.cacheHits += 1
+            client.send(dict(reply, id=requestId, cached=True))
+            return
+        self.cacheMisses += 1
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            client.send({"id": requestId, "error": "queue full"})
+            return
+        client.jobs[requestId] = job
+        if job.deadline is not None:
+            asyncio.get_running_loop().call_later(job.deadline - time.time(), self.expire, job)
+
+    '''
+    The deadline of a job passed: drop it if it is still queued, a search running stops in time by itself
+    '''
+
+    def expire(self, job):
+        if job.worker is None and not job.cancelled:
+            job.cancelled = True
+            self.finish(job, {"error": "deadline exceeded"})
+
+    def createJob(self, client, request):
+        fen = request.get("fen", ChessEngine.START_FEN)
+        moves = request.get("moves", [])
+        if not isinstance(fen, str) or not isinstance(moves, list) or not all(isinstance(move, str) for move in moves):
+            raise ValueError("fen is a string and moves a list of move strings")
+        gs = ChessEngine.newGameState(self.backend, fen)
+        playMoves(gs, moves)
+        limits = {}
+        for name in ("time", "nodes", "depth", "deadline"):
+            value = request.get(name)
+            if value is not None:
+                if not isinstance(value, int) or value < 1:
+                    raise ValueError(name + " needs a positive number")
+                limits[name] = value
+        timeLimit = limits.get("time")
+        if not limits.keys() & {"time", "nodes", "depth"}:
+            timeLimit = TIME_LIMIT
+        deadline = time.time() + limits["deadline"] / 1000 if "deadline" in limits else None
+        return Job(request.get("id"), client, gs, timeLimit, limits.get("nodes"), limits.get("depth", MAX_DEPTH),
+                   deadline)
+
+    '''
+    Drop a job: answer it as cancelled and stop its search if it is running
+    '''
+
+    def cancel(self, job):
+        if job.cancelled:
+            return
+        job.cancelled = True
+        if job.worker is not None:
+            job.worker.stop()
+        self.finish(job, {"error": "cancelled"})
+
+    def finish(self, job, reply):
+        if job.client.jobs.get(job.requestId) is job:
+            del job.client.jobs[job.requestId]
+            job.client.send(dict(reply, id=job.requestId))
+
+    '''
+    Run for every worker: take the next job from the queue and search it, for as long as the service runs
+    '''
+
+    async def dispatch(self, worker):
+        loop = asyncio.get_running_loop()
+        index = self.workers.index(worker)
+        while True:
+            job = await self.queue.get()
+            if job.cancelled:
+                continue
+            timeLimit = job.timeLimit
+            cutShort = False  # the deadline leaves less time than asked for
+            if job.deadline is not None:
+                remaining = (job.deadline - time.time()) * 1000 - DEADLINE_MARGIN
+                if remaining <= 0:
+                    self.finish(job, {"error": "deadline exceeded"})
+                    continue
+                if timeLimit is None or remaining < timeLimit:
+                    timeLimit = int(remaining)
+                    cutShort = True
+            job.worker = worker
+            self.running += 1
+            try:
+                worker.search(job.gs, timeLimit, job.nodeLimit, job.maxDepth)
+                result = None
+                while result is None and worker.process.is_alive():
+                    result = await loop.run_in_executor(self.executor, worker.getResult, True, None, POLL_INTERVAL)
+                if result is None:
+                    result = worker.getResult()  # it may have sent the result just before it ended
+            finally:
+                self.running -= 1
+                job.worker = None
+            if result is None:  # the worker process died: answer the job and start a new worker
+                self.finish(job, {"error": "engine worker died"})
+                worker.close()
+                worker = self.workers[index] = EngineWorker(self.backend)
+                continue
+            if job.cancelled:
+                continue
+            reply = {"move": result.move, "score": result.score, "depth": result.depth, "pv": result.pv,
+                     "nodes": result.nodes, "cached": False}
+            if not cutShort:
+                self.cache[job.cacheKey] = reply
+                if len(self.cache) > self.cacheSize:
+                    self.cache.popitem(last=False)
+            self.served += 1
+            self.finish(job, reply)
+
+    def status(self):
+        lookups = self.cacheHits + self.cacheMisses
+        return {"queued": self.queue.qsize(), "running": self.running, "workers": len(self.workers),
+                "served": self.served, "cached": len(self.cache), "cacheHits": self.cacheHits,
+                "cacheHitRate": self.cacheHits / lookups if lookups else None}
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+        self.executor.shutdown(wait=False)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Engine service for many clients on a local socket")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=PORT, help="port to listen on (default: " + str(PORT) + ")")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="searches run at once (default: number of cores)")
+    parser.add_argument("--backend", choices=("mailbox", "bitboard"), default="mailbox",
+                        help="move generator (default: mailbox)")
+    parser.add_argument("--queue", type=int, default=QUEUE_SIZE,
+                        help="requests that may wait for a worker (default: " + str(QUEUE_SIZE) + ")")
+    parser.add_argument("--cache", type=int, default=CACHE_SIZE,
+                        help="search results cached (default: " + str(CACHE_SIZE) + ")")
+    args = parser.parse_args(args)
+
+    async def run():
+        service = EngineService(args.workers, args.backend, max(1, args.queue), max(0, args.cache))
+        await service.serve(args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,317 @@
+'''
+A long lived engine process. The search runs in a worker process that stays up for the whole game, so its
+transposition table and move ordering tables stay warm from one move to the next.
+The game is sent as the FEN of its start position plus the moves played since, as move strings ("e2e4",
+"e7e8q"); after the first search only the moves that changed are sent. A search can be stopped (the best move
+found so far is still returned) or cancelled (its result is dropped).
+    engine = EngineWorker()
+    engine.search(gs)
+    ...
+    result = engine.getResult()  # None while the engine is still thinking
+While the opponent thinks the engine can ponder: search the position after the reply it expects (the second
+move of the principal variation). If the opponent plays that move the next search() carries on with the
+pondering search (ponder hit), else the pondering search is cancelled and a new one started (ponder miss),
+with the transposition table still warm from it.
+    engine.ponder(gs, result.ponderMove)
+While it searches the worker reports every completed iteration as a SearchInfo, see getResult.
+'''
+import atexit
+import math
+import multiprocessing
+import queue
+import time
+
+import ChessEngine
+import SmartMoveFinder
+import Tablebase
+from SearchStats import SearchStats
+from SmartMoveFinder import TIME_LIMIT, MAX_DEPTH
+
+'''
+Result of a search: the move to play as a move string, its score, the depth of the last completed iteration,
+the nodes searched, the principal variation (move strings, starting with the move to play) and, if the engine
+collects them, the search statistics (SearchStats.toDict())
+'''
+
+
+class SearchResult:
+    def __init__(self, searchId, move, score, depth, nodes, pv=(), stats=None):
+        self.searchId = searchId
+        self.move = move
+        self.score = score
+        self.depth = depth
+        self.nodes = nodes
+        self.pv = list(pv)
+        self.stats = stats
+        self.ponderMove = self.pv[1] if len(self.pv) > 1 else None  # the reply the engine expects
+
+    '''
+    The valid move matching the result, None if there is none
+    '''
+
+    def findMove(self, validMoves):
+        for move in validMoves:
+            if move.getChessNotation() == self.move:
+                return move
+        return None
+
+
+'''
+Progress of a search, sent after every completed iteration: the depth, its score, the nodes searched so far,
+the seconds since the search started and the principal variation (move strings)
+'''
+
+
+class SearchInfo:
+    def __init__(self, searchId, depth, score, nodes, seconds, pv):
+        self.searchId = searchId
+        self.depth = depth
+        self.score = score
+        self.nodes = nodes
+        self.seconds = seconds
+        self.pv = list(pv)
+
+
+'''
+Play the moves, given as move strings, on the game state. Raises ValueError for a move that is not valid.
+'''
+
+
+def playMoves(gs, moveStrings):
+    for moveString in moveStrings:
+        for move in gs.getValidMoves():
+            if move.getChessNotation() == moveString:
+                gs.makeMove(move)
+                break
+        else:
+            raise ValueError("invalid move " + moveString + " in position " + gs.toFen())
+
+
+'''
+Main loop of the worker process. Messages on requests:
+("position", fen, moves)          set up the game from its start position and moves
+("moves", undoCount, moves)        take back undoCount moves, then play the moves
+("go", searchId, timeLimit, nodeLimit, maxDepth)  search and put a SearchInfo per iteration and then a
+                                   SearchResult on results
+("newgame",)                       clear the transposition table and the move ordering tables
+("quit",)
+A search stops early once stopSearchId reaches its searchId, or once the time passes deadline (a time.time(),
+set on a ponder hit). A position or moves message with a move that is not valid is ignored, the last valid
+position is kept.
+'''
+
+
+def workerLoop(requests, results, stopSearchId, deadline, backend, processes, collectStats=False):
+    searcher = SmartMoveFinder.Searcher(tablebases=Tablebase.loadTablebases())  # the endgame tables generated, if any
+    gs = ChessEngine.newGameState(backend)
+    searchId = 0
+    searcher.stopRequested = lambda: stopSearchId.value >= searchId or time.time() > deadline.value
+    while True:
+        message = requests.get()
+        kind = message[0]
+        if kind == "quit":
+            break
+        elif kind == "position":
+            try:
+                newGs = ChessEngine.newGameState(backend, message[1])
+                playMoves(newGs, message[2])
+                gs = newGs
+            except ValueError:  # not a valid position, the worker keeps the last valid one
+                pass
+        elif kind == "moves":
+            ply = len(gs.moveLog) - message[1]
+            undoneMoves = gs.moveLog[ply:]
+            for i in range(message[1]):
+                gs.undoMove()
+            try:
+                playMoves(gs, message[2])
+            except ValueError:  # back to the position before the message
+                while len(gs.moveLog) > ply:
+                    gs.undoMove()
+                for move in undoneMoves:
+                    gs.makeMove(move)
+        elif kind == "go":
+            searchId, timeLimit, nodeLimit, maxDepth = message[1:]
+            results.put(runSearch(gs, searcher, searchId, timeLimit, nodeLimit, maxDepth, processes, results,
+                                  collectStats))
+        elif kind == "newgame":
+            searcher.newGame()
+    if processes > 1:
+        import ParallelSearch
+        ParallelSearch.closePool()
+
+
+def runSearch(gs, searcher, searchId, timeLimit, nodeLimit, maxDepth, processes, results, collectStats=False):
+    validMoves = gs.getValidMoves()
+    if not validMoves:
+        return SearchResult(searchId, None, None, 0, 0)
+    startTime = time.perf_counter()
+
+    def reportIteration(depth, score, move, nodes=None):
+        pv = searcher.getPrincipalVariation(gs, move, depth)
+        results.put(SearchInfo(searchId, depth, score, searcher.nodes if nodes is None else nodes,
+                               time.perf_counter() - startTime, [pvMove.getChessNotation() for pvMove in pv]))
+
+    searcher.iterationDone = reportIteration
+    if processes > 1:
+        import ParallelSearch  # only the worker needs the pool
+        # the pool's searches stop with this one's (stop, cancel, the deadline of a ponder hit)
+        move, score, depth, nodes = ParallelSearch.searchParallel(gs, validMoves, processes, timeLimit, nodeLimit,
+                                                                  maxDepth, searcher.stopRequested, reportIteration)
+        stats = None
+    else:
+        stats = SearchStats() if collectStats else None
+        searcher.iterativeDeepening(gs, validMoves, timeLimit, nodeLimit, maxDepth, stats=stats)
+        move, score, depth, nodes = searcher.bestMove, searcher.score, searcher.depth, searcher.nodes
+    if stats is not None:
+        stats = stats.toDict()
+    if move is None:
+        return SearchResult(searchId, None, score, depth, nodes, stats=stats)
+    pv = searcher.getPrincipalVariation(gs, move, max(depth, 2))
+    return SearchResult(searchId, move.getChessNotation(), score, depth, nodes,
+                        [pvMove.getChessNotation() for pvMove in pv], stats)
+
+
+class EngineWorker:
+    def __init__(self, backend="mailbox", processes=1, collectStats=False):
+        self.requests = multiprocessing.Queue()
+        self.results = multiprocessing.Queue()
+        self.stopSearchId = multiprocessing.Value("q", 0, lock=False)  # searches up to this id have to stop
+        self.deadline = multiprocessing.Value("d", math.inf, lock=False)  # time.time() a ponder search stops at
+        # a worker running a parallel search starts processes of its own, which a daemon process can't do
+        self.process = multiprocessing.Process(target=workerLoop, daemon=processes <= 1,
+                                               args=(self.requests, self.results, self.stopSearchId, self.deadline,
+                                                     backend, processes, collectStats))
+        self.process.start()
+        atexit.register(self.close)
+        self.sentFen = None  # start position and moves the worker has, to only send what changed
+        self.sentMoves = []
+        self.searchId = 0  # id of the last search started
+        self.thinking = False
+        self.pondering = False  # the last search is a ponder search that hasn't been hit yet
+        self.finishedResult = None  # result of the last search, received but not returned yet
+
+    '''
+    Bring the worker's position up to date with the game state and the extra moves
+    '''
+
+    def sendPosition(self, gs, extraMoves=()):
+        moves = [move.getChessNotation() for move in gs.moveLog] + list(extraMoves)
+        if gs.startFen != self.sentFen:
+            self.requests.put(("position", gs.startFen, moves))
+        else:
+            common = 0  # moves both move lists start with
+            while common < len(moves) and common < len(self.sentMoves) and moves[common] == self.sentMoves[common]:
+                common += 1
+            if common != len(moves) or common != len(self.sentMoves):
+                self.requests.put(("moves", len(self.sentMoves) - common, moves[common:]))
+        self.sentFen = gs.startFen
+        self.sentMoves = moves
+
+    '''
+    Start searching the position of the game state, cancelling the search running if any.
+    If the engine is pondering this very position, the ponder search goes on with the time limit (ponder hit).
+    Returns the id of the search.
+    '''
+
+    def search(self, gs, timeLimit=TIME_LIMIT, nodeLimit=None, maxDepth=MAX_DEPTH):
+        if self.pondering:
+            if gs.startFen == self.sentFen and [move.getChessNotation() for move in gs.moveLog] == self.sentMoves:
+                self.ponderHit(timeLimit)
+                return self.searchId
+            self.pondering = False
+        if self.thinking:
+            self.cancel()
+        self.sendPosition(gs)
+        self.startSearch(timeLimit, nodeLimit, maxDepth)
+        return self.searchId
+
+    '''
+    Search the position after the expected reply ponderMove (a move string, None to ponder the position of the
+    game state itself) until search() or ponderHit() is called
+    '''
+
+    def ponder(self, gs, ponderMove=None):
+        if self.thinking:
+            self.cancel()
+        self.sendPosition(gs, [ponderMove] if ponderMove is not None else [])
+        self.startSearch(None, None, MAX_DEPTH)
+        self.pondering = True
+
+    '''
+    The opponent played the expected move: the ponder search goes on as the real search, for timeLimit
+    milliseconds from now (None: until stopped)
+    '''
+
+    def ponderHit(self, timeLimit):
+        self.pondering = False
+        self.deadline.value = time.time() + timeLimit / 1000 if timeLimit is not None else math.inf
+
+    '''
+    Forget what was learned from earlier games, for a new game that has nothing to do with them
+    '''
+
+    def newGame(self):
+        if self.thinking:
+            self.cancel()
+        self.requests.put(("newgame",))
+
+    def startSearch(self, timeLimit, nodeLimit, maxDepth):
+        self.deadline.value = math.inf
+        self.searchId += 1
+        self.requests.put(("go", self.searchId, timeLimit, nodeLimit, maxDepth))
+        self.thinking = True
+        self.finishedResult = None
+
+    '''
+    Stop the search now, the best move found so far is still returned by getResult
+    '''
+
+    def stop(self):
+        self.stopSearchId.value = self.searchId
+
+    '''
+    Stop the search and drop its result
+    '''
+
+    def cancel(self):
+        self.stop()
+        self.thinking = False
+        self.pondering = False
+
+    '''
+    The result of the last search once it is done, else None. With wait the call blocks until it is done, or for
+    at most timeout seconds when a timeout is given. The SearchInfos of the search that came in are passed to
+    infoCallback, or dropped if there is none.
+    '''
+
+    def getResult(self, wait=False, infoCallback=None, timeout=None):
+        while self.thinking:
+            if self.finishedResult is not None:
+                if self.pondering:  # a ponder search that finished early is only returned after the ponder hit
+                    return None
+                result = self.finishedResult
+                self.finishedResult = None
+                self.thinking = False
+                return result
+            try:
+                message = self.results.get(block=wait and not self.pondering, timeout=timeout)
+            except queue.Empty:
+                return None
+            if message.searchId != self.searchId:  # messages of cancelled searches are skipped
+                continue
+            if isinstance(message, SearchInfo):
+                if infoCallback is not None:
+                    infoCallback(message)
+            else:
+                self.finishedResult = message
+        return None
+
+    def close(self):
+        atexit.unregister(self.close)  # so a closed worker isn't kept until the interpreter exits
+        if self.process.is_alive():
+            self.cancel()
+            self.requests.put(("quit",))
+            self.process.join(5)
+            if self.process.is_alive():
+                self.process.terminate()
@@ -0,0 +1,227 @@
+'''
+Root parallel search: the root moves are dealt out to a pool of worker processes and each worker runs the usual
+iterative deepening (SmartMoveFinder) on its share. Every worker reports the score of its best move at each depth
+it completed, and the results are merged by score at the deepest depth all the workers finished, so only scores
+of searches of the same depth are compared.
+The pool is kept between searches, so the transposition table and move ordering tables of the workers stay warm.
+A worker is sent the position as its FEN, which is far smaller and quicker to pickle than the GameState.
+A search can be stopped while it runs (stopRequested): the workers share a stop event and end their searches
+as soon as it is set, with the iterations they completed. The workers report every completed iteration, so the
+best move at each depth all of them completed is passed to iterationDone as the search goes.
+    python ParallelSearch.py --processes 4 --depth 4
+prints the speedup of 1, 2, 3 and 4 processes over the fixed set of benchmark positions.
+'''
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import time
+
+import ChessEngine
+import SmartMoveFinder
+from SmartMoveFinder import CHECKMATE, TIME_LIMIT, MAX_DEPTH
+
+# positions searched by the benchmark: the start position, an open middle game and the perft test positions
+benchmarkPositions = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+    "rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+]
+
+STOP_POLL_INTERVAL = 0.01  # seconds between two calls of stopRequested while the workers search
+
+pool = None  # the worker processes, started by getPool
+poolProcesses = 0
+poolStopEvent = None  # set to stop the searches of the workers
+poolProgress = None  # queue of the iterations the workers complete
+searchNumber = 0  # number of the last search, so progress of an earlier search is told apart
+workerSearcher = None  # the SmartMoveFinder.Searcher of a worker process, kept from one search to the next
+workerProgress = None
+
+'''
+Return the pool of worker processes, starting it (again) if it doesn't have the given number of processes
+'''
+
+
+def getPool(processes):
+    global pool, poolProcesses, poolStopEvent, poolProgress
+    if pool is None or poolProcesses != processes:
+        closePool()
+        poolStopEvent = multiprocessing.Event()
+        poolProgress = multiprocessing.Queue()
+        pool = multiprocessing.Pool(processes, initializer=startWorker, initargs=(poolStopEvent, poolProgress))
+        poolProcesses = processes
+    return pool
+
+
+def closePool():
+    global pool, poolProcesses
+    if pool is not None:
+        pool.terminate()
+        pool.join()
+        pool = None
+        poolProcesses = 0
+
+
+'''
+Run in every worker process when the pool starts: the stop event and progress queue it shares with the pool's owner
+'''
+
+
+def startWorker(stopEvent, progress):
+    global workerSearcher, workerProgress
+    workerSearcher = SmartMoveFinder.Searcher()
+    workerSearcher.stopRequested = stopEvent.is_set
+    workerProgress = progress
+
+
+'''
+Run in a worker: iterative deepening of the position of the FEN, with the given move generator backend, over
+the root moves with the given moveIDs only (share number share of search number number). Every completed
+iteration is put on the progress queue as (number, share, depth, score, moveID, nodes).
+Returns [(depth, score, moveID) of every completed iteration], the moveID of the move the search would play
+(None without moves) and the number of nodes searched.
+'''
+
+
+def searchRootMoves(number, share, backend, fen, moveIDs, timeLimit, nodeLimit, maxDepth):
+    gs = ChessEngine.newGameState(backend, fen)
+    moves = [move for move in gs.getValidMoves() if move.moveID in moveIDs]
+    workerSearcher.iterationDone = lambda depth, score, move: workerProgress.put(
+        (number, share, depth, score, move.moveID, workerSearcher.nodes))
+    iterations = workerSearcher.iterativeDeepening(gs, moves, timeLimit, nodeLimit, maxDepth, allRootMoves=False)
+    bestMove = workerSearcher.bestMove
+    return [(depth, score, move.moveID) for depth, score, move in iterations], \
+        bestMove.moveID if bestMove is not None else None, workerSearcher.nodes
+
+
+'''
+Pick the best move from the results of searchRootMoves: the best score at the deepest depth every worker
+completed, which after a stop is the deepest result complete over all the root moves. A worker that stopped
+early because its moves lead to a forced mate one way or the other is compared with the score of its last
+iteration.
+Returns (moveID, score, depth), score and depth None if no worker completed an iteration.
+'''
+
+
+def mergeResults(results):
+    completed = [iterations for iterations, fallbackMoveID, nodes in results if iterations]
+    if not completed:
+        return results[0][1], None, None
+    undecided = [len(iterations) for iterations in completed if abs(iterations[-1][1]) < CHECKMATE]
+    depth = min(undecided) if undecided else max(len(iterations) for iterations in completed)
+    bestScore = -CHECKMATE - 1
+    bestMoveID = None
+    for iterations in completed:
+        iterationDepth, score, moveID = iterations[min(depth, len(iterations)) - 1]
+        if score > bestScore:
+            bestScore = score
+            bestMoveID = moveID
+    return bestMoveID, bestScore, depth
+
+
+'''
+Search the position with the root moves split over the given number of processes (all the cores by default)
+and put the best move on returnQueue, the same way as SmartMoveFinder.findBestMoves.
+The node limit is shared out between the processes.
+'''
+
+
+def findBestMovesParallel(gs, validMoves, returnQueue, processes=None, timeLimit=TIME_LIMIT, nodeLimit=None,
+                          maxDepth=MAX_DEPTH):
+    returnQueue.put(searchParallel(gs, validMoves, processes, timeLimit, nodeLimit, maxDepth)[0])
+
+
+'''
+Returns (best move, score, depth, nodes searched by all the processes), best move None if there are no valid moves.
+stopRequested, a function returning True when the search has to stop now (see SmartMoveFinder.Searcher), is
+called every STOP_POLL_INTERVAL seconds; iterationDone is called with (depth, score, best move, nodes so far)
+for every depth all the processes completed.
+'''
+
+
+def searchParallel(gs, validMoves, processes=None, timeLimit=TIME_LIMIT, nodeLimit=None, maxDepth=MAX_DEPTH,
+                   stopRequested=None, iterationDone=None):
+    global searchNumber
+    if not validMoves:
+        return None, None, 0, 0
+    if processes is None:
+        processes = os.cpu_count() or 1
+    processes = max(1, min(processes, len(validMoves)))
+    # deal the moves out in order of how promising they look, so every process gets some of the good ones
+    moves = sorted(validMoves, key=SmartMoveFinder.scoreMvvLva, reverse=True)
+    shares = [set(move.moveID for move in moves[i::processes]) for i in range(processes)]
+    shareNodeLimit = None if nodeLimit is None else max(1, nodeLimit // processes)
+    fen = gs.toFen()
+    movesByID = {move.moveID: move for move in validMoves}
+    workerPool = getPool(processes)
+    poolStopEvent.clear()
+    searchNumber += 1
+    asyncResults = workerPool.starmap_async(searchRootMoves, [(searchNumber, i, gs.backend, fen, share, timeLimit,
+                                                               shareNodeLimit, maxDepth)
+                                                              for i, share in enumerate(shares)])
+    shareIterations = [[] for share in shares]  # (score, moveID) of every iteration each process reported
+    shareNodes = [0] * len(shares)
+    reportedDepth = 0
+    while not asyncResults.ready():
+        if stopRequested is not None and stopRequested():
+            poolStopEvent.set()
+        try:
+            number, share, depth, score, moveID, nodes = poolProgress.get(timeout=STOP_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        if number != searchNumber:  # a late report of an earlier search
+            continue
+        shareIterations[share].append((score, moveID))
+        shareNodes[share] = nodes
+        while iterationDone is not None and reportedDepth < min(len(iterations) for iterations in shareIterations):
+            score, moveID = max(iterations[reportedDepth] for iterations in shareIterations)
+            reportedDepth += 1
+            iterationDone(reportedDepth, score, movesByID[moveID], sum(shareNodes))
+    results = asyncResults.get()
+    moveID, score, depth = mergeResults(results)
+    return movesByID.get(moveID), score, depth, sum(nodes for iterations, fallbackMoveID, nodes in results)
+
+
+'''
+Search every benchmark position to a fixed depth with 1 up to maxProcesses processes and print the time taken
+and the speedup over one process. The pool is started before the clock runs and its tables are cleared by
+starting it anew for each process count.
+'''
+
+
+def runBenchmark(maxProcesses, depth):
+    positions = []
+    for fen in benchmarkPositions:
+        positions.append(ChessEngine.GameState.fromFen(fen))
+    baseTime = None
+    for processes in range(1, maxProcesses + 1):
+        closePool()
+        getPool(processes)
+        nodes = 0
+        startTime = time.perf_counter()
+        for gs in positions:
+            nodes += searchParallel(gs, gs.getValidMoves(), processes, None, None, depth)[3]
+        seconds = time.perf_counter() - startTime
+        if baseTime is None:
+            baseTime = seconds
+        print("processes " + str(processes) + ": " + format(seconds, ".2f") + " s, " + str(nodes) + " nodes, " +
+              "speedup " + format(baseTime / seconds, ".2f"), file=sys.stderr)
+    closePool()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Root parallel search speedup benchmark")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="highest number of processes to measure (default: number of cores)")
+    parser.add_argument("--depth", type=int, default=3, help="search depth of every position (default: 3)")
+    args = parser.parse_args(args)
+    runBenchmark(max(1, args.processes), max(1, args.depth))
+
+
+if __name__ == "__main__":
+    main()
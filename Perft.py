@@ -0,0 +1,128 @@
+'''
+Perft: count the leaf nodes of the move generation tree to a given depth and compare them with the known
+counts of the standard test positions. A wrong count means a move generation bug, the time taken is the
+move generation speed.
+    python Perft.py --depth 3
+    python Perft.py kiwipete --depth 2 --divide --backend bitboard
+'''
+import argparse
+import sys
+import time
+
+import ChessEngine
+
+'''
+The standard perft positions (https://www.chessprogramming.org/Perft_Results) and their node counts,
+counts[depth - 1] being the number of leaf nodes at that depth
+'''
+perftPositions = {
+    "startpos": ("rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+                 [20, 400, 8902, 197281, 4865609, 119060324]),
+    "kiwipete": ("r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+                 [48, 2039, 97862, 4085603, 193690690]),
+    "position3": ("8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+                  [14, 191, 2812, 43238, 674624, 11030083]),
+    "position4": ("r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1",
+                  [6, 264, 9467, 422333, 15833292]),
+    "position5": ("rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8",
+                  [44, 1486, 62379, 2103487, 89941194]),
+    "position6": ("r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+                  [46, 2079, 89890, 3894594, 164075551]),
+}
+
+'''
+Number of leaf nodes of the move tree of the given depth, the last level is counted without being played
+'''
+
+
+def perft(gs, depth):
+    if depth == 0:
+        return 1
+    moves = gs.getValidMoves()
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        gs.makeMove(move)
+        nodes += perft(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+
+'''
+Perft split by root move: a list of (move, nodes), to find the move that makes two counts differ
+'''
+
+
+def divide(gs, depth):
+    results = []
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        results.append((move, perft(gs, depth - 1)))
+        gs.undoMove()
+    return results
+
+
+'''
+Run perft on one position, print the nodes and nodes per second and return whether the count is right
+(True when there is no known count to compare with)
+'''
+
+
+def runPosition(name, fen, depth, backend="mailbox", showDivide=False, expectedNodes=None):
+    gs = ChessEngine.newGameState(backend, fen)
+    startTime = time.perf_counter()
+    if showDivide:
+        results = divide(gs, depth)
+        nodes = 0
+        for move, moveNodes in results:
+            print("    " + move.getChessNotation() + ": " + str(moveNodes))
+            nodes += moveNodes
+    else:
+        nodes = perft(gs, depth)
+    seconds = time.perf_counter() - startTime
+    line = name + " depth " + str(depth) + ": " + str(nodes) + " nodes, " + format(seconds, ".2f") + " s, " + \
+        str(int(nodes / seconds) if seconds > 0 else 0) + " nodes/s"
+    if expectedNodes is None:
+        print(line)
+        return True
+    if nodes != expectedNodes:
+        print(line + " FAILED, expected " + str(expectedNodes))
+        return False
+    print(line + " ok")
+    return True
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Perft move generation test and benchmark")
+    parser.add_argument("positions", nargs="*", help="positions to run: " + ", ".join(perftPositions) +
+                        " (default: all of them)")
+    parser.add_argument("--depth", type=int, default=3, help="search depth (default: 3)")
+    parser.add_argument("--backend", choices=("mailbox", "bitboard"), default="mailbox",
+                        help="move generator to test (default: mailbox)")
+    parser.add_argument("--divide", action="store_true", help="print the node count of every root move")
+    parser.add_argument("--fen", help="run this position instead of the standard ones")
+    args = parser.parse_args(args)
+    if args.depth < 1:
+        parser.error("depth must be at least 1")
+
+    if args.fen:
+        runs = [("fen", args.fen, None)]
+    else:
+        for name in args.positions:
+            if name not in perftPositions:
+                parser.error("unknown position " + name)
+        runs = []
+        for name in args.positions or perftPositions:
+            fen, counts = perftPositions[name]
+            runs.append((name, fen, counts[args.depth - 1] if args.depth <= len(counts) else None))
+
+    allPassed = True
+    for name, fen, expectedNodes in runs:
+        if not runPosition(name, fen, args.depth, args.backend, args.divide, expectedNodes):
+            allPassed = False
+    return 0 if allPassed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+'''
+Portable Game Notation: moves in Standard Algebraic Notation (SAN, "Nf3", "exd5", "O-O", "e8=Q+") and whole
+games as PGN text, for game records other programs can read, and reading the games of PGN files back.
+'''
+import ChessEngine
+from ChessEngine import Move, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING, TYPE_MASK, START_FEN
+
+pieceLetters = {KNIGHT: "N", BISHOP: "B", ROOK: "R", QUEEN: "Q", KING: "K"}  # SAN letter by piece type, pawns have none
+sanPieceTypes = {letter: pieceType for pieceType, letter in pieceLetters.items()}
+
+'''
+The SAN of a valid move in the position of the game state. validMoves are the valid moves of the position if
+already generated.
+'''
+
+
+def moveToSan(gs, move, validMoves=None):
+    if move.castle:
+        san = "O-O" if move.endCol == 6 else "O-O-O"
+    else:
+        endSquare = move.getRankFile(move.endRow, move.endCol)
+        pieceType = move.pieceMovedCode & TYPE_MASK
+        if pieceType == PAWN:
+            san = (Move.colsToFiles[move.startCol] + "x" if move.isCapture else "") + endSquare
+            if move.pawnPromotion:
+                san += "=" + move.promotionPiece
+        else:
+            if validMoves is None:
+                validMoves = gs.getValidMoves()
+            # the other pieces of the same kind that can go to the same square
+            others = [other for other in validMoves if other.endSquare == move.endSquare and
+                      other.pieceMovedCode == move.pieceMovedCode and other.startSquare != move.startSquare]
+            san = pieceLetters[pieceType]
+            if others and pieceType != KING:
+                if all(other.startCol != move.startCol for other in others):
+                    san += Move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in others):
+                    san += Move.rowToRanks[move.startRow]
+                else:
+                    san += move.getRankFile(move.startRow, move.startCol)
+            san += ("x" if move.isCapture else "") + endSquare
+    gs.makeMove(move)
+    gs.getValidMoves()
+    if gs.checkMate:
+        san += "#"
+    elif gs.inCheck:
+        san += "+"
+    gs.undoMove()
+    return san
+
+
+'''
+PGN text of a game: the header tags (a dict, in the order to write them), the moves played from startFen and
+the result ("1-0", "0-1", "1/2-1/2" or "*"). A game that doesn't start from the start position gets the SetUp
+and FEN tags it needs.
+'''
+
+
+def gameToPgn(headers, moves, result, startFen=START_FEN):
+    tags = dict(headers)
+    tags["Result"] = result
+    if startFen != START_FEN:
+        tags["SetUp"] = "1"
+        tags["FEN"] = startFen
+    lines = ['[' + name + ' "' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"]'
+             for name, value in tags.items()]
+    lines.append("")
+
+    gs = ChessEngine.GameState.fromFen(startFen)
+    tokens = []
+    for move in moves:
+        if gs.whiteToMove:
+            tokens.append(str(gs.fullmoveNumber) + ".")
+        elif not tokens:  # the game starts with a black move
+            tokens.append(str(gs.fullmoveNumber) + "...")
+        tokens.append(moveToSan(gs, move))
+        gs.makeMove(move)
+    tokens.append(result)
+
+    line = ""
+    for token in tokens:  # PGN lines are kept under 80 characters
+        if line and len(line) + 1 + len(token) > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+
+'''
+The valid move of the position written as san. Raises ValueError if there is none.
+'''
+
+
+def sanToMove(gs, san, validMoves=None):
+    if validMoves is None:
+        validMoves = gs.getValidMoves()
+    text = san.rstrip("+#!?")
+    if text in ("O-O", "0-0", "O-O-O", "0-0-0"):
+        endCol = 6 if len(text) == 3 else 2
+        for move in validMoves:
+            if move.castle and move.endCol == endCol:
+                return move
+        raise ValueError("invalid move " + san + " in position " + gs.toFen())
+    promotion = ""
+    if "=" in text:
+        text, promotion = text.split("=", 1)
+    elif text and text[-1] in "QRBN" and text[0].islower():  # a promotion written without the =
+        text, promotion = text[:-1], text[-1]
+    if text and text[0] in "NBRQK":
+        pieceType = sanPieceTypes[text[0]]
+        text = text[1:]
+    else:
+        pieceType = PAWN
+    target = text[-2:]
+    origin = text[:-2].replace("x", "")  # file, rank or square the piece comes from, if given
+    for move in validMoves:
+        if (move.pieceMovedCode & TYPE_MASK) == pieceType and not move.castle and \
+                move.getRankFile(move.endRow, move.endCol) == target and move.promotionPiece == promotion and \
+                all(char in move.getRankFile(move.startRow, move.startCol) for char in origin):
+            return move
+    raise ValueError("invalid move " + san + " in position " + gs.toFen())
+
+
+'''
+Read the games of a PGN file (an open text file). Yields (headers, moves, result) for every game: the header
+tags as a dict, the SAN of the moves of the main line (comments, variations and annotations left out) and the
+result from the movetext.
+'''
+
+
+def readGames(pgnFile):
+    headers = {}
+    tokens = []
+    depth = 0  # nesting of variations and comments being skipped
+    for line in pgnFile:
+        line = line.strip()
+        if depth == 0 and line.startswith("["):
+            if tokens:  # a game without a result before the next one's tags
+                yield headers, tokens, "*"
+                headers, tokens = {}, []
+            name, separator, value = line[1:].rstrip("]").partition(" ")
+            headers[name] = value.strip().strip('"').replace('\\"', '"').replace("\\\\", "\\")
+            continue
+        if depth == 0 and line.startswith("%"):  # escaped line
+            continue
+        for char in "(){};":
+            line = line.replace(char, " " + char + " ")
+        for token in line.split():
+            if token in ("(", "{"):
+                depth += 1
+            elif token in (")", "}"):
+                depth -= 1
+            elif depth > 0:
+                continue
+            elif token == ";":
+                break  # comment to the end of the line
+            elif token in ("1-0", "0-1", "1/2-1/2", "*"):
+                yield headers, tokens, token
+                headers, tokens = {}, []
+            elif not token.startswith("$"):
+                move = token.lstrip("0123456789.")  # "12.e4" and "12..." move numbers
+                if move:
+                    tokens.append(move)
+    if tokens or headers:
+        yield headers, tokens, "*"
+
+
+'''
+The game state of a game read by readGames: its start position (the FEN tag if any) with the moves played.
+Raises ValueError at the first invalid move.
+'''
+
+
+def playGame(headers, moves, backend="mailbox"):
+    gs = ChessEngine.newGameState(backend, headers.get("FEN", START_FEN))
+    for san in moves:
+        gs.makeMove(sanToMove(gs, san))
+    return gs
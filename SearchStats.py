@@ -0,0 +1,131 @@
+'''
+Statistics of a search, filled in by SmartMoveFinder when a SearchStats is passed to iterativeDeepening:
+nodes and quiescence nodes, nodes per second, effective branching factor, how often the first move searched
+causes the beta cutoff (a measure of the move ordering), the transposition table and evaluation cache hit rates
+and the time of every iteration. Without one the search only counts its nodes, as it always did.
+    python SearchStats.py --depth 4 --output stats.jsonl
+searches the benchmark positions and appends one JSON line per search, to follow the numbers from one change
+to the next.
+'''
+import argparse
+import json
+import math
+import sys
+import time
+
+import ChessEngine
+import SmartMoveFinder
+from ParallelSearch import benchmarkPositions
+
+
+class SearchStats:
+    def __init__(self):
+        self.nodes = 0  # all nodes, the quiescence nodes included
+        self.qNodes = 0
+        self.ttProbes = 0
+        self.ttHits = 0
+        self.evalProbes = 0  # positions scored through the evaluation cache
+        self.evalHits = 0
+        self.betaCutoffs = 0
+        self.firstMoveCutoffs = 0  # beta cutoffs caused by the first move searched
+        self.tablebaseHits = 0  # nodes scored by the endgame tablebases
+        self.nullMoveCutoffs = 0
+        self.razorCutoffs = 0
+        self.futilityPrunes = 0  # moves skipped by futility pruning
+        self.reSearches = 0  # moves searched again after a reduced or null window search failed high
+        self.iterations = []  # {"depth", "score", "move", "nodes", "seconds"} of every completed iteration
+        self.seconds = 0.0
+        self.startTime = time.perf_counter()
+
+    '''
+    Record a completed iteration, nodes being the nodes searched since the search started
+    '''
+
+    def endIteration(self, depth, score, move, nodes):
+        previousNodes = sum(iteration["nodes"] for iteration in self.iterations)
+        previousSeconds = sum(iteration["seconds"] for iteration in self.iterations)
+        self.iterations.append({"depth": depth, "score": score, "move": move.getChessNotation() if move else None,
+                                "nodes": nodes - previousNodes,
+                                "seconds": time.perf_counter() - self.startTime - previousSeconds})
+
+    def endSearch(self, nodes):
+        self.nodes = nodes
+        self.seconds = time.perf_counter() - self.startTime
+
+    @property
+    def nodesPerSecond(self):
+        return self.nodes / self.seconds if self.seconds > 0 else 0.0
+
+    '''
+    Nodes of an iteration over those of the one before, averaged (geometric mean) over the completed iterations
+    '''
+
+    @property
+    def effectiveBranchingFactor(self):
+        nodes = [iteration["nodes"] for iteration in self.iterations if iteration["nodes"] > 0]
+        if len(nodes) < 2:
+            return None
+        return math.pow(nodes[-1] / nodes[0], 1 / (len(nodes) - 1))
+
+    @property
+    def firstMoveCutoffRate(self):
+        return self.firstMoveCutoffs / self.betaCutoffs if self.betaCutoffs else None
+
+    @property
+    def ttHitRate(self):
+        return self.ttHits / self.ttProbes if self.ttProbes else None
+
+    @property
+    def evalHitRate(self):
+        return self.evalHits / self.evalProbes if self.evalProbes else None
+
+    def toDict(self):
+        return {"nodes": self.nodes, "qNodes": self.qNodes, "seconds": self.seconds, "nps": self.nodesPerSecond,
+                "ebf": self.effectiveBranchingFactor, "firstMoveCutoffRate": self.firstMoveCutoffRate,
+                "ttHitRate": self.ttHitRate, "evalHitRate": self.evalHitRate, "tablebaseHits": self.tablebaseHits,
+                "nullMoveCutoffs": self.nullMoveCutoffs, "razorCutoffs": self.razorCutoffs,
+                "futilityPrunes": self.futilityPrunes, "reSearches": self.reSearches, "iterations": self.iterations}
+
+    '''
+    Write the statistics as one line of JSON, with the extra fields (e.g. the position) in front
+    '''
+
+    def writeJsonLine(self, outputFile, **extra):
+        fields = dict(extra)
+        fields.update(self.toDict())
+        outputFile.write(json.dumps(fields) + "\n")
+
+
+'''
+Search every benchmark position to the given depth with statistics and write them to outputFile
+'''
+
+
+def runBenchmark(depth, outputFile, label=None, evalCacheMB=SmartMoveFinder.EVAL_CACHE_MB):
+    for fen in benchmarkPositions:
+        gs = ChessEngine.GameState.fromFen(fen)
+        stats = SearchStats()
+        searcher = SmartMoveFinder.Searcher(evalCacheMB=evalCacheMB)
+        searcher.iterativeDeepening(gs, gs.getValidMoves(), None, None, depth, stats=stats)
+        stats.writeJsonLine(outputFile, label=label, time=time.strftime("%Y-%m-%dT%H:%M:%S"), fen=fen, depth=depth)
+        outputFile.flush()
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Search statistics of the benchmark positions as JSON lines")
+    parser.add_argument("--depth", type=int, default=4, help="search depth of every position (default: 4)")
+    parser.add_argument("--output", help="append to this file (default: stdout)")
+    parser.add_argument("--label", help="written with every line, e.g. the commit searched")
+    parser.add_argument("--eval-cache", type=float, default=SmartMoveFinder.EVAL_CACHE_MB,
+                        help="evaluation cache in megabytes, 0 for none (default: " +
+                        str(SmartMoveFinder.EVAL_CACHE_MB) + ")")
+    args = parser.parse_args(args)
+    if args.output:
+        with open(args.output, "a") as outputFile:
+            runBenchmark(max(1, args.depth), outputFile, args.label, args.eval_cache)
+    else:
+        runBenchmark(max(1, args.depth), sys.stdout, args.label, args.eval_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,68 +1,223 @@
 import random
+import time
+from array import array
 
-pieceScore = {"K": 0, "Q": 10, "R": 5, "B": 3, "N": 3, "p": 1}
-
-knightScores = [[1, 1, 1, 1, 1, 1, 1, 1],
-                [1, 2, 2, 2, 2, 2, 2, 1],
-                [1, 2, 3, 3, 3, 3, 2, 1],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [1, 2, 3, 3, 3, 3, 2, 1],
-                [1, 2, 2, 2, 2, 2, 2, 1],
-                [1, 1, 1, 1, 1, 1, 1, 1]]
-
-bishopScores = [[4, 3, 2, 1, 1, 2, 3, 4],
-                [3, 4, 3, 2, 2, 3, 4, 3],
-                [2, 3, 4, 3, 3, 4, 3, 2],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [1, 2, 3, 4, 4, 3, 2, 1],
-                [2, 3, 4, 3, 3, 4, 3, 2],
-                [3, 4, 3, 2, 2, 3, 4, 3],
-                [4, 3, 2, 1, 1, 2, 3, 4]]
-
-queenScores = [[1, 1, 1, 3, 1, 1, 1, 1],
-               [1, 2, 3, 3, 3, 1, 1, 1],
-               [1, 4, 3, 3, 3, 4, 2, 1],
-               [1, 2, 3, 3, 3, 2, 2, 1],
-               [1, 2, 3, 3, 3, 2, 2, 1],
-               [1, 4, 3, 3, 3, 4, 2, 1],
-               [1, 1, 2, 3, 3, 1, 1, 1],
-               [1, 1, 1, 3, 1, 1, 1, 1]]
-
-# probably better to try to place rooks on open files, or on same file as other rook/queen
-rookScores = [[4, 3, 4, 4, 4, 4, 3, 4],
-              [4, 4, 4, 4, 4, 4, 4, 4],
-              [1, 1, 2, 3, 3, 2, 1, 1],
-              [1, 2, 3, 4, 4, 3, 2, 1],
-              [1, 2, 3, 4, 4, 3, 2, 1],
-              [1, 1, 2, 2, 2, 2, 1, 1],
-              [4, 4, 4, 4, 4, 4, 4, 4],
-              [4, 3, 4, 4, 4, 4, 3, 4]]
-
-whitePawnScores = [[8, 8, 8, 8, 8, 8, 8, 8],
-                   [8, 8, 8, 8, 8, 8, 8, 8],
-                   [5, 6, 6, 7, 7, 6, 6, 5],
-                   [2, 3, 3, 5, 5, 3, 3, 2],
-                   [1, 2, 3, 4, 4, 3, 2, 1],
-                   [1, 1, 2, 3, 3, 2, 1, 1],
-                   [1, 1, 1, 0, 0, 1, 1, 1],
-                   [0, 0, 0, 0, 0, 0, 0, 0]]
-
-blackPawnScores = [[0, 0, 0, 0, 0, 0, 0, 0],
-                   [1, 1, 1, 0, 0, 1, 1, 1],
-                   [1, 1, 2, 3, 3, 2, 1, 1],
-                   [1, 2, 3, 4, 4, 3, 2, 1],
-                   [2, 3, 3, 5, 5, 3, 3, 2],
-                   [5, 6, 6, 7, 7, 6, 6, 5],
-                   [8, 8, 8, 8, 8, 8, 8, 8],
-                   [8, 8, 8, 8, 8, 8, 8, 8]]
-
-piecePositionScores = {"N": knightScores, "Q": queenScores, "B": bishopScores, "R": rookScores, "bp": blackPawnScores,
-                       "wp": whitePawnScores}
+from ChessEngine import pieceScore, EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, WHITE, BLACK, TYPE_MASK, PROMOTION_MOVE
 
 CHECKMATE = 1000
 STALEMATE = 0
-DEPTH = 2
+DEPTH = 2  # fixed depth of the plain minimax/negamax searches
+MAX_DEPTH = 64  # iterative deepening stops here even if there is time left
+TIME_LIMIT = 2000  # milliseconds the AI may think about a move
+DELTA_MARGIN = 2  # a capture that can't raise the score to alpha even with this bonus is not searched
+TT_SIZE = 1 << 18  # number of transposition table entries, must be a power of two
+EVAL_CACHE_MB = 0  # memory of the evaluation cache of a Searcher in megabytes, 0 for none (see EvaluationCache)
+EVAL_CACHE_ENTRY_BYTES = 16  # a 64 bit key and a double
+NULL_WINDOW = 0.05  # scores are whole tenths of a pawn, a window this wide only tells above or below alpha
+NULL_MOVE_REDUCTION = 2  # the null move is searched this much less deep than the moves
+NULL_MOVE_MIN_DEPTH = 3
+LMR_MIN_DEPTH = 3  # late moves are reduced from this depth on
+LMR_FULL_DEPTH_MOVES = 3  # moves searched to the full depth before the late moves are reduced
+LMR_LATE_MOVES = 8  # from this move on the reduction is 2 plies instead of 1
+FUTILITY_MARGINS = (0, 2, 5)  # in pawns by depth left, see findMoveNegaMaxAlphaBeta
+RAZOR_MARGINS = (0, 3, 5)
+
+# transposition table entry flags
+EXACT = 0
+LOWERBOUND = 1  # the search failed high, the score is at least this value
+UPPERBOUND = 2  # the search failed low, the score is at most this value
+
+
+'''
+A fixed size hash table of search results indexed by the Zobrist key of the position.
+Each slot keeps the full key (to detect collisions), the depth searched, the score, the kind of bound
+and the moveID of the best move. A new result only replaces an entry of the same search that was
+searched at least as deep (depth-preferred replacement); entries of earlier searches are always replaced.
+'''
+
+
+class TranspositionTable:
+    def __init__(self, size=TT_SIZE):
+        self.mask = size - 1
+        self.keys = [None] * size
+        self.depths = [0] * size
+        self.scores = [0] * size
+        self.flags = [EXACT] * size
+        self.moves = [None] * size
+        self.ages = [0] * size
+        self.age = 0
+
+    '''
+    Start a new search, so entries left from the previous ones can be replaced
+    '''
+
+    def newSearch(self):
+        self.age += 1
+
+    def clear(self):
+        size = self.mask + 1
+        self.keys = [None] * size
+        self.ages = [0] * size
+        self.age = 0
+
+    '''
+    Return the index of the slot holding the key, or -1 if the position is not in the table
+    '''
+
+    def probe(self, key):
+        index = key & self.mask
+        if self.keys[index] == key:
+            return index
+        return -1
+
+    def store(self, key, depth, score, flag, moveID):
+        index = key & self.mask
+        if self.keys[index] is None or self.ages[index] != self.age or depth >= self.depths[index]:
+            self.keys[index] = key
+            self.depths[index] = depth
+            self.scores[index] = score
+            self.flags[index] = flag
+            self.moves[index] = moveID
+            self.ages[index] = self.age
+
+
+'''
+Static scores (scoreBoard, from white's side) of positions by Zobrist key, so a position the search meets again
+(in the next iteration, in a sibling subtree, by transposition) isn't scored again. Separate from the transposition
+table: a score only depends on the position, not on a search depth or a window. The keys and scores are kept in
+two arrays of a power of two entries, the most a budget of megabytes holds; a key goes in slot key & mask and
+always replaces what was there (no LRU), the most recent position being the most likely to be met again.
+An empty slot has the key 0, which a position has once in 2^64.
+A probe costs about as much as scoreBoard, the board score kept up to date by makeMove, so the cache is off by
+default (EVAL_CACHE_MB); it is for an evaluation that does more work.
+'''
+
+
+class EvaluationCache:
+    def __init__(self, megabytes=EVAL_CACHE_MB):
+        size = 1
+        while size * 2 * EVAL_CACHE_ENTRY_BYTES <= megabytes * (1 << 20):
+            size *= 2
+        self.mask = size - 1
+        self.keys = array("Q", bytes(8 * size))
+        self.scores = array("d", bytes(8 * size))
+        self.probes = 0
+        self.hits = 0
+
+    '''
+    The score of the key, None if it is not in the cache
+    '''
+
+    def probe(self, key):
+        self.probes += 1
+        index = key & self.mask
+        if self.keys[index] == key:
+            self.hits += 1
+            return self.scores[index]
+        return None
+
+    def store(self, key, score):
+        index = key & self.mask
+        self.keys[index] = key
+        self.scores[index] = score
+
+    def clear(self):
+        size = self.mask + 1
+        self.keys = array("Q", bytes(8 * size))
+        self.probes = 0
+        self.hits = 0
+
+    @property
+    def hitRate(self):
+        return self.hits / self.probes if self.probes else None
+
+    @property
+    def megabytes(self):
+        return (self.mask + 1) * EVAL_CACHE_ENTRY_BYTES / (1 << 20)
+
+
+# move ordering scores, the hash move first, then captures, then killer moves, then the rest by history
+HASH_MOVE_SCORE = 1 << 30
+CAPTURE_SCORE = 1 << 29
+KILLER_SCORES = (1 << 28, (1 << 28) - 1)
+HISTORY_LIMIT = 1 << 20  # history scores are halved once one of them gets this big
+# value of a piece by piece type, the type itself: pawn 1, knight 2, bishop 3, rook 4, queen 5, king 6
+pieceTypeScores = [0] * 7
+for piece, pieceType in (("p", 1), ("N", 2), ("B", 3), ("R", 4), ("Q", 5), ("K", 6)):
+    pieceTypeScores[pieceType] = pieceScore[piece]
+
+'''
+Sorts moves so that the ones most likely to cause a beta cutoff are searched first:
+1. the best move stored in the transposition table for the position (hash move)
+2. captures and promotions, most valuable victim first, then least valuable attacker (MVV-LVA)
+3. the two killer moves of the ply, quiet moves that caused a cutoff in a sibling position
+4. the other quiet moves by history score, how often and how deep they caused cutoffs anywhere
+'''
+
+
+class MoveOrderer:
+    def __init__(self, maxPly=MAX_DEPTH + 1):
+        self.killers = [[None, None] for ply in range(maxPly)]
+        self.history = [[0] * 64 for pieceCode in range(32)]  # [piece code][end square index]
+
+    '''
+    Forget the killers and age the history scores before a new search
+    '''
+
+    def newSearch(self):
+        for killers in self.killers:
+            killers[0] = killers[1] = None
+        for scores in self.history:
+            for i in range(64):
+                scores[i] >>= 1
+
+    def scoreMove(self, move, ply, hashMoveID):
+        if move.moveID == hashMoveID:
+            return HASH_MOVE_SCORE
+        if move.pieceCapturedCode != EMPTY or move.moveID >> 14 == PROMOTION_MOVE:
+            return CAPTURE_SCORE + scoreMvvLva(move)
+        killers = self.killers[ply]
+        if move.moveID == killers[0]:
+            return KILLER_SCORES[0]
+        if move.moveID == killers[1]:
+            return KILLER_SCORES[1]
+        return self.history[move.pieceMovedCode][move.moveID >> 6 & 63]
+
+    def orderMoves(self, moves, ply, hashMoveID=None):
+        moves.sort(key=lambda move: self.scoreMove(move, ply, hashMoveID), reverse=True)
+        return moves
+
+    '''
+    Remember a quiet move that caused a beta cutoff at the given depth and ply
+    '''
+
+    def updateCutoff(self, move, depth, ply):
+        if move.pieceCapturedCode != EMPTY or move.moveID >> 14 == PROMOTION_MOVE:
+            return
+        killers = self.killers[ply]
+        if killers[0] != move.moveID:
+            killers[1] = killers[0]
+            killers[0] = move.moveID
+        scores = self.history[move.pieceMovedCode]
+        square = move.moveID >> 6 & 63
+        scores[square] += depth * depth
+        if scores[square] >= HISTORY_LIMIT:
+            for scores in self.history:
+                for i in range(64):
+                    scores[i] >>= 1
+
+
+'''
+Most valuable victim, least valuable attacker; a promotion counts as winning the promotion piece
+'''
+
+
+def scoreMvvLva(move):
+    victimValue = move.pieceCapturedCode & TYPE_MASK  # the piece types are ordered by value
+    if move.moveID >> 14 == PROMOTION_MOVE:
+        victimValue += QUEEN - (move.moveID >> 12 & 3)  # type of the promotion piece
+    return victimValue * 8 - (move.pieceMovedCode & TYPE_MASK)
+
 
 '''
 Picks and returns a random move.
@@ -112,93 +267,447 @@ def findBestMoveMinMaxNoRecursion(gs, validMoves):
 
 
 '''
-Helper method to make first recursive call
+Helper method to make first recursive call.
 '''
 
 
-def findBestMoves(gs, validMoves, returnQueue):
-    global nextMove, counter
-    nextMove = None
-    random.shuffle(validMoves)
-    counter = 0
-    findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH, -CHECKMATE, CHECKMATE, 1 if gs.whiteToMove else -1)
-    print(counter)
-    returnQueue.put(nextMove)
+def findBestMoves(gs, validMoves, returnQueue, timeLimit=TIME_LIMIT, nodeLimit=None, maxDepth=MAX_DEPTH):
+    searcher = Searcher()
+    searcher.iterativeDeepening(gs, validMoves, timeLimit, nodeLimit, maxDepth)
+    returnQueue.put(searcher.bestMove)
+
 
+'''
+Whether the side to move has a piece besides its king and pawns. Without one zugzwang is common, passing the turn
+is often the best "move" there, so null move pruning is not used.
+'''
 
-def findMoveMinMax(gs, validMoves, depth, whiteToMove):
-    global nextMove
-    if depth == 0:
-        return scoreMaterial(gs.board)
 
-    if whiteToMove:
+def hasPieces(gs):
+    color = WHITE if gs.whiteToMove else BLACK
+    squares = gs.squares
+    return squares.count(color | KNIGHT) + squares.count(color | BISHOP) + squares.count(color | ROOK) + \
+        squares.count(color | QUEEN) > 0
+
+
+'''
+A search engine with its own transposition table, evaluation cache, move ordering tables, settings and the results
+of its last search, so any number of them can search side by side in one process (threads, asyncio tasks, the two
+engines of a Tournament game) and one can be kept and reused for search after search with its tables warm.
+After a search bestMove, score, depth, pv, nodes and iterations hold its result.
+'''
+
+
+class Searcher:
+    def __init__(self, ttSize=TT_SIZE, ordering=True, tablebases=None, evalCacheMB=EVAL_CACHE_MB):
+        self.transpositionTable = TranspositionTable(ttSize)
+        self.evaluationCache = EvaluationCache(evalCacheMB) if evalCacheMB > 0 else None
+        self.moveOrderer = MoveOrderer() if ordering else None  # None searches without move ordering
+        self.tablebases = tablebases  # Tablebase.Tablebases probed at the root and in the search, None for none
+        self.stopRequested = None  # function returning True when the search has to stop now, see EngineWorker
+        self.iterationDone = None  # function called with (depth, score, best move) after every completed iteration
+        # search features, each can be switched off, e.g. to measure what it is worth in a Tournament
+        self.pvsEnabled = True  # principal variation search: null window for all but the first move
+        self.nullMoveEnabled = True  # null move pruning: a cutoff if passing the turn still fails high
+        self.lmrEnabled = True  # late move reductions: quiet moves late in the move order are searched less deep
+        self.futilityEnabled = True  # futility pruning: at depth 1 and 2 skip quiet moves far below alpha
+        self.razoringEnabled = True  # razoring: at depth 1 and 2 drop into the quiescence search when far below alpha
+        # result of the last search
+        self.bestMove = None
+        self.score = None  # score of the last completed iteration, for the side to move
+        self.depth = 0  # depth of the last completed iteration
+        self.pv = []  # principal variation, bestMove first
+        self.nodes = 0
+        self.iterations = []  # (depth, score, best move) of every completed iteration
+        # state of the running search
+        self.stats = None  # SearchStats.SearchStats the search fills in, None when not collecting them
+        self.deadline = None  # time.time() the search has to stop at
+        self.nodeLimit = None
+        self.aborted = False
+
+    '''
+    Forget what was learned in earlier games: the transposition table, the evaluation cache and the move ordering
+    tables
+    '''
+
+    def newGame(self):
+        self.transpositionTable.clear()
+        if self.evaluationCache is not None:
+            self.evaluationCache.clear()
+        if self.moveOrderer is not None:
+            self.moveOrderer = MoveOrderer()
+
+    '''
+    Iterative deepening: search depth 1, 2, 3, ... until the time limit (in milliseconds) or the node limit
+    is used up. The best move of the last completed iteration is left in bestMove, or a better one the unfinished
+    iteration has already proven, with the score, depth and principal variation of the last completed iteration.
+    Each iteration fills the transposition table and the move ordering tables, so the next one searches the best
+    moves first.
+    Returns (depth, score, best move) of every completed iteration. When validMoves is only a share of the legal
+    moves (allRootMoves False, see ParallelSearch) a single move is still searched to the full depth.
+    With a SearchStats as stats the search fills it in; without one it costs nothing but a check per node.
+    '''
+
+    def iterativeDeepening(self, gs, validMoves, timeLimit=TIME_LIMIT, nodeLimit=None, maxDepth=MAX_DEPTH,
+                           allRootMoves=True, stats=None):
+        self.stats = stats
+        self.bestMove = None
+        self.score = None
+        self.depth = 0
+        self.pv = []
+        random.shuffle(validMoves)
+        self.nodes = 0
+        self.deadline = None if timeLimit is None else time.time() + timeLimit / 1000
+        self.nodeLimit = nodeLimit
+        self.aborted = False
+        self.transpositionTable.newSearch()
+        if self.moveOrderer is not None:
+            self.moveOrderer.newSearch()
+        cache = self.evaluationCache
+        evalProbes, evalHits = (cache.probes, cache.hits) if cache is not None else (0, 0)
+        turnMultiplier = 1 if gs.whiteToMove else -1
+        inCheck = gs.inCheck  # set when validMoves were generated, every iteration leaves it set for another position
+        iterations = self.iterations = []
+        tablebaseMove = self.tablebases.bestMove(gs, validMoves) if self.tablebases is not None else None
+        if tablebaseMove is not None:  # the tables know the best move, no need to search
+            self.bestMove, score = tablebaseMove
+            iterations.append((1, score, self.bestMove))
+            if stats is not None:
+                stats.endIteration(1, score, self.bestMove, self.nodes)
+            if self.iterationDone is not None:
+                self.iterationDone(1, score, self.bestMove)
+            maxDepth = 0
+        for depth in range(1, maxDepth + 1):
+            gs.inCheck = inCheck
+            score = self.findMoveNegaMaxAlphaBeta(gs, validMoves, depth, -CHECKMATE, CHECKMATE, turnMultiplier, 0)
+            if self.aborted:
+                break
+            iterations.append((depth, score, self.bestMove))
+            if stats is not None:
+                stats.endIteration(depth, score, self.bestMove, self.nodes)
+            if self.iterationDone is not None:
+                self.iterationDone(depth, score, self.bestMove)
+            if abs(score) >= CHECKMATE or (allRootMoves and len(validMoves) == 1):  # no point in searching deeper
+                break
+        if iterations:
+            self.depth, self.score = iterations[-1][0], iterations[-1][1]
+        if self.bestMove is not None:
+            self.pv = self.getPrincipalVariation(gs, self.bestMove, max(self.depth, 2))
+        if stats is not None:
+            if cache is not None:
+                stats.evalProbes = cache.probes - evalProbes
+                stats.evalHits = cache.hits - evalHits
+            stats.endSearch(self.nodes)
+            self.stats = None
+        return iterations
+
+    '''
+    The principal variation: firstMove (or the best move of the transposition table) followed by the best moves
+    the transposition table has for the positions after it, as far as it knows them, at most maxLength moves
+    '''
+
+    def getPrincipalVariation(self, gs, firstMove=None, maxLength=MAX_DEPTH):
+        pv = []
+        seen = set()  # a repetition would make the line go on forever
+        move = firstMove
+        while len(pv) < maxLength and gs.zobristKey not in seen:
+            if move is None:
+                index = self.transpositionTable.probe(gs.zobristKey)
+                if index == -1:
+                    break
+                moveID = self.transpositionTable.moves[index]
+                for validMove in gs.getValidMoves():
+                    if validMove.moveID == moveID:
+                        move = validMove
+                        break
+                if move is None:  # no move stored for the position
+                    break
+            seen.add(gs.zobristKey)
+            pv.append(move)
+            gs.makeMove(move)
+            move = None
+        for i in range(len(pv)):
+            gs.undoMove()
+        return pv
+
+    '''
+    Check the time and node limits and whether stopRequested asks to stop, once we have a move to return
+    '''
+
+    def checkSearchLimits(self):
+        if self.bestMove is not None:
+            if self.nodeLimit is not None and self.nodes >= self.nodeLimit:
+                self.aborted = True
+            elif self.nodes & 63 == 0:
+                if self.deadline is not None and time.time() > self.deadline:
+                    self.aborted = True
+                elif self.stopRequested is not None and self.stopRequested():
+                    self.aborted = True
+        return self.aborted
+
+    '''
+    Fixed depth minimax and negamax searches without pruning, the move found at the root (ply 0) is left in bestMove
+    '''
+
+    def findMoveMinMax(self, gs, validMoves, depth, whiteToMove, ply=0):
+        if depth == 0:
+            return scoreMaterial(gs.board)
+
+        if whiteToMove:
+            maxScore = -CHECKMATE
+            for move in validMoves:
+                gs.makeMove(move)
+                nextMoves = gs.getValidMoves()
+                score = self.findMoveMinMax(gs, nextMoves, depth - 1, False, ply + 1)
+                if score > maxScore:
+                    maxScore = score
+                    if ply == 0:
+                        self.bestMove = move
+                gs.undoMove()
+            return maxScore
+        else:
+            minScore = CHECKMATE
+            for move in validMoves:
+                gs.makeMove(move)
+                nextMoves = gs.getValidMoves()
+                score = self.findMoveMinMax(gs, nextMoves, depth - 1, True, ply + 1)
+                if score < minScore:
+                    minScore = score
+                    if ply == 0:
+                        self.bestMove = move
+                gs.undoMove()
+            return minScore
+
+    def findMoveNegaMax(self, gs, validMoves, depth, turnMultiplier, ply=0):
+        self.nodes += 1
+        if depth == 0:
+            return turnMultiplier * scoreBoard(gs)
+
         maxScore = -CHECKMATE
         for move in validMoves:
             gs.makeMove(move)
             nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth - 1, False)
+            score = -self.findMoveNegaMax(gs, nextMoves, depth - 1, -turnMultiplier, ply + 1)
             if score > maxScore:
                 maxScore = score
-                if depth == DEPTH:
-                    nextMove = move
+                if ply == 0:
+                    self.bestMove = move
             gs.undoMove()
         return maxScore
-    else:
-        minScore = CHECKMATE
+
+    '''
+    Negamax alpha-beta search of the position to the given depth, returning the score for the side to move.
+    validMoves are the valid moves of the position, generated by the caller. The search features switched on prune
+    the tree:
+    - PVS: after the first move the others only have to be proven worse, with a null window (alpha, alpha +
+      NULL_WINDOW); a move that turns out better is searched again with the full window.
+    - Null move: out of check, in a null window node where the static score is above beta, the turn is passed and the
+      opponent searched NULL_MOVE_REDUCTION + 1 plies less deep; still above beta means the position is good enough
+      for a cutoff. Not when the side to move has only pawns left (zugzwang) nor right after another null move.
+    - LMR: quiet moves after the first LMR_FULL_DEPTH_MOVES that don't give check are searched 1 or 2 plies less deep,
+      and to the full depth again when they fail high.
+    - Futility: at depth 1 and 2, out of check, quiet moves that don't give check are skipped when the static score
+      plus FUTILITY_MARGINS[depth] is not above alpha.
+    - Razoring: at depth 1 and 2 in a null window node, when the static score plus RAZOR_MARGINS[depth] is not above
+      alpha, the quiescence search decides; the node fails low if it does not get above alpha either.
+    '''
+
+    def findMoveNegaMaxAlphaBeta(self, gs, validMoves, depth, alpha, beta, turnMultiplier, ply, allowNullMove=True):
+        self.nodes += 1
+        if self.checkSearchLimits():
+            return 0
+        if self.tablebases is not None and ply > 0:
+            score = self.tablebases.probeScore(gs)
+            if score is not None:  # the exact score, whatever the depth
+                if self.stats is not None:
+                    self.stats.tablebaseHits += 1
+                return score
+        alphaOriginal = alpha
+        hashMoveID = None
+        index = self.transpositionTable.probe(gs.zobristKey)
+        if self.stats is not None:
+            self.stats.ttProbes += 1
+            if index != -1:
+                self.stats.ttHits += 1
+        if index != -1:
+            hashMoveID = self.transpositionTable.moves[index]
+            # never cut at the root, we still need a move to play
+            if ply > 0 and self.transpositionTable.depths[index] >= depth:
+                score = self.transpositionTable.scores[index]
+                flag = self.transpositionTable.flags[index]
+                if flag == EXACT:
+                    return score
+                elif flag == LOWERBOUND:
+                    alpha = max(alpha, score)
+                else:
+                    beta = min(beta, score)
+                if alpha >= beta:
+                    return score
+
+        if gs.checkMate or gs.staleMate:
+            return turnMultiplier * scoreBoard(gs)
+        if depth == 0:
+            return self.quiescenceSearch(gs, alpha, beta, turnMultiplier)
+
+        inCheck = gs.inCheck
+        nullWindow = beta - alpha <= NULL_WINDOW
+        futile = False
+        if ply > 0 and not inCheck:
+            staticScore = turnMultiplier * self.evaluate(gs)
+            if self.razoringEnabled and nullWindow and depth <= 2 and staticScore + RAZOR_MARGINS[depth] <= alpha:
+                score = self.quiescenceSearch(gs, alpha, beta, turnMultiplier)
+                if self.aborted:
+                    return 0
+                if score <= alpha:
+                    if self.stats is not None:
+                        self.stats.razorCutoffs += 1
+                    return score
+            if self.nullMoveEnabled and allowNullMove and nullWindow and depth >= NULL_MOVE_MIN_DEPTH and \
+                    staticScore >= beta and abs(beta) < CHECKMATE and hasPieces(gs):
+                gs.makeNullMove()
+                nextMoves = gs.getValidMoves()
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, max(0, depth - 1 - NULL_MOVE_REDUCTION),
+                                                       -beta, -beta + NULL_WINDOW, -turnMultiplier, ply + 1, False)
+                gs.undoNullMove()
+                if self.aborted:
+                    return 0
+                if score >= beta:
+                    if self.stats is not None:
+                        self.stats.nullMoveCutoffs += 1
+                    return beta  # not score, a mate found after passing the turn is not proven
+            futile = self.futilityEnabled and depth <= 2 and staticScore + FUTILITY_MARGINS[depth] <= alpha
+
+        if self.moveOrderer is not None:
+            self.moveOrderer.orderMoves(validMoves, ply, hashMoveID)
+        elif hashMoveID is not None:  # search the best move found earlier for this position first
+            for i in range(len(validMoves)):
+                if validMoves[i].moveID == hashMoveID:
+                    validMoves.insert(0, validMoves.pop(i))
+                    break
+        maxScore = -CHECKMATE
+        bestMoveID = None
+        movesSearched = 0
         for move in validMoves:
             gs.makeMove(move)
             nextMoves = gs.getValidMoves()
-            score = findMoveMinMax(gs, nextMoves, depth - 1, True)
-            if score < minScore:
-                minScore = score
-                if depth == DEPTH:
-                    nextMove = move
+            quiet = move.pieceCapturedCode == EMPTY and move.moveID >> 14 != PROMOTION_MOVE and not gs.inCheck
+            if futile and quiet and movesSearched > 0:
+                gs.undoMove()
+                if self.stats is not None:
+                    self.stats.futilityPrunes += 1
+                continue
+            if movesSearched == 0:
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier,
+                                                       ply + 1)
+            else:
+                reduction = 0
+                if self.lmrEnabled and quiet and not inCheck and depth >= LMR_MIN_DEPTH and \
+                        movesSearched >= LMR_FULL_DEPTH_MOVES:
+                    reduction = 2 if movesSearched >= LMR_LATE_MOVES and depth > LMR_MIN_DEPTH else 1
+                searchBeta = alpha + NULL_WINDOW if self.pvsEnabled else beta
+                score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1 - reduction, -searchBeta, -alpha,
+                                                       -turnMultiplier, ply + 1)
+                if reduction and score > alpha and not self.aborted:
+                    if self.stats is not None:
+                        self.stats.reSearches += 1
+                    nextMoves = gs.getValidMoves()  # the search left inCheck set for some other position
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -searchBeta, -alpha,
+                                                           -turnMultiplier, ply + 1)
+                if self.pvsEnabled and alpha < score < beta and not self.aborted:
+                    if self.stats is not None:
+                        self.stats.reSearches += 1
+                    nextMoves = gs.getValidMoves()
+                    score = -self.findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier,
+                                                           ply + 1)
             gs.undoMove()
-        return minScore
-
-
-def findMoveNegaMax(gs, validMoves, depth, turnMultiplier):
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-
-    maxScore = -CHECKMATE
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMax(gs, nextMoves, depth - 1, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-        gs.undoMove()
-    return maxScore
-
-
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove, counter
-    counter += 1
-    if depth == 0:
-        return turnMultiplier * scoreBoard(gs)
-
-    # move ordering - implement later
-    maxScore = -CHECKMATE
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMoves = gs.getValidMoves()
-        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
-        if score > maxScore:
-            maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-                print(move, score)
-        gs.undoMove()
-        if maxScore > alpha:  # pruning happens
-            alpha = maxScore
-        if alpha >= beta:
-            break
-    return maxScore
+            movesSearched += 1
+            if self.aborted:  # the score is not valid, unwind without storing anything
+                return 0
+            if score > maxScore:
+                maxScore = score
+                bestMoveID = move.moveID
+                if ply == 0:
+                    self.bestMove = move
+            if maxScore > alpha:  # pruning happens
+                alpha = maxScore
+            if alpha >= beta:
+                if self.moveOrderer is not None:
+                    self.moveOrderer.updateCutoff(move, depth, ply)
+                if self.stats is not None:
+                    self.stats.betaCutoffs += 1
+                    if movesSearched == 1:
+                        self.stats.firstMoveCutoffs += 1
+                break
+
+        if maxScore <= alphaOriginal:
+            flag = UPPERBOUND
+        elif maxScore >= beta:
+            flag = LOWERBOUND
+        else:
+            flag = EXACT
+        self.transpositionTable.store(gs.zobristKey, depth, maxScore, flag, bestMoveID)
+        return maxScore
+
+    '''
+    scoreBoard of a position that is neither mate nor stalemate, from the evaluation cache when it has it
+    '''
+
+    def evaluate(self, gs):
+        cache = self.evaluationCache
+        if cache is None:
+            return scoreBoard(gs)
+        key = gs.zobristKey
+        score = cache.probe(key)
+        if score is None:
+            score = scoreBoard(gs)
+            cache.store(key, score)
+        return score
+
+    '''
+    Search captures and promotions only, until the position is quiet, so a leaf is never scored in the middle
+    of an exchange. The side to move may also "stand pat" and take the static score instead of capturing.
+    When in check every evasion is searched, there is no standing pat.
+    '''
+
+    def quiescenceSearch(self, gs, alpha, beta, turnMultiplier):
+        self.nodes += 1
+        if self.stats is not None:
+            self.stats.qNodes += 1
+        if self.checkSearchLimits():
+            return 0
+        moves = gs.getValidMoves(capturesOnly=True)
+        if gs.inCheck:
+            if len(moves) == 0:
+                return -CHECKMATE
+            maxScore = -CHECKMATE
+            standPat = None
+        else:
+            standPat = turnMultiplier * self.evaluate(gs)
+            if standPat >= beta:
+                return standPat
+            if standPat > alpha:
+                alpha = standPat
+            maxScore = standPat
+        moves.sort(key=scoreMvvLva, reverse=True)
+        for move in moves:
+            if standPat is not None:  # delta pruning
+                gain = pieceTypeScores[move.pieceCapturedCode & TYPE_MASK]
+                if move.moveID >> 14 == PROMOTION_MOVE:
+                    gain += pieceTypeScores[QUEEN - (move.moveID >> 12 & 3)] - pieceTypeScores[PAWN]
+                if standPat + gain + DELTA_MARGIN <= alpha:
+                    continue
+            gs.makeMove(move)
+            score = -self.quiescenceSearch(gs, -beta, -alpha, -turnMultiplier)
+            gs.undoMove()
+            if self.aborted:
+                return 0
+            if score > maxScore:
+                maxScore = score
+                if score > alpha:
+                    alpha = score
+                    if alpha >= beta:
+                        break
+        return maxScore
 
 
 '''
@@ -216,24 +725,8 @@ def scoreBoard(gs):
     elif gs.staleMate:
         return STALEMATE
 
-    score = 0
-    for row in range(8):  # len(gs.board) = 8
-        for col in range(len(gs.board[row])):
-            square = gs.board[row][col]
-            if square != "--":
-                # score it positionally
-                piecePositionScore = 0
-                if square[1] != "K": # no position table for
-                    if square[1] == "p": #for pawns
-                        piecePositionScore = piecePositionScores[square][row][col]
-                    else: # for other pieces
-                        piecePositionScore = piecePositionScores[square[1]][row][col]
-                if square[0] == 'w':
-                    score += pieceScore[square[1]] + piecePositionScore * .1
-                elif square[0] == 'b':
-                    score -= pieceScore[square[1]] + piecePositionScore * .1
-
-    return score
+    # material and piece positions, kept up to date by makeMove/undoMove in tenths of a pawn
+    return gs.boardScore / 10
 
 
 '''
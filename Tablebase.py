@@ -0,0 +1,397 @@
+'''
+Endgame tablebases: the exact result and distance to mate of every position of an ending, so the search plays
+the endings it knows perfectly and cuts off every subtree that reaches one.
+The tables are built here by retrograde analysis, for king and queen, king and rook and king and pawn against a
+lone king (KQK, KRK, KPK): starting from the mates, positions are resolved one ply further back at a time.
+A table holds one byte per position, 0 for a draw or mate in (byte - 1) plies for the side with the piece,
+indexed by side to move and the squares of the pieces after using the symmetries of the board. The files are
+memory mapped, so loading them costs nothing until a position is probed.
+Kings with a single knight or bishop and bare kings are draws without a table.
+    python Tablebase.py generate
+    python Tablebase.py probe --fen "8/8/8/4k3/8/8/8/4K2R w - - 0 1"
+'''
+import argparse
+import mmap
+import os
+import sys
+
+import ChessEngine
+from ChessEngine import EMPTY, PAWN, KNIGHT, BISHOP, QUEEN, KING, WHITE, TYPE_MASK, COLOR_MASK, boardSquares, \
+    squareIndexes
+from SmartMoveFinder import CHECKMATE
+
+TABLEBASE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tablebases")
+TABLE_NAMES = ("KQK", "KRK", "KPK")  # in the order they are built, KPK looks up the promotions in KQK and KRK
+TABLEBASE_PIECES = 3  # most pieces, kings included, of a position the tables can have
+MAGIC = b"CHESSTB1"
+ILLEGAL = 255
+WIN, DRAW, LOSS = 1, 0, -1
+TABLEBASE_WIN = CHECKMATE / 2  # score of a won tablebase position, less a tenth of a pawn per ply to the mate
+
+'''
+Squares are numbered row * 8 + col, row 0 being the 8th rank, as squareIndexes.
+Pawnless tables use all 8 symmetries of the board: the white king is brought into the a1-d1-d4 triangle.
+The KPK table uses the left-right mirror only: the pawn is brought onto the a-d files.
+'''
+triangleSquares = [row * 8 + col for row in range(8) for col in range(4) if 7 - row <= col]
+triangleIndexes = {square: i for i, square in enumerate(triangleSquares)}
+
+
+def transformSquare(square, flipCol, flipRow, transpose):
+    row, col = divmod(square, 8)
+    if flipCol:
+        col = 7 - col
+    if flipRow:
+        row = 7 - row
+    if transpose:  # mirror in the a1-h8 diagonal
+        row, col = 7 - col, 7 - row
+    return row * 8 + col
+
+
+pawnlessTransforms = []  # by white king square: the square of every square after bringing the king into the triangle
+for kingSquare in range(64):
+    kingRow, kingCol = divmod(kingSquare, 8)
+    flipCol = kingCol > 3
+    flipRow = 7 - kingRow > 3
+    movedKing = transformSquare(kingSquare, flipCol, flipRow, False)
+    transpose = 7 - movedKing // 8 > movedKing % 8
+    pawnlessTransforms.append([transformSquare(square, flipCol, flipRow, transpose) for square in range(64)])
+mirrorCols = [square - square % 8 + 7 - square % 8 for square in range(64)]
+tableSizes = {"Q": 2 * 10 * 64 * 64, "R": 2 * 10 * 64 * 64, "P": 2 * 64 * 64 * 24}
+
+'''
+Index in the table of the piece kind ("Q", "R" or "P") of the position: side to move (0 when the side with the
+piece is to move), its king, the lone king and the piece
+'''
+
+
+def tableIndex(kind, sideToMove, strongKing, weakKing, piece):
+    if kind == "P":
+        if piece % 8 > 3:
+            strongKing, weakKing, piece = mirrorCols[strongKing], mirrorCols[weakKing], mirrorCols[piece]
+        return ((sideToMove * 64 + strongKing) * 64 + weakKing) * 24 + (piece // 8 - 1) * 4 + piece % 8
+    transform = pawnlessTransforms[strongKing]
+    return ((sideToMove * 10 + triangleIndexes[transform[strongKing]]) * 64 + transform[weakKing]) * 64 + \
+        transform[piece]
+
+
+def decodeIndex(kind, index):
+    if kind == "P":
+        index, pawnIndex = divmod(index, 24)
+        piece = (pawnIndex // 4 + 1) * 8 + pawnIndex % 4
+        index, weakKing = divmod(index, 64)
+        sideToMove, strongKing = divmod(index, 64)
+        return sideToMove, strongKing, weakKing, piece
+    index, piece = divmod(index, 64)
+    index, weakKing = divmod(index, 64)
+    sideToMove, triangleIndex = divmod(index, 10)
+    return sideToMove, triangleSquares[triangleIndex], weakKing, piece
+
+
+def stepTargets(steps):
+    targets = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        targets.append([(row + rowStep) * 8 + col + colStep for rowStep, colStep in steps
+                        if 0 <= row + rowStep < 8 and 0 <= col + colStep < 8])
+    return targets
+
+
+kingTargets = stepTargets([(rowStep, colStep) for rowStep in (-1, 0, 1) for colStep in (-1, 0, 1)
+                           if rowStep or colStep])
+kingTargetSets = [set(targets) for targets in kingTargets]
+rookDirections = ((-1, 0), (1, 0), (0, -1), (0, 1))
+queenDirections = rookDirections + ((-1, -1), (-1, 1), (1, -1), (1, 1))
+rays = {}  # piece kind: by square, the squares of every direction in order
+for kind, directions in (("Q", queenDirections), ("R", rookDirections)):
+    rays[kind] = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        squareRays = []
+        for rowStep, colStep in directions:
+            ray = []
+            distance = 1
+            while 0 <= row + rowStep * distance < 8 and 0 <= col + colStep * distance < 8:
+                ray.append((row + rowStep * distance) * 8 + col + colStep * distance)
+                distance += 1
+            squareRays.append(ray)
+        rays[kind].append(squareRays)
+# lines[kind][a][b]: the squares between a and b if the piece kind moves from a to b, else None
+lines = {}
+for kind in ("Q", "R"):
+    lines[kind] = [[None] * 64 for square in range(64)]
+    for square in range(64):
+        for ray in rays[kind][square]:
+            for distance, target in enumerate(ray):
+                lines[kind][square][target] = ray[:distance]
+
+'''
+Whether the piece of the kind on square attacks target, blocker being the only other piece that can be in the way
+'''
+
+
+def attacks(kind, square, target, blocker):
+    if kind == "P":
+        return target // 8 == square // 8 - 1 and abs(target % 8 - square % 8) == 1
+    line = lines[kind][square][target]
+    return line is not None and blocker not in line
+
+
+'''
+Build the table of the piece kind. tables are the tables built already, by name, for the promotions of KPK.
+Returns its bytes.
+'''
+
+
+def generateTable(kind, tables):
+    size = tableSizes[kind]
+    values = bytearray(size)
+    predecessors = [[] for index in range(size)]
+    remaining = [0] * size  # for the lone king to move: its moves not known to lose yet
+    mated = []
+    promotionWins = {}  # plies to mate after a promotion: positions, the strong side to move, that can promote
+    for index in range(size):
+        sideToMove, strongKing, weakKing, piece = decodeIndex(kind, index)
+        if strongKing == weakKing or piece == strongKing or piece == weakKing or weakKing in kingTargetSets[strongKing]:
+            values[index] = ILLEGAL
+            continue
+        inCheck = attacks(kind, piece, weakKing, strongKing)
+        if sideToMove == 0:
+            if inCheck:  # the side to move could take the king
+                values[index] = ILLEGAL
+                continue
+            for target in kingTargets[strongKing]:
+                if target != piece and target != weakKing and target not in kingTargetSets[weakKing]:
+                    predecessors[tableIndex(kind, 1, target, weakKing, piece)].append(index)
+            if kind == "P":
+                target = piece - 8
+                if target != strongKing and target != weakKing:
+                    if target < 8:
+                        for promotionKind in ("Q", "R"):
+                            value = tables["K" + promotionKind + "K"][tableIndex(promotionKind, 1, strongKing,
+                                                                                    weakKing, target)]
+                            if value != 0 and value != ILLEGAL:
+                                promotionWins.setdefault(value - 1, []).append(index)
+                    else:
+                        predecessors[tableIndex(kind, 1, strongKing, weakKing, target)].append(index)
+                        if piece // 8 == 6 and target - 8 != strongKing and target - 8 != weakKing:
+                            predecessors[tableIndex(kind, 1, strongKing, weakKing, target - 8)].append(index)
+            else:
+                for ray in rays[kind][piece]:
+                    for target in ray:
+                        if target == strongKing or target == weakKing:
+                            break
+                        predecessors[tableIndex(kind, 1, strongKing, weakKing, target)].append(index)
+        else:
+            moves = 0
+            for target in kingTargets[weakKing]:
+                if target == strongKing or target in kingTargetSets[strongKing]:
+                    continue
+                if target == piece:
+                    moves += 1  # takes the piece, a draw that is never resolved as a loss
+                elif not attacks(kind, piece, target, strongKing):
+                    moves += 1
+                    predecessors[tableIndex(kind, 0, strongKing, target, piece)].append(index)
+            remaining[index] = moves
+            if moves == 0 and inCheck:
+                mated.append(index)
+
+    # retrograde analysis: the lone king to move is lost in n plies once all its moves are lost in at most
+    # n - 1 plies, the strong side to move wins in n plies as soon as one of its moves is lost in n - 1 plies
+    for index in mated:
+        values[index] = 1
+    frontier = mated
+    plies = 0  # plies to mate of the positions of the frontier, the lone king to move
+    while frontier or any(mate >= plies for mate in promotionWins):
+        won = []
+        for index in frontier:
+            for predecessor in predecessors[index]:
+                if values[predecessor] == 0:
+                    values[predecessor] = plies + 2
+                    won.append(predecessor)
+        for predecessor in promotionWins.pop(plies, []):
+            if values[predecessor] == 0:
+                values[predecessor] = plies + 2
+                won.append(predecessor)
+        frontier = []
+        for index in won:
+            for predecessor in predecessors[index]:
+                remaining[predecessor] -= 1
+                if remaining[predecessor] == 0 and values[predecessor] == 0:
+                    values[predecessor] = plies + 3
+                    frontier.append(predecessor)
+        plies += 2
+    return bytes(values)
+
+
+'''
+Build the tables missing in the directory and write them there
+'''
+
+
+def generateTables(directory=TABLEBASE_DIRECTORY, log=None):
+    os.makedirs(directory, exist_ok=True)
+    tables = {}
+    for name in TABLE_NAMES:
+        path = os.path.join(directory, name + ".tb")
+        if os.path.exists(path):
+            with open(path, "rb") as tableFile:
+                tables[name] = tableFile.read()[len(MAGIC):]
+            continue
+        tables[name] = generateTable(name[1], tables)
+        with open(path + ".tmp", "wb") as tableFile:
+            tableFile.write(MAGIC + tables[name])
+        os.replace(path + ".tmp", path)
+        if log is not None:
+            log(name + ": " + str(sum(1 for value in tables[name] if value != 0 and value != ILLEGAL)) + " wins, " +
+                "longest mate " + str(max(value for value in tables[name] if value != ILLEGAL) - 1) + " plies")
+
+
+class Tablebases:
+    def __init__(self, directory=TABLEBASE_DIRECTORY):
+        self.files = []
+        self.tables = {}  # piece type: memory mapped table
+        for name in TABLE_NAMES:
+            path = os.path.join(directory, name + ".tb")
+            if not os.path.exists(path):
+                continue
+            tableFile = open(path, "rb")
+            table = mmap.mmap(tableFile.fileno(), 0, access=mmap.ACCESS_READ)
+            if table[:len(MAGIC)] != MAGIC or len(table) != len(MAGIC) + tableSizes[name[1]]:
+                table.close()
+                tableFile.close()
+                raise ValueError(path + " is not a " + name + " table")
+            self.files.append(tableFile)
+            self.tables[ChessEngine.pieceCodes["w" + name[1].replace("P", "p")] & TYPE_MASK] = table
+
+    '''
+    (WIN, DRAW or LOSS for the side to move, plies to mate) of the position, None if it is not in the tables
+    '''
+
+    def probe(self, gs):
+        squares = gs.squares
+        if squares.count(EMPTY) < 64 - TABLEBASE_PIECES:
+            return None
+        pieceSquare = 0
+        for square in boardSquares:
+            if squares[square] != EMPTY and (squares[square] & TYPE_MASK) != KING:
+                pieceSquare = square
+        if pieceSquare == 0:
+            return DRAW, 0
+        pieceType = squares[pieceSquare] & TYPE_MASK
+        if pieceType == KNIGHT or pieceType == BISHOP:
+            return DRAW, 0
+        table = self.tables.get(pieceType)
+        if table is None:
+            return None
+        strongSide = squares[pieceSquare] & COLOR_MASK
+        strongToMove = gs.whiteToMove == (strongSide == WHITE)
+        if strongSide == WHITE:
+            strongKing, weakKing = squareIndexes[gs.whiteKingSquare], squareIndexes[gs.blackKingSquare]
+            piece = squareIndexes[pieceSquare]
+        else:  # the tables have the piece on the white side, turn the board over
+            strongKing, weakKing = squareIndexes[gs.blackKingSquare] ^ 56, squareIndexes[gs.whiteKingSquare] ^ 56
+            piece = squareIndexes[pieceSquare] ^ 56
+        kind = "P" if pieceType == PAWN else "Q" if pieceType == QUEEN else "R"
+        value = table[len(MAGIC) + tableIndex(kind, 0 if strongToMove else 1, strongKing, weakKing, piece)]
+        if value == 0 or value == ILLEGAL:
+            return DRAW, 0
+        return (WIN if strongToMove else LOSS), value - 1
+
+    '''
+    The score of the position for the side to move, as the search scores it, None if it is not in the tables
+    '''
+
+    def probeScore(self, gs):
+        result = self.probe(gs)
+        if result is None:
+            return None
+        outcome, plies = result
+        if outcome == DRAW:
+            return 0
+        if plies == 0:
+            return -CHECKMATE
+        return outcome * (TABLEBASE_WIN - plies / 10)
+
+    '''
+    The best of the valid moves by the tables: the quickest mate, else a draw, else the longest defence.
+    Returns (move, its score for the side to move), None if the position or a move leads out of the tables.
+    '''
+
+    def bestMove(self, gs, validMoves):
+        if self.probe(gs) is None:
+            return None
+        bestMove = None
+        bestRank = None
+        bestScore = None
+        for move in validMoves:
+            gs.makeMove(move)
+            result = self.probe(gs)
+            score = self.probeScore(gs)
+            gs.undoMove()
+            if result is None:
+                return None
+            outcome, plies = result
+            if outcome == LOSS:  # for the opponent
+                rank = (2, -plies)
+            elif outcome == DRAW:
+                rank = (1, 0)
+            else:
+                rank = (0, plies)
+            if bestRank is None or rank > bestRank:
+                bestMove, bestRank, bestScore = move, rank, -score
+        if bestMove is None:
+            return None
+        return bestMove, bestScore
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        for tableFile in self.files:
+            tableFile.close()
+        self.tables = {}
+        self.files = []
+
+
+'''
+The tables of the directory, None if it has none
+'''
+
+
+def loadTablebases(directory=TABLEBASE_DIRECTORY):
+    tablebases = Tablebases(directory)
+    if not tablebases.tables:
+        return None
+    return tablebases
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Endgame tablebases for KQK, KRK and KPK")
+    commands = parser.add_subparsers(dest="command", required=True)
+    generate = commands.add_parser("generate", help="build the missing tables")
+    generate.add_argument("--directory", default=TABLEBASE_DIRECTORY, help="where the tables are kept")
+    probe = commands.add_parser("probe", help="print the result of a position and its best move")
+    probe.add_argument("--fen", required=True, help="position")
+    probe.add_argument("--directory", default=TABLEBASE_DIRECTORY, help="where the tables are kept")
+    args = parser.parse_args(args)
+
+    if args.command == "generate":
+        generateTables(args.directory, print)
+        return 0
+    gs = ChessEngine.GameState.fromFen(args.fen)
+    tablebases = Tablebases(args.directory)
+    result = tablebases.probe(gs)
+    if result is None:
+        print("not in the tables")
+        return 1
+    outcome, plies = result
+    print({WIN: "win", DRAW: "draw", LOSS: "loss"}[outcome] + (" in " + str(plies) + " plies" if outcome else ""))
+    best = tablebases.bestMove(gs, gs.getValidMoves())
+    if best is not None:
+        print("best move " + best[0].getChessNotation())
+    tablebases.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,337 @@
+'''
+Headless engine-vs-engine matches: two engine settings play each other over many games on all the cores, to
+tell whether a change to the search makes it stronger. Every opening is played twice with colors swapped.
+Games are written as they finish, as PGN and as one JSON line per game, and the running score is printed with
+the Elo difference of the first engine and its 95% error bars. With --sprt the match stops as soon as the
+sequential probability ratio test can tell the Elo difference is at least ELO1 or at most ELO0.
+    python Tournament.py --engine name=d3,depth=3 --engine name=d2,depth=2 --games 200 --pgn games.pgn
+    python Tournament.py --engine depth=3 --engine depth=3,ordering=off --openings openings.txt --sprt 0 50
+An engine is a comma separated list of settings:
+    name=<name>  depth=<plies>  time=<milliseconds per move>  nodes=<nodes per move>
+    backend=mailbox|bitboard  ordering=on|off
+    pvs=on|off  nullmove=on|off  lmr=on|off  futility=on|off  razoring=on|off  (the search features, all on by default)
+An openings file has one position per line, as a FEN, an EPD or moves from the start position ("e2e4 e7e5"),
+lines starting with # are skipped.
+'''
+import argparse
+import datetime
+import json
+import math
+import multiprocessing
+import os
+import sys
+
+import ChessEngine
+import Pgn
+import SmartMoveFinder
+from ChessEngine import START_FEN, PAWN, ROOK, QUEEN, TYPE_MASK, boardSquares
+from EngineWorker import playMoves
+from SmartMoveFinder import TIME_LIMIT, MAX_DEPTH
+
+MAX_PLIES = 400  # a game still going after this many plies is adjudicated a draw
+# engine setting of every search feature switch of SmartMoveFinder.Searcher
+searchFeatures = {"pvs": "pvsEnabled", "nullmove": "nullMoveEnabled", "lmr": "lmrEnabled",
+                  "futility": "futilityEnabled", "razoring": "razoringEnabled"}
+
+'''
+The settings of an engine from its spec, see the module comment
+'''
+
+
+def parseEngine(spec):
+    settings = {"name": spec, "depth": MAX_DEPTH, "time": None, "nodes": None, "backend": "mailbox",
+                "ordering": True}
+    settings.update((feature, True) for feature in searchFeatures)
+    for item in spec.split(","):
+        name, separator, value = item.partition("=")
+        if not separator:
+            raise ValueError("engine setting " + item + " needs a value")
+        if name in ("depth", "time", "nodes"):
+            if not value.isdigit() or int(value) < 1:
+                raise ValueError("engine setting " + name + " needs a positive number")
+            settings[name] = int(value)
+        elif name == "backend" and value in ("mailbox", "bitboard"):
+            settings[name] = value
+        elif (name == "ordering" or name in searchFeatures) and value in ("on", "off"):
+            settings[name] = value == "on"
+        elif name == "name":
+            settings[name] = value
+        else:
+            raise ValueError("unknown engine setting " + item)
+    if settings["time"] is None and settings["nodes"] is None and settings["depth"] == MAX_DEPTH:
+        settings["time"] = TIME_LIMIT
+    return settings
+
+
+'''
+The start positions of an openings file as FENs
+'''
+
+
+def loadOpenings(path):
+    openings = []
+    with open(path) as openingsFile:
+        for line in openingsFile:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if "/" in line:
+                fields = line.split()
+                if len(fields) < 6 or not fields[4].isdigit() or not fields[5].isdigit():
+                    fields = fields[:4]  # EPD, the operations after the position are not needed
+                gs = ChessEngine.GameState.fromFen(" ".join(fields))
+            else:
+                gs = ChessEngine.GameState()
+                playMoves(gs, line.split())
+            openings.append(gs.toFen())
+    if not openings:
+        raise ValueError("no positions in " + path)
+    return openings
+
+
+'''
+Neither side has the pieces left to mate: bare kings, or a single knight or bishop against a bare king
+'''
+
+
+def insufficientMaterial(gs):
+    pieces = [gs.squares[square] & TYPE_MASK for square in boardSquares if gs.squares[square]]
+    if len(pieces) > 3:
+        return False
+    return not any(piece in (PAWN, ROOK, QUEEN) for piece in pieces)
+
+
+'''
+The searcher of an engine for one game, its own tables so neither engine uses what the other one learned
+'''
+
+
+def newSearcher(settings):
+    searcher = SmartMoveFinder.Searcher(ordering=settings["ordering"])
+    for feature, switch in searchFeatures.items():
+        setattr(searcher, switch, settings[feature])
+    return searcher
+
+
+'''
+The move the engine with the given settings plays with its searcher. The search runs on the game state of the
+engine's backend, started for the game on its first move.
+'''
+
+
+def searchMove(gs, gameStates, settings, searcher, validMoves):
+    backend = settings["backend"]
+    if backend not in gameStates:
+        searchState = ChessEngine.newGameState(backend, gs.startFen)
+        for move in gs.moveLog:
+            searchState.makeMove(move)
+        gameStates[backend] = searchState
+    searchState = gameStates[backend]
+    searcher.iterativeDeepening(searchState, searchState.getValidMoves(), settings["time"], settings["nodes"],
+                                settings["depth"])
+    if searcher.bestMove is not None:
+        for move in validMoves:
+            if move.moveID == searcher.bestMove.moveID:
+                return move
+    return SmartMoveFinder.findRandomMove(validMoves)
+
+
+'''
+Run in a worker: play one game from startFen. Returns a dict of the game for the results file, its PGN included.
+'''
+
+
+def playGame(gameNumber, startFen, white, black):
+    gs = ChessEngine.GameState.fromFen(startFen)
+    gameStates = {"mailbox": gs}  # game state of every backend searching, each move is made on all of them
+    searchers = {True: newSearcher(white), False: newSearcher(black)}  # by whiteToMove
+    repetitions = {gs.zobristKey: 1}
+    result = None
+    while result is None:
+        validMoves = gs.getValidMoves()
+        if gs.checkMate:
+            result, termination = ("0-1" if gs.whiteToMove else "1-0"), "checkmate"
+        elif gs.staleMate:
+            result, termination = "1/2-1/2", "stalemate"
+        elif gs.halfmoveClock >= 100:
+            result, termination = "1/2-1/2", "fifty move rule"
+        elif repetitions[gs.zobristKey] >= 3:
+            result, termination = "1/2-1/2", "threefold repetition"
+        elif insufficientMaterial(gs):
+            result, termination = "1/2-1/2", "insufficient material"
+        elif len(gs.moveLog) >= MAX_PLIES:
+            result, termination = "1/2-1/2", "adjudication"
+        else:
+            move = searchMove(gs, gameStates, white if gs.whiteToMove else black, searchers[gs.whiteToMove],
+                              validMoves)
+            for gameState in gameStates.values():
+                gameState.makeMove(move)
+            repetitions[gs.zobristKey] = repetitions.get(gs.zobristKey, 0) + 1
+    headers = {"Event": "Tournament", "Site": "Chess_AI", "Date": datetime.date.today().strftime("%Y.%m.%d"),
+               "Round": gameNumber, "White": white["name"], "Black": black["name"], "Termination": termination}
+    return {"game": gameNumber, "white": white["name"], "black": black["name"], "fen": startFen,
+            "moves": [move.getChessNotation() for move in gs.moveLog], "result": result, "termination": termination,
+            "pgn": Pgn.gameToPgn(headers, gs.moveLog, result, startFen)}
+
+
+def playGameTask(task):
+    return playGame(*task)
+
+
+def scoreToElo(score):
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+def eloToScore(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+'''
+Elo difference of a score of wins, draws and losses, with the lower and upper bound of its 95% confidence
+interval. Returns (elo, lower, upper).
+'''
+
+
+def eloInterval(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + draws / 2) / games
+    deviation = math.sqrt((wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games)
+    margin = 1.96 * deviation / math.sqrt(games)
+    return scoreToElo(score), scoreToElo(score - margin), scoreToElo(score + margin)
+
+
+'''
+Log likelihood ratio of the hypothesis "the Elo difference is elo1" over "it is elo0" for the score so far,
+by the normal approximation of the score of a game. 0 while there is nothing to go on.
+'''
+
+
+def sprtLogLikelihoodRatio(wins, draws, losses, elo0, elo1):
+    games = wins + draws + losses
+    if games == 0:
+        return 0.0
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance == 0:
+        return 0.0
+    score0 = eloToScore(elo0)
+    score1 = eloToScore(elo1)
+    return (score1 - score0) * (2 * score - score0 - score1) * games / (2 * variance)
+
+
+'''
+The LLR bounds of the test: below the lower one H0 (elo0) is accepted, above the upper one H1 (elo1), with
+error rates alpha (accepting H1 when H0 holds) and beta (the other way round)
+'''
+
+
+def sprtBounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+'''
+Play the match and stream the games to pgnFile and resultsFile (open files or None) as they finish.
+Returns (wins, draws, losses) of the first engine and the SPRT outcome ("H0", "H1" or None).
+'''
+
+
+def runTournament(engine, opponent, openings, games, processes, pgnFile=None, resultsFile=None, sprt=None):
+    tasks = []
+    for gameNumber in range(games):
+        startFen = openings[gameNumber // 2 % len(openings)]
+        if gameNumber % 2 == 0:
+            tasks.append((gameNumber + 1, startFen, engine, opponent))
+        else:
+            tasks.append((gameNumber + 1, startFen, opponent, engine))
+    if sprt is not None:
+        elo0, elo1, alpha, beta = sprt
+        lowerBound, upperBound = sprtBounds(alpha, beta)
+    wins = draws = losses = 0
+    outcome = None
+    pool = multiprocessing.Pool(processes)
+    try:
+        for game in pool.imap_unordered(playGameTask, tasks):
+            if pgnFile is not None:
+                pgnFile.write(game.pop("pgn"))
+                pgnFile.flush()
+            else:
+                game.pop("pgn")
+            if resultsFile is not None:
+                resultsFile.write(json.dumps(game) + "\n")
+                resultsFile.flush()
+            if game["result"] == "1/2-1/2":
+                draws += 1
+            elif (game["result"] == "1-0") == (game["white"] == engine["name"]):
+                wins += 1
+            else:
+                losses += 1
+            elo, lower, upper = eloInterval(wins, draws, losses)
+            line = "game " + str(game["game"]) + " " + game["white"] + " - " + game["black"] + " " + \
+                game["result"] + " (" + game["termination"] + ")  " + engine["name"] + " +" + str(wins) + " =" + \
+                str(draws) + " -" + str(losses) + "  elo " + format(elo, ".1f") + " +/- " + \
+                format((upper - lower) / 2, ".1f")
+            if sprt is not None:
+                llr = sprtLogLikelihoodRatio(wins, draws, losses, elo0, elo1)
+                line += "  llr " + format(llr, ".2f") + " (" + format(lowerBound, ".2f") + ", " + \
+                    format(upperBound, ".2f") + ")"
+                if llr <= lowerBound:
+                    outcome = "H0"
+                elif llr >= upperBound:
+                    outcome = "H1"
+            print(line)
+            sys.stdout.flush()
+            if outcome is not None:
+                break
+    finally:
+        pool.terminate()
+        pool.join()
+    return wins, draws, losses, outcome
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description="Engine-vs-engine match over many games in parallel")
+    parser.add_argument("--engine", action="append", required=True,
+                        help="settings of an engine, given twice: the engine tested first, then its opponent")
+    parser.add_argument("--games", type=int, default=100, help="number of games (default: 100)")
+    parser.add_argument("--openings", help="file of start positions (default: the start position only)")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1,
+                        help="games played at once (default: number of cores)")
+    parser.add_argument("--pgn", help="append the games to this PGN file")
+    parser.add_argument("--results", help="append one JSON line per game to this file")
+    parser.add_argument("--sprt", type=float, nargs=2, metavar=("ELO0", "ELO1"),
+                        help="stop early once the Elo difference is shown to be at most ELO0 or at least ELO1")
+    parser.add_argument("--alpha", type=float, default=0.05, help="SPRT false positive rate (default: 0.05)")
+    parser.add_argument("--beta", type=float, default=0.05, help="SPRT false negative rate (default: 0.05)")
+    args = parser.parse_args(args)
+    if len(args.engine) != 2:
+        parser.error("give --engine twice")
+    try:
+        engine, opponent = parseEngine(args.engine[0]), parseEngine(args.engine[1])
+        openings = loadOpenings(args.openings) if args.openings else [START_FEN]
+    except (ValueError, OSError) as error:
+        parser.error(str(error))
+    if engine["name"] == opponent["name"]:
+        opponent["name"] += " (2)"
+    sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+
+    pgnFile = open(args.pgn, "a") if args.pgn else None
+    resultsFile = open(args.results, "a") if args.results else None
+    try:
+        wins, draws, losses, outcome = runTournament(engine, opponent, openings, max(1, args.games),
+                                                     max(1, args.processes), pgnFile, resultsFile, sprt)
+    finally:
+        for outputFile in (pgnFile, resultsFile):
+            if outputFile is not None:
+                outputFile.close()
+    elo, lower, upper = eloInterval(wins, draws, losses)
+    print(engine["name"] + " vs " + opponent["name"] + ": +" + str(wins) + " =" + str(draws) + " -" + str(losses) +
+          ", elo " + format(elo, ".1f") + " [" + format(lower, ".1f") + ", " + format(upper, ".1f") + "]")
+    if outcome is not None:
+        print("SPRT: " + ("H1 accepted, elo >= " if outcome == "H1" else "H0 accepted, elo <= ") +
+              format(args.sprt[1] if outcome == "H1" else args.sprt[0], "g"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,305 @@
+'''
+Headless UCI (Universal Chess Interface) front end, so the engine can play in a chess GUI or against other
+engines without pygame. Commands are read from stdin and answers written to stdout:
+    uci, isready, ucinewgame, setoption name <name> value <value>
+    position startpos [moves e2e4 e7e5 ...]
+    position fen <fen> [moves ...]
+    go [wtime <ms>] [btime <ms>] [winc <ms>] [binc <ms>] [movestogo <n>] [movetime <ms>] [depth <n>]
+       [nodes <n>] [infinite] [ponder]
+    stop, ponderhit, quit
+With "setoption name BookFile value <path>" moves of a Polyglot book (see OpeningBook) are played without a
+search. The search runs in an EngineWorker, so stop and the other commands are answered while it thinks. Every completed
+iteration is reported as "info depth .. score cp .. nodes .. nps .. time .. pv ..", scores in centipawns from the
+side to move's point of view.
+    python UCI.py
+'''
+import os
+import queue
+import sys
+import threading
+import time
+
+import ChessEngine
+from EngineWorker import EngineWorker, SearchInfo, playMoves
+from OpeningBook import OpeningBook
+from SmartMoveFinder import CHECKMATE, TIME_LIMIT, MAX_DEPTH
+
+ENGINE_NAME = "Chess_AI"
+ENGINE_AUTHOR = "yrtyeh123"
+MOVES_TO_GO = 30  # moves the remaining time is shared out over when the GUI doesn't say
+MOVE_OVERHEAD = 50  # milliseconds kept back per move for the time the GUI and the pipes take
+
+'''
+Milliseconds to think about a move with timeLeft milliseconds on the clock, increment milliseconds added per move
+and movesToGo moves until the next time control (None: sudden death)
+'''
+
+
+def allocateTime(timeLeft, increment=0, movesToGo=None):
+    movesToGo = movesToGo if movesToGo else MOVES_TO_GO
+    timeLimit = timeLeft / movesToGo + increment * 3 / 4
+    timeLimit = min(timeLimit, timeLeft / 2)  # never bet the game on one move
+    return max(10, int(timeLimit - MOVE_OVERHEAD))
+
+
+'''
+A score in pawns as the UCI "score cp <centipawns>" or, for a mate found at the given depth, "score mate <moves>"
+'''
+
+
+def formatScore(score, depth):
+    if abs(score) >= CHECKMATE:
+        moves = (depth + 1) // 2  # the mate was found by the first iteration deep enough to see it
+        return "mate " + str(moves if score > 0 else -moves)
+    return "cp " + str(int(round(score * 100)))
+
+
+'''
+Put the lines of stdin on the lines queue, then None at the end of the input.
+Reads a file of its own on the stdin descriptor: a process started while the thread waits in sys.stdin would
+hang closing sys.stdin, which multiprocessing does first thing in a new process.
+'''
+
+
+def readLines(lines):
+    with os.fdopen(os.dup(sys.stdin.fileno())) as inputFile:
+        for line in inputFile:
+            lines.put(line)
+    lines.put(None)
+
+
+def send(line):
+    sys.stdout.write(line + "\n")
+    sys.stdout.flush()
+
+
+class UCIEngine:
+    def __init__(self):
+        self.backend = "mailbox"
+        self.processes = 1
+        self.ponderEnabled = True
+        self.engine = None  # started on the first command that needs it, again after an option changed
+        self.book = None
+        self.gs = ChessEngine.newGameState(self.backend)
+        self.searchStart = 0.0  # time.perf_counter() at the go command
+        self.infinite = False  # the best move must wait for stop (go infinite)
+        self.ponderTimeLimit = None  # time limit of the search once the ponder move is played (go ponder)
+        self.heldResult = None  # result of an infinite search that finished before stop
+        self.lastInfoDepth = 0
+
+    def getEngine(self):
+        if self.engine is None:
+            self.engine = EngineWorker(self.backend, self.processes)
+        return self.engine
+
+    '''
+    Handle one command line, returns False on quit
+    '''
+
+    def handleCommand(self, line):
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+        if command == "uci":
+            send("id name " + ENGINE_NAME)
+            send("id author " + ENGINE_AUTHOR)
+            send("option name Ponder type check default true")
+            send("option name Threads type spin default 1 min 1 max " + str(os.cpu_count() or 1))
+            send("option name MoveGenerator type combo default mailbox var mailbox var bitboard")
+            send("option name BookFile type string default <empty>")
+            send("uciok")
+        elif command == "isready":
+            self.getEngine()
+            send("readyok")
+        elif command == "setoption":
+            self.setOption(tokens[1:])
+        elif command == "ucinewgame":
+            self.getEngine().newGame()
+            self.gs = ChessEngine.newGameState(self.backend)
+        elif command == "position":
+            self.setPosition(tokens[1:])
+        elif command == "go":
+            self.go(tokens[1:])
+        elif command == "stop":
+            self.stop()
+        elif command == "ponderhit":
+            if self.engine is not None and self.engine.pondering:
+                self.engine.ponderHit(self.ponderTimeLimit)
+        elif command == "quit":
+            return False
+        elif command not in ("debug", "register"):
+            send("info string unknown command " + command)
+        return True
+
+    def setOption(self, tokens):
+        if "name" not in tokens:
+            return
+        valueIndex = tokens.index("value") if "value" in tokens else len(tokens)
+        name = " ".join(tokens[tokens.index("name") + 1:valueIndex]).lower()
+        value = " ".join(tokens[valueIndex + 1:])
+        if name == "ponder":
+            self.ponderEnabled = value.lower() == "true"
+        elif name == "threads" and value.isdigit():
+            self.processes = max(1, int(value))
+            self.closeEngine()
+        elif name == "movegenerator" and value in ("mailbox", "bitboard"):
+            self.backend = value
+            self.closeEngine()
+            self.gs = ChessEngine.newGameState(self.backend)
+        elif name == "bookfile":
+            if self.book is not None:
+                self.book.close()
+                self.book = None
+            if value and value != "<empty>":
+                try:
+                    self.book = OpeningBook(value)
+                except OSError as error:
+                    send("info string can't open book " + value + ": " + str(error))
+        else:
+            send("info string unknown option " + name)
+
+    def closeEngine(self):
+        if self.engine is not None:
+            self.engine.close()
+            self.engine = None
+
+    def setPosition(self, tokens):
+        movesIndex = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if tokens and tokens[0] == "startpos":
+            fen = ChessEngine.START_FEN
+        elif tokens and tokens[0] == "fen":
+            fen = " ".join(tokens[1:movesIndex])
+        else:
+            send("info string position needs startpos or fen")
+            return
+        gs = ChessEngine.newGameState(self.backend)
+        try:
+            gs.loadFen(fen)
+            playMoves(gs, tokens[movesIndex + 1:])
+        except ValueError as error:
+            send("info string " + str(error))
+            return
+        self.gs = gs
+
+    def go(self, tokens):
+        options = {}
+        flags = set()
+        i = 0
+        while i < len(tokens):
+            if tokens[i] in ("infinite", "ponder"):
+                flags.add(tokens[i])
+            elif i + 1 < len(tokens) and tokens[i + 1].lstrip("-").isdigit():
+                options[tokens[i]] = int(tokens[i + 1])
+                i += 1
+            i += 1
+        timeLeft = options.get("wtime" if self.gs.whiteToMove else "btime")
+        if "movetime" in options:
+            timeLimit = max(1, options["movetime"] - MOVE_OVERHEAD)
+        elif timeLeft is not None:
+            timeLimit = allocateTime(max(0, timeLeft), options.get("winc" if self.gs.whiteToMove else "binc", 0),
+                                     options.get("movestogo"))
+        elif "depth" in options or "nodes" in options or "infinite" in flags:
+            timeLimit = None
+        else:
+            timeLimit = TIME_LIMIT
+        maxDepth = max(1, min(options.get("depth", MAX_DEPTH), MAX_DEPTH))
+        nodeLimit = options.get("nodes")
+
+        engine = self.getEngine()
+        if self.book is not None and not flags:
+            bookMove = self.book.chooseMove(self.gs)
+            if bookMove is not None:  # no search for a book move
+                if engine.thinking:
+                    engine.cancel()
+                send("bestmove " + bookMove.getChessNotation())
+                return
+        self.searchStart = time.perf_counter()
+        self.lastInfoDepth = 0
+        self.heldResult = None
+        self.infinite = "infinite" in flags
+        if "ponder" in flags:
+            self.ponderTimeLimit = timeLimit
+            engine.ponder(self.gs)
+        elif self.infinite:
+            engine.search(self.gs, None, nodeLimit, maxDepth)
+        else:
+            engine.search(self.gs, timeLimit, nodeLimit, maxDepth)
+
+    def stop(self):
+        if self.engine is None:
+            return
+        if self.heldResult is not None:
+            self.sendBestMove(self.heldResult)
+            return
+        if not self.engine.thinking:
+            return
+        if self.engine.pondering:
+            self.engine.ponderHit(None)
+        self.engine.stop()
+        self.sendBestMove(self.engine.getResult(wait=True, infoCallback=self.sendInfo))
+
+    '''
+    Send what came in from the search: the infos of its iterations, then the best move once it is done
+    '''
+
+    def pollEngine(self):
+        if self.engine is None or not self.engine.thinking:
+            return
+        result = self.engine.getResult(infoCallback=self.sendInfo)
+        if result is None:
+            return
+        if self.infinite:  # the GUI expects the best move only after stop
+            self.heldResult = result
+        else:
+            self.sendBestMove(result)
+
+    def sendInfo(self, info):
+        nps = int(info.nodes / info.seconds) if info.seconds > 0 else 0
+        send("info depth " + str(info.depth) + " score " + formatScore(info.score, info.depth) + " nodes " +
+             str(info.nodes) + " nps " + str(nps) + " time " + str(int(info.seconds * 1000)) + " pv " +
+             " ".join(info.pv))
+        self.lastInfoDepth = info.depth
+
+    def sendBestMove(self, result):
+        self.heldResult = None
+        self.infinite = False
+        if result.move is None:
+            send("bestmove 0000")  # no legal move, the game is over
+            return
+        if result.depth != self.lastInfoDepth and result.score is not None:
+            # the parallel search reports its result only at the end
+            seconds = time.perf_counter() - self.searchStart
+            self.sendInfo(SearchInfo(result.searchId, result.depth, result.score, result.nodes, seconds, result.pv))
+        if self.ponderEnabled and result.ponderMove is not None:
+            send("bestmove " + result.move + " ponder " + result.ponderMove)
+        else:
+            send("bestmove " + result.move)
+
+    '''
+    Read commands until quit or the end of the input, answering the search as it goes on
+    '''
+
+    def run(self):
+        lines = queue.Queue()
+        threading.Thread(target=readLines, args=(lines,), daemon=True).start()
+        while True:
+            searching = self.engine is not None and self.engine.thinking and self.heldResult is None
+            try:
+                line = lines.get(timeout=0.01 if searching else None)
+            except queue.Empty:
+                line = ""
+            if line is None or not self.handleCommand(line):
+                break
+            self.pollEngine()
+        self.closeEngine()
+        if self.book is not None:
+            self.book.close()
+
+
+def main():
+    UCIEngine().run()
+
+
+if __name__ == "__main__":
+    main()
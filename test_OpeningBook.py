@@ -0,0 +1,15 @@
+import ChessEngine
+import OpeningBook
+
+'''
+The keys of the Polyglot book format description, so books of other programs can be read
+'''
+
+
+def testPolyglotKeys():
+    assert OpeningBook.polyglotKey(ChessEngine.GameState()) == 0x463b96181691fc9c
+    for fen, key in (("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1", 0x823c9b50fd114196),
+                     ("rnbqkbnr/ppp1pppp/8/3p4/4P3/8/PPPP1PPP/RNBQKBNR w KQkq d6 0 2", 0x0756b94461c50fb0),
+                     ("rnbqkbnr/ppp1p1pp/8/3pPp2/8/8/PPPP1PPP/RNBQKBNR w KQkq f6 0 3", 0x22a48b5a8e47ff78),
+                     ("rnbq1bnr/ppp1pkpp/8/3pPp2/8/8/PPPPKPPP/RNBQ1BNR w - - 0 4", 0x00fdd303c946bdd9)):
+        assert OpeningBook.polyglotKey(ChessEngine.GameState.fromFen(fen)) == key
@@ -0,0 +1,59 @@
+import os
+
+import pytest
+
+import ChessEngine
+import Tablebase
+from Tablebase import WIN, DRAW, LOSS, MAGIC, ILLEGAL
+
+
+@pytest.fixture(scope="module")
+def tableDirectory(tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp("tablebases"))
+    Tablebase.generateTables(directory)
+    return directory
+
+
+@pytest.fixture(scope="module")
+def tablebases(tableDirectory):
+    tablebases = Tablebase.Tablebases(tableDirectory)
+    yield tablebases
+    tablebases.close()
+
+
+'''
+The longest mates of the endings, as known from the literature
+'''
+
+
+def testLongestMates(tableDirectory):
+    for name, plies in (("KQK", 20), ("KRK", 32), ("KPK", 56)):
+        with open(os.path.join(tableDirectory, name + ".tb"), "rb") as tableFile:
+            table = tableFile.read()[len(MAGIC):]
+        assert max(value for value in table if value != ILLEGAL) - 1 == plies
+
+
+def testKpk(tablebases):
+    # the king in front of its pawn with the opposition against it
+    assert tablebases.probe(ChessEngine.GameState.fromFen("8/8/8/8/8/4k3/4P3/4K3 w - - 0 1")) == (DRAW, 0)
+    # the black king is outside the square of the pawn
+    assert tablebases.probe(ChessEngine.GameState.fromFen("8/8/8/8/8/8/k3P3/4K3 w - - 0 1"))[0] == WIN
+    assert tablebases.probe(ChessEngine.GameState.fromFen("4k3/8/4K3/4P3/8/8/8/8 b - - 0 1"))[0] == LOSS
+
+
+'''
+The move picked by the tables keeps the result: a win goes one ply closer to the mate, a draw stays a draw
+'''
+
+
+def testBestMoveKeepsResult(tablebases):
+    for fen in ("8/8/8/4k3/8/8/8/4K2R w - - 0 1", "8/8/8/8/8/8/k3P3/4K3 w - - 0 1",
+                "8/8/8/8/8/4k3/4P3/4K3 w - - 0 1", "4k3/8/4K3/4P3/8/8/8/8 b - - 0 1"):
+        gs = ChessEngine.GameState.fromFen(fen)
+        outcome, plies = tablebases.probe(gs)
+        move, score = tablebases.bestMove(gs, gs.getValidMoves())
+        gs.makeMove(move)
+        if outcome == DRAW:
+            assert tablebases.probe(gs) == (DRAW, 0)
+        else:
+            assert tablebases.probe(gs) == (-outcome, plies - 1)